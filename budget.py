@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+请求预算与爬取规划模块
+根据第一页元数据（comment_count / child_comment_count）估算请求数和耗时，
+并在爬取过程中强制执行硬性请求预算
+"""
+import math
+import threading
+from typing import Optional
+
+from config import CONFIG
+
+# 评论接口每页大致返回的父评论数量（无第一页数据时使用）
+COMMENT_PAGE_SIZE = 15
+
+# 子评论接口每页大致返回的数量
+CHILD_PAGE_SIZE = 15
+
+# 搜索接口每页大致返回的帖子数量
+SEARCH_PAGE_SIZE = 24
+
+# 未测到网络延迟时使用的默认单次请求耗时（秒）
+DEFAULT_LATENCY = 1.0
+
+
+class RequestBudget:
+    """硬性请求预算 - 超出后拒绝发送请求，让爬取流程提前收尾"""
+    
+    def __init__(self, limit: Optional[int] = None):
+        """
+        Args:
+            limit: 最多允许发送的 HTTP 请求数，None 表示不限制
+        """
+        self.limit = limit
+        self.used = 0
+        self.total_latency = 0.0
+        self.timed_requests = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def remaining(self) -> Optional[int]:
+        """剩余可用请求数，不限制时返回 None"""
+        if self.limit is None:
+            return None
+        return max(self.limit - self.used, 0)
+    
+    @property
+    def exhausted(self) -> bool:
+        """预算是否已用尽"""
+        return self.limit is not None and self.used >= self.limit
+    
+    def consume(self) -> bool:
+        """
+        占用一次请求额度
+        
+        Returns:
+            True 表示可以发送请求，False 表示预算已用尽
+        """
+        with self._lock:
+            if self.exhausted:
+                return False
+            self.used += 1
+            return True
+    
+    def record_latency(self, seconds: float):
+        """记录一次请求的网络耗时（不含限流等待）"""
+        with self._lock:
+            self.total_latency += seconds
+            self.timed_requests += 1
+    
+    @property
+    def avg_latency(self) -> float:
+        """平均网络耗时（秒）"""
+        if not self.timed_requests:
+            return DEFAULT_LATENCY
+        return self.total_latency / self.timed_requests
+    
+    def summary(self) -> str:
+        """预算使用情况摘要"""
+        if self.limit is None:
+            return f"已发送 {self.used} 次请求（不限制）"
+        return f"已发送 {self.used}/{self.limit} 次请求"
+
+
+def child_thread_stats(comments: list) -> tuple[float, float]:
+    """
+    从一页（或多页合并的）父评论中统计子评论分布
+    
+    Args:
+        comments: 父评论列表（含 child_comment_count），不能为空
+    
+    Returns:
+        (带子评论的父评论比例, 平均每条父评论的子评论数)
+    """
+    child_counts = [c.get("child_comment_count", 0) or 0 for c in comments]
+    thread_ratio = sum(1 for n in child_counts if n > 0) / len(comments)
+    return thread_ratio, sum(child_counts) / len(comments)
+
+
+def estimate_comment_requests(comment_count: int, max_comments: int,
+                              first_page: Optional[list] = None,
+                              paginate_children: bool = True,
+                              child_stats: Optional[tuple[float, float]] = None) -> int:
+    """
+    估算获取一个帖子评论所需的请求数
+    
+    Args:
+        comment_count: 帖子的总评论数（含子评论）
+        max_comments: 最多获取的评论数量
+        first_page: 第一页评论（含 child_comment_count），有则用于推算子评论比例
+        paginate_children: 子评论是否分页获取（_get_child_comments_list 会分页，树形接口只取一页）
+        child_stats: 没有该帖子第一页时使用的 child_thread_stats 结果（如其他帖子第一页的统计），
+            None 时使用 CONFIG 中的 plan_child_thread_ratio / plan_children_per_thread
+    
+    Returns:
+        预计请求数（包含第一页）
+    """
+    target = min(comment_count or 0, max_comments)
+    if target <= 0:
+        return 1
+    
+    if first_page:
+        page_size = len(first_page) or COMMENT_PAGE_SIZE
+        thread_ratio, avg_children = child_thread_stats(first_page)
+    elif child_stats:
+        page_size = COMMENT_PAGE_SIZE
+        thread_ratio, avg_children = child_stats
+    else:
+        page_size = COMMENT_PAGE_SIZE
+        thread_ratio = CONFIG.get("plan_child_thread_ratio", 0.2)
+        avg_children = thread_ratio * CONFIG.get("plan_children_per_thread", 3)
+    
+    # 每条父评论连同其子评论一起计入 max_comments
+    parents = math.ceil(target / (1 + avg_children))
+    parent_pages = math.ceil(parents / page_size)
+    
+    threads = math.ceil(parents * thread_ratio)
+    if paginate_children and thread_ratio > 0:
+        children_per_thread = avg_children / thread_ratio
+        child_pages = threads * max(math.ceil(children_per_thread / CHILD_PAGE_SIZE), 1)
+    else:
+        child_pages = threads
+    
+    return parent_pages + child_pages
+
+
+def estimate_seconds(requests_count: int, avg_latency: float = DEFAULT_LATENCY) -> float:
+    """
+    估算发送指定数量请求所需的时间（限流等待 + 网络耗时）
+    
+    Args:
+        requests_count: 请求数
+        avg_latency: 单次请求的平均网络耗时（秒）
+    
+    Returns:
+        预计耗时（秒）
+    """
+    # _api_request 每次等待 request_delay + uniform(0, 1)
+    per_request = CONFIG.get("request_delay", 2) + 0.5 + avg_latency
+    return requests_count * per_request
+
+
+def format_plan(plan: dict) -> str:
+    """把规划结果格式化为可读文本"""
+    seconds = plan.get("seconds", 0)
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    lines = [
+        f"📋 爬取规划: {plan.get('task', '')}",
+        f"   预计请求数: {plan.get('requests', 0)}",
+        f"   预计耗时: {hours}小时{minutes}分{secs}秒",
+    ]
+    if plan.get("posts"):
+        lines.append(f"   帖子数: {len(plan['posts'])}")
+    if plan.get("sampled_posts"):
+        lines.append(f"   子评论按 {plan['sampled_posts']} 个帖子的第一页评论估算")
+    limit = plan.get("budget")
+    if limit is not None:
+        status = "✓ 预算充足" if plan.get("requests", 0) <= limit else "⚠ 超出预算，爬取将提前结束"
+        lines.append(f"   请求预算: {limit} ({status})")
+    return "\n".join(lines)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+批量评论爬取模块
+从文件读取大量 media_id 或帖子链接，用有上限的线程池在共享限速下并发爬取评论，
+结果汇总为一张带 media_id 的长表，或按帖子数分片保存，而不是每个帖子一个文件
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from concurrency import shared_rate_gate
+from config import CONFIG
+from shortcode import POST_REF_HINT, resolve_media_ids
+
+
+def read_media_ids(path: str) -> list[str]:
+    """
+    从文件读取 media_id 列表（每行一个 media_id、帖子链接或 shortcode，# 开头为注释，
+    链接在本地批量转换为 media_id，自动去重并保持顺序）
+    
+    Args:
+        path: 文件路径
+    
+    Returns:
+        media_id 列表
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    
+    media_ids = {}
+    for line, media_id in zip(lines, resolve_media_ids(lines)):
+        if not media_id:
+            print(f"⚠ 无法识别的帖子，已跳过: {line}（{POST_REF_HINT}）")
+            continue
+        media_ids[media_id] = None
+    return list(media_ids)
+
+
+def crawl_media_comments(spider, media_id: str, max_comments: int,
+                         since: Optional[float] = None, until: Optional[float] = None) -> list[dict]:
+    """
+    获取单个帖子的评论（树形顺序，不写存储，供线程池调用）
+    
+    Args:
+        spider: IGSpider 实例
+        media_id: 帖子的 media_id (pk)
+        max_comments: 最多获取的评论数量
+        since: 时间窗口起点（时间戳）
+        until: 时间窗口终点（时间戳）
+    
+    Returns:
+        评论列表
+    """
+    comments = []
+    for comment, _ in spider.iter_comments(media_id, paginate_children=False, since=since, until=until):
+        comments.append(comment)
+        if len(comments) >= max_comments:
+            break
+    return comments
+
+
+def bulk_crawl_comments(spider, media_ids: list[str], max_comments: Optional[int] = None,
+                        workers: Optional[int] = None, name: str = "bulk",
+                        shard_size: Optional[int] = None, since: Optional[float] = None,
+                        until: Optional[float] = None) -> dict:
+    """
+    批量获取多个帖子的评论
+    
+    Args:
+        spider: 已登录的 IGSpider 实例
+        media_ids: media_id 列表
+        max_comments: 每个帖子最多获取的评论数量
+        workers: 并发线程数，所有线程共享同一个限速器
+        name: 输出文件名前缀
+        shard_size: 每个输出文件包含的帖子数，None 表示全部写入一个文件
+        since: 只获取该时间戳之后的评论
+        until: 只获取该时间戳之前的评论
+    
+    Returns:
+        {"posts": 成功帖子数, "comments": 评论总数, "failed": [失败的 media_id], "files": [保存结果]}
+    """
+    if max_comments is None:
+        max_comments = CONFIG.get("max_comments_per_post", 100)
+    workers = workers or CONFIG.get("bulk_workers", 4)
+    shard_size = shard_size or CONFIG.get("bulk_shard_size")
+    
+    print(f"\n💬 批量获取 {len(media_ids)} 个帖子的评论（{workers} 个线程）...")
+    
+    if spider.storage:
+        spider.storage.start_run("bulk_comments", max_comments=max_comments, posts=len(media_ids))
+    
+    summary = {"posts": 0, "comments": 0, "failed": [], "files": []}
+    rows = []
+    shard = 1
+    
+    def flush_rows():
+        nonlocal rows, shard
+        if not rows:
+            return
+        filename = f"{name}_comment_users" if not shard_size else f"{name}_comment_users_part{shard:03d}"
+        summary["files"].append(spider.save_results(rows, filename, data_type="comment"))
+        rows = []
+        shard += 1
+    
+    # 未启用自适应限速时用固定速率闸门，让所有线程共享 request_delay（只在本次批量爬取期间生效）
+    with shared_rate_gate(spider, workers):
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk") as executor:
+            futures = [
+                executor.submit(crawl_media_comments, spider, media_id, max_comments, since, until)
+                for media_id in media_ids
+            ]
+            
+            # 按输入顺序汇总，存储和导出都在主线程完成
+            for index, (media_id, future) in enumerate(zip(media_ids, futures), 1):
+                try:
+                    comments = future.result()
+                except Exception as e:
+                    print(f"✗ 帖子 {media_id} 获取失败: {e}")
+                    comments = []
+                
+                if not comments:
+                    summary["failed"].append(media_id)
+                    continue
+                
+                summary["posts"] += 1
+                summary["comments"] += len(comments)
+                rows.extend(comments)
+                print(f"  [{index}/{len(media_ids)}] 帖子 {media_id}: {len(comments)} 条评论")
+                
+                if spider.storage:
+                    spider.storage.add_comments(comments)
+                
+                if shard_size and summary["posts"] % shard_size == 0:
+                    flush_rows()
+    
+    flush_rows()
+    
+    if spider.storage:
+        spider.storage.finish_run()
+    
+    print(f"\n✓ 批量完成: {summary['posts']} 个帖子，{summary['comments']} 条评论，"
+          f"{len(summary['failed'])} 个帖子没有获取到评论")
+    return summary
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+自适应并发与限速控制（AIMD）
+延迟和成功率正常时逐步提高并发数和请求速率（加性增），
+遇到 429、延迟突增或返回 HTML 而不是 JSON 时大幅降低（乘性减）；
+RateGate 为固定速率版本，供多线程批量爬取共享 request_delay 限速
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from config import CONFIG
+
+# 请求结果类型
+OK = "ok"
+THROTTLED = "throttled"
+HTML = "html"
+ERROR = "error"
+
+# 延迟滑动平均的平滑系数
+EWMA_ALPHA = 0.2
+
+# 延迟至少比平均值多出这么多秒才算突增，避免基线很小时误判
+SPIKE_MIN_SECONDS = 0.5
+
+# 固定限速时遇到 429 所有线程一起暂停的秒数
+THROTTLE_PAUSE = 60
+
+
+class Ticket:
+    """一次请求占用的并发名额，release 只生效一次"""
+    
+    __slots__ = ("released",)
+    
+    def __init__(self):
+        self.released = False
+
+
+class RateGate:
+    """固定请求速率和并发上限的共享闸门（线程安全），多个线程共同遵守 request_delay"""
+    
+    def __init__(self, rate: Optional[float] = None, max_concurrency: int = 1):
+        """
+        Args:
+            rate: 请求速率（次/秒），缺省按 request_delay 换算
+            max_concurrency: 最大并发数
+        """
+        self.rate = rate or 1 / (CONFIG.get("request_delay", 2) + 0.5)
+        self.concurrency = max_concurrency
+        self.in_flight = 0
+        self.last_outcome = None
+        
+        self._next_slot = time.monotonic()
+        self._cond = threading.Condition()
+    
+    def acquire(self) -> Ticket:
+        """
+        等待并发名额和速率令牌，取代固定的 request_delay 等待
+        
+        Returns:
+            Ticket，请求结束后传给 release
+        """
+        with self._cond:
+            while self.in_flight >= self.concurrency:
+                self._cond.wait()
+            self.in_flight += 1
+            
+            # 按当前速率排队，保证请求间隔至少 1 / rate 秒
+            now = time.monotonic()
+            start_at = max(now, self._next_slot)
+            self._next_slot = start_at + 1 / self.rate
+        
+        wait = start_at - now
+        if wait > 0:
+            time.sleep(wait)
+        return Ticket()
+    
+    def release(self, ticket: Ticket, latency: Optional[float], outcome: str):
+        """
+        归还名额，遇到 429 时所有线程暂停 THROTTLE_PAUSE 秒
+        
+        Args:
+            ticket: acquire 返回的 Ticket
+            latency: 请求耗时（秒），失败时为 None
+            outcome: ok / throttled / html / error
+        """
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            self.in_flight -= 1
+            self.last_outcome = outcome
+            if outcome == THROTTLED:
+                self._next_slot = max(self._next_slot, time.monotonic() + THROTTLE_PAUSE)
+            self._cond.notify_all()
+    
+    def metrics(self) -> dict:
+        """当前限制和统计"""
+        with self._cond:
+            return {
+                "rate": round(self.rate, 3),
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "last_outcome": self.last_outcome,
+            }
+
+
+class AIMDController(RateGate):
+    """AIMD 并发数和请求速率控制器（线程安全）"""
+    
+    def __init__(self, initial_rate: Optional[float] = None, min_rate: Optional[float] = None,
+                 max_rate: Optional[float] = None, max_concurrency: Optional[int] = None):
+        """
+        Args:
+            initial_rate: 初始请求速率（次/秒），缺省按 request_delay 换算
+            min_rate: 最低请求速率（次/秒）
+            max_rate: 最高请求速率（次/秒）
+            max_concurrency: 最大并发数
+        """
+        super().__init__(initial_rate)
+        self.min_rate = min_rate or CONFIG.get("aimd_min_rate", 0.05)
+        self.max_rate = max_rate or CONFIG.get("aimd_max_rate", 2.0)
+        self.rate = min(max(self.rate, self.min_rate), self.max_rate)
+        self.rate_step = CONFIG.get("aimd_rate_step", 0.05)
+        self.decrease_factor = CONFIG.get("aimd_decrease_factor", 0.5)
+        self.latency_spike = CONFIG.get("aimd_latency_spike", 3.0)
+        self.increase_every = CONFIG.get("aimd_increase_every", 5)
+        
+        self.max_concurrency = max_concurrency or CONFIG.get("aimd_max_concurrency", 8)
+        
+        self.latency = None
+        self.successes = 0
+        self.increases = 0
+        self.decreases = 0
+        
+        self._last_decrease = 0.0
+    
+    def release(self, ticket: Ticket, latency: Optional[float], outcome: str):
+        """
+        归还名额并根据请求结果调整速率和并发数
+        
+        Args:
+            ticket: acquire 返回的 Ticket
+            latency: 请求耗时（秒），失败时为 None
+            outcome: ok / throttled / html / error
+        """
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            self.in_flight -= 1
+            self.last_outcome = outcome
+            
+            spike = (
+                outcome == OK and latency is not None and self.latency is not None
+                and latency > max(self.latency * self.latency_spike, self.latency + SPIKE_MIN_SECONDS)
+            )
+            
+            if outcome in (THROTTLED, HTML) or spike:
+                self._decrease()
+            elif outcome == OK:
+                self.successes += 1
+                if self.successes % self.increase_every == 0:
+                    self._increase()
+            
+            # 突增的延迟不计入基线，避免基线被拉高后失去灵敏度
+            if latency is not None and not spike:
+                self.latency = latency if self.latency is None else (
+                    EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency
+                )
+            
+            self._cond.notify_all()
+    
+    def _increase(self):
+        self.rate = min(self.rate + self.rate_step, self.max_rate)
+        if self.concurrency < self.max_concurrency:
+            self.concurrency += 1
+        self.increases += 1
+    
+    def _decrease(self):
+        # 同一批并发请求同时失败时只减一次
+        now = time.monotonic()
+        if now - self._last_decrease < 1 / self.rate:
+            return
+        self._last_decrease = now
+        self.rate = max(self.rate * self.decrease_factor, self.min_rate)
+        self.concurrency = max(int(self.concurrency * self.decrease_factor), 1)
+        self.successes = 0
+        self.decreases += 1
+        # 降速后重新排队
+        self._next_slot = max(self._next_slot, now + 1 / self.rate)
+        print(f"⚠ 自适应限速: 降低到 {self.rate:.2f} 次/秒，并发 {self.concurrency}")
+    
+    def metrics(self) -> dict:
+        """当前限制和统计"""
+        with self._cond:
+            return {
+                "rate": round(self.rate, 3),
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "latency": round(self.latency, 3) if self.latency is not None else None,
+                "increases": self.increases,
+                "decreases": self.decreases,
+                "last_outcome": self.last_outcome,
+            }
+
+
+@contextmanager
+def shared_rate_gate(spider, workers: int):
+    """
+    多线程批量请求期间让所有线程共享 request_delay 限速
+    未启用自适应限速时临时给 spider 安装固定速率闸门，退出时恢复原来的设置，
+    之后的单线程请求仍按 request_delay 逐个等待
+    
+    Args:
+        spider: IGSpider 实例
+        workers: 并发线程数
+    
+    Yields:
+        本次使用的限速器（已启用的自适应限速器或临时闸门），单线程时为原来的设置
+    """
+    previous = spider.controller
+    if previous is None and workers > 1:
+        spider.controller = RateGate(max_concurrency=workers)
+    try:
+        yield spider.controller
+    finally:
+        spider.controller = previous
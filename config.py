@@ -30,8 +30,167 @@ CONFIG = {
     # 请求超时时间（秒）
     "timeout": 30,
     
-    # 最大重试次数
+    # 最大重试次数（分布式任务失败重试，以及单个请求遇到 429 时的重试）
     "max_retries": 3,
+    
+    # 硬性请求预算（单次运行最多发送的 HTTP 请求数），None 表示不限制
+    "max_requests": None,
+    
+    # 规划估算：无第一页评论数据时，假设带子评论的父评论比例
+    "plan_child_thread_ratio": 0.2,
+    
+    # 规划估算：每个子评论串平均包含的子评论数
+    "plan_children_per_thread": 3,
+    
+    # 规划估算：话题帖子及评论时，额外请求评论最多的几个帖子的第一页评论，
+    # 用其中的 child_comment_count 估算子评论请求（其余帖子使用这些帖子合并的统计），0 表示只用上面两个假设值
+    "plan_comment_sample_posts": 3,
+    
+    # 时间限制（秒），超时后停止获取评论，None 表示不限制
+    "time_limit": None,
+    
+    # 帖子优先级打分权重（评论数、点赞数、发布时间）
+    "frontier_weights": {
+        "comment_count": 1.0,
+        "like_count": 0.5,
+        "recency": 1.0,
+    },
+    
+    # 后续评论分页相对上一页的分数衰减
+    "frontier_page_decay": 0.9,
+    
+    # 子评论分页相对所在评论页的分数衰减
+    "frontier_child_decay": 0.8,
+    
+    # 分布式任务队列地址（SQLite 文件，可放在共享磁盘上）
+    "queue_path": "output/queue.db",
+    
+    # 任务租约时长（秒），执行期间每 1/3 租约时长自动续租，worker 崩溃后超时未确认的任务会被重新领取
+    "queue_lease_seconds": 600,
+    
+    # SQLite 存储路径（如 "output/ig_spider.db"），None 表示不写入数据库
+    "storage_path": None,
+    
+    # SQLite 批量写入的缓冲行数
+    "storage_batch_size": 500,
+    
+    # 是否在后台线程写入 Excel / JSON（每种格式一个线程，不阻塞爬取）
+    "background_export": True,
+    
+    # 快照目录（--diff 对比时使用）
+    "snapshot_dir": "output/snapshots",
+    
+    # 代理列表（如 "http://1.2.3.4:8080"、"socks5://5.6.7.8:1080"），空列表表示不使用代理
+    # SOCKS 代理需要 pip install requests[socks]
+    "proxies": [],
+    
+    # 代理被限流或出错后的基础暂停时长（秒），连续出错时翻倍
+    "proxy_rest_seconds": 120,
+    
+    # 代理健康检查地址
+    "proxy_health_url": "https://www.instagram.com/",
+    
+    # 是否启用自适应限速（AIMD），启用后代替固定的 request_delay
+    "adaptive_rate": False,
+    
+    # 自适应限速：请求速率范围（次/秒）
+    "aimd_min_rate": 0.05,
+    "aimd_max_rate": 2.0,
+    
+    # 自适应限速：每次加速增加的速率（次/秒），每连续成功多少次加速一次
+    "aimd_rate_step": 0.05,
+    "aimd_increase_every": 5,
+    
+    # 自适应限速：遇到 429 / HTML / 延迟突增时速率和并发数乘以该系数
+    "aimd_decrease_factor": 0.5,
+    
+    # 自适应限速：延迟超过平均值的多少倍视为突增
+    "aimd_latency_spike": 3.0,
+    
+    # 自适应限速：最大并发数
+    "aimd_max_concurrency": 8,
+    
+    # 常驻服务：默认监听端口
+    "daemon_port": 8765,
+    
+    # 常驻服务：最多保留多少个已结束任务的结果
+    "daemon_max_jobs": 200,
+    
+    # 批量模式：并发线程数（所有线程共享同一个限速器）
+    "bulk_workers": 4,
+    
+    # 每个主机（每个代理）的 HTTP 连接池大小，None 表示取 bulk_workers 和 aimd_max_concurrency 中较大者
+    # 并发线程超过连接池大小时等待空闲连接，保持 TCP / TLS 连接复用
+    "http_pool_size": None,
+    
+    # 内存上限（MiB）：获取话题帖子及评论时进程内存超过该值后，已完成的帖子写入磁盘，导出时逐个读回
+    # None 表示全部保存在内存中
+    "memory_limit_mb": None,
+    
+    # 落盘文件目录，None 表示 <output_dir>/.spill（任务结束后自动删除）
+    "spill_dir": None,
+    
+    # 保存结果时补充用户资料列（粉丝数、关注数、帖子数、账号类型等），每个用户多一次请求
+    "enrich_profiles": False,
+    
+    # 用户资料磁盘缓存路径，None 表示只使用内存缓存
+    "profile_cache_path": "output/profile_cache.db",
+    
+    # 用户资料缓存有效期（秒），默认一天
+    "profile_cache_ttl": 86400,
+    
+    # 用户资料内存 LRU 缓存最多保留的用户数
+    "profile_cache_size": 10000,
+    
+    # 用户资料并发请求数（共享同一个限速器）
+    "profile_workers": 4,
+    
+    # 离线重新导出（python main.py export）解析文件的进程数，None 表示 CPU 核数
+    "export_workers": None,
+    
+    # 批量模式：每个输出文件包含的帖子数，None 表示全部写入一个文件
+    "bulk_shard_size": None,
+    
+    # 输出分片：每个文件最多的数据行数（Excel 单个 sheet 上限为 1,048,575 行）
+    "output_max_rows": 1000000,
+    
+    # 输出分片：帖子及评论 Excel 每个文件最多的 sheet 数
+    "output_max_sheets": 200,
+    
+    # 输出分片：每个文件最多的字节数（Excel 按未压缩内容估算），None 表示不限制
+    "output_max_bytes": None,
+    
+    # 字段投影：话题用户只提取这些列（如 ["username", "pk"]），None 表示全部列
+    "hashtag_fields": None,
+    
+    # 字段投影：评论只提取这些列（level、pk、media_id 始终保留），None 表示全部列
+    "comment_fields": None,
+    
+    # 分层抽样：每个帖子获取的父评论页数
+    "sample_pages_per_post": 1,
+    
+    # 分层抽样：子评论串的抽样比例（抽中的只取第一页）
+    "sample_child_rate": 0.2,
+    
+    # 分层抽样：按 comment_count 分层的边界
+    "sample_strata": [10, 100, 1000],
+    
+    # 失败请求（死信）存储路径，失败的分页请求写入这里，之后用 python main.py retry-failed 补抓
+    # None 表示不记录
+    "dead_letter_path": "output/dead_letters.db",
+    
+    # 同一个请求最多失败多少次（含重试），超过后不再重试
+    "dead_letter_max_attempts": 5,
+    
+    # 话题标签 / @提及 共现索引路径（如 "output/cooccur.db"），爬取时增量更新，之后用 python main.py related 查询
+    # None 表示不建立索引（命令行 --cooccur 开启）
+    "cooccur_path": None,
+    
+    # 共现索引每缓冲多少条文本批量写入一次
+    "cooccur_batch_size": 500,
+    
+    # 单条文本最多计入多少个标签 / 用户（超过时按文本中出现的顺序保留前面的，避免刷屏文本产生大量组合）
+    "cooccur_max_tokens": 40,
 }
 
 # 创建输出目录
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+话题标签 / @提及 共现索引模块
+爬取过程中把帖子正文和评论的 text 缓冲起来，按批次一次性提取 #标签 和 @用户，
+增量累加稀疏的共现计数并持久化到 SQLite，之后直接查询“与 #X 最相关的标签 / 用户”，不需要重新解析输出文件
+"""
+import atexit
+import bisect
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from itertools import permutations
+from typing import Optional
+
+from config import CONFIG
+
+# #标签（支持中文等 Unicode 字母）和 @用户名（字母、数字、下划线、点，最长 30 位）
+TOKEN_PATTERN = r"(?<![\w#@])(?:#(\w+)|@([A-Za-z0-9_](?:[A-Za-z0-9_.]{0,28}[A-Za-z0-9_])?))"
+
+_TOKEN_RE = re.compile(TOKEN_PATTERN)
+
+# 批量拼接文本时使用的分隔符（不会出现在标签或用户名中）
+_SEPARATOR = "\n\x00\n"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    key TEXT PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS tokens (
+    token TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pairs (
+    a TEXT NOT NULL,
+    b TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (a, b)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_pairs_top ON pairs (a, count DESC);
+"""
+
+UPSERT_TOKEN = """
+INSERT INTO tokens (token, count) VALUES (?, ?)
+ON CONFLICT (token) DO UPDATE SET count = tokens.count + excluded.count
+"""
+
+UPSERT_PAIR = """
+INSERT INTO pairs (a, b, count) VALUES (?, ?, ?)
+ON CONFLICT (a, b) DO UPDATE SET count = pairs.count + excluded.count
+"""
+
+
+def normalize_token(token: str) -> str:
+    """
+    规范化查询词：#标签 转小写，@用户名 转小写，不带前缀时视为 #标签
+    
+    Args:
+        token: 如 "#Python"、"python"、"@SomeUser"
+    """
+    token = token.strip().lower()
+    return token if token[:1] in ("#", "@") else f"#{token}"
+
+
+def extract_tokens(text: str) -> list[str]:
+    """
+    提取一段文本中的 #标签 和 @用户（小写，带前缀）
+    
+    Args:
+        text: 帖子正文或评论
+    
+    Returns:
+        去重后的 token 列表（按在文本中第一次出现的顺序）
+    """
+    return list(dict.fromkeys(
+        f"#{tag.lower()}" if tag else f"@{user.lower()}" for tag, user in _TOKEN_RE.findall(text or "")
+    ))
+
+
+def extract_batch(texts: list[str]) -> list[list[str]]:
+    """
+    批量提取：把所有文本拼接后只做一次正则扫描，再按偏移量分回各条文本
+    
+    Args:
+        texts: 文本列表
+    
+    Returns:
+        与 texts 一一对应的 token 列表（去重，按在文本中第一次出现的顺序）
+    """
+    results = [{} for _ in texts]
+    if not texts:
+        return []
+    
+    starts, offset = [], 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text) + len(_SEPARATOR)
+    
+    joined = _SEPARATOR.join(texts)
+    for match in _TOKEN_RE.finditer(joined):
+        tag, user = match.groups()
+        index = bisect.bisect_right(starts, match.start()) - 1
+        results[index].setdefault(f"#{tag.lower()}" if tag else f"@{user.lower()}")
+    return [list(tokens) for tokens in results]
+
+
+class CooccurrenceIndex:
+    """增量共现计数索引（线程安全，缓冲后批量写入 SQLite）"""
+    
+    def __init__(self, path: Optional[str] = None, batch_size: Optional[int] = None,
+                 max_tokens: Optional[int] = None):
+        """
+        Args:
+            path: 数据库文件路径，缺省使用 CONFIG["cooccur_path"]
+            batch_size: 缓冲多少条文本后批量提取并写入，缺省使用 CONFIG["cooccur_batch_size"]
+            max_tokens: 单条文本最多计入多少个 token（避免刷屏文本产生大量组合）
+        """
+        self.path = path or CONFIG.get("cooccur_path") or os.path.join(CONFIG.get("output_dir", "output"), "cooccur.db")
+        self.batch_size = batch_size or CONFIG.get("cooccur_batch_size", 500)
+        self.max_tokens = max_tokens or CONFIG.get("cooccur_max_tokens", 40)
+        
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        
+        # 待处理的 (key, text)
+        self._pending = {}
+        
+        # worker、交互模式等不调用 flush_exports 的入口，退出时写入剩余缓冲
+        atexit.register(self.flush)
+    
+    def add(self, key, text: Optional[str]):
+        """
+        缓冲一条文本，同一个 key（帖子 / 评论 pk）只计数一次，重复爬取不会重复累加
+        
+        Args:
+            key: 记录主键
+            text: 文本
+        """
+        if key is None or not text or ("#" not in text and "@" not in text):
+            return
+        with self._lock:
+            self._pending[str(key)] = text
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+    
+    def flush(self):
+        """批量提取缓冲的文本并累加计数"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            
+            # 过滤之前已经计数过的记录
+            keys = list(pending)
+            seen = set()
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT key FROM docs WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                seen.update(row[0] for row in rows)
+            keys = [k for k in keys if k not in seen]
+            
+            token_counts, pair_counts = Counter(), Counter()
+            for tokens in extract_batch([pending[k] for k in keys]):
+                # 按文本顺序保留前 max_tokens 个，不按字母序截断（否则靠后的标签和全部 @用户 总被丢弃）
+                tokens = tokens[:self.max_tokens]
+                token_counts.update(tokens)
+                pair_counts.update(permutations(tokens, 2))
+            
+            with self.conn:
+                self.conn.executemany("INSERT OR IGNORE INTO docs (key) VALUES (?)", [(k,) for k in keys])
+                self.conn.executemany(UPSERT_TOKEN, token_counts.items())
+                self.conn.executemany(UPSERT_PAIR, [(a, b, n) for (a, b), n in pair_counts.items()])
+    
+    def related(self, token: str, limit: int = 20, kind: Optional[str] = None, by: str = "count") -> list[dict]:
+        """
+        与某个标签 / 用户共同出现最多的 token
+        
+        Args:
+            token: 查询词，如 "#python"、"python"、"@someone"
+            limit: 返回条数
+            kind: 只返回 "#"（标签）或 "@"（用户），None 表示都返回
+            by: 排序方式，count（共现次数）或 jaccard（共现次数 / 两者出现次数之并）
+        
+        Returns:
+            [{"token", "count", "jaccard"}, ...]
+        """
+        self.flush()
+        token = normalize_token(token)
+        where, args = "p.a = ?", [token]
+        if kind:
+            where += " AND p.b LIKE ?"
+            args.append(f"{kind}%")
+        
+        row = self.conn.execute("SELECT count FROM tokens WHERE token = ?", (token,)).fetchone()
+        total = row[0] if row else 0
+        
+        order = "p.count DESC" if by == "count" else (
+            "CAST(p.count AS REAL) / (? + t.count - p.count) DESC, p.count DESC"
+        )
+        if by != "count":
+            args.append(total)
+        rows = self.conn.execute(
+            f"SELECT p.b, p.count, t.count FROM pairs p JOIN tokens t ON t.token = p.b "
+            f"WHERE {where} ORDER BY {order} LIMIT ?",
+            args + [limit]
+        ).fetchall()
+        return [{
+            "token": b,
+            "count": count,
+            "jaccard": round(count / (total + b_count - count), 4) if total + b_count - count else 0.0,
+        } for b, count, b_count in rows]
+    
+    def top(self, limit: int = 20, kind: Optional[str] = None) -> list[tuple[str, int]]:
+        """
+        出现次数最多的 token
+        
+        Args:
+            limit: 返回条数
+            kind: 只返回 "#"（标签）或 "@"（用户），None 表示都返回
+        """
+        self.flush()
+        if kind:
+            rows = self.conn.execute(
+                "SELECT token, count FROM tokens WHERE token LIKE ? ORDER BY count DESC LIMIT ?", (f"{kind}%", limit)
+            ).fetchall()
+        else:
+            rows = self.conn.execute("SELECT token, count FROM tokens ORDER BY count DESC LIMIT ?", (limit,)).fetchall()
+        return [(token, count) for token, count in rows]
+    
+    def close(self):
+        atexit.unregister(self.flush)
+        self.flush()
+        self.conn.close()
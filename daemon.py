@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+常驻服务模式
+保持一个已登录、连接已预热的 IGSpider，通过本地 HTTP API 接收任务，
+由内部调度线程按优先级执行，可查询任务状态和结果
+
+API:
+    POST /jobs              提交任务 {"type": ..., "params": {...}, "priority": 0, "save": true}
+                            retry_failed 任务默认优先级 -10，排在普通任务之后执行
+    GET  /jobs              任务列表
+    GET  /jobs/<id>         任务状态
+    GET  /jobs/<id>/result  任务结果
+    GET  /metrics           运行指标
+"""
+import itertools
+import json
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from config import CONFIG
+from dead_letter import retry_dead_letters
+from shortcode import POST_REF_HINT, parse_post_ref
+from writer import ExportError
+
+# 支持的任务类型
+JOB_TYPES = ("hashtag_users", "post_comments", "hashtag_posts_comments", "retry_failed")
+
+# 重试失败请求的默认优先级（低于普通任务，空闲时才执行）
+RETRY_PRIORITY = -10
+
+
+class JobScheduler:
+    """按优先级顺序执行任务的调度器（单线程，共享同一个 IGSpider）"""
+    
+    def __init__(self, spider, max_jobs: Optional[int] = None):
+        """
+        Args:
+            spider: 已登录的 IGSpider 实例
+            max_jobs: 最多保留多少个已结束任务的结果
+        """
+        self.spider = spider
+        self.max_jobs = max_jobs or CONFIG.get("daemon_max_jobs", 200)
+        self.jobs = OrderedDict()
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="job-scheduler", daemon=True)
+        self._thread.start()
+    
+    def submit(self, job_type: str, params: dict, priority: int = 0, save: bool = True) -> dict:
+        """
+        提交任务
+        
+        Args:
+            job_type: 任务类型（hashtag_users / post_comments / hashtag_posts_comments / retry_failed）
+            params: 任务参数（hashtag / media_id / max_posts / max_comments / limit）
+            priority: 优先级，越大越先执行
+            save: 是否同时保存为文件
+        
+        Returns:
+            任务信息
+        """
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"不支持的任务类型: {job_type}")
+        if job_type == "post_comments":
+            # 也接受帖子链接或 shortcode
+            media_id = parse_post_ref(str(params.get("media_id") or ""))
+            if not media_id:
+                raise ValueError(f"post_comments 任务无法识别的帖子: {params.get('media_id') or ''}（{POST_REF_HINT}）")
+            params = {**params, "media_id": media_id}
+        if job_type == "retry_failed" and not self.spider.dead_letters:
+            raise ValueError("未配置 dead_letter_path，没有失败请求记录")
+        if job_type in ("hashtag_users", "hashtag_posts_comments") and not params.get("hashtag"):
+            raise ValueError(f"{job_type} 任务需要 hashtag")
+        
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "type": job_type,
+            "params": params,
+            "priority": priority,
+            "save": save,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "count": None,
+            "files": None,
+            "error": None,
+            "result": None,
+        }
+        with self._lock:
+            self.jobs[job["id"]] = job
+            self._trim()
+        self._queue.put((-priority, next(self._counter), job["id"]))
+        return self.describe(job["id"])
+    
+    def _trim(self):
+        finished = [jid for jid, j in self.jobs.items() if j["status"] in ("done", "failed")]
+        for jid in finished[:max(len(self.jobs) - self.max_jobs, 0)]:
+            del self.jobs[jid]
+    
+    def describe(self, job_id: str) -> Optional[dict]:
+        """任务状态（不含结果数据）"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        return {k: v for k, v in job.items() if k != "result"}
+    
+    def result(self, job_id: str):
+        """任务结果数据"""
+        job = self.jobs.get(job_id)
+        return job["result"] if job else None
+    
+    def _run(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+            
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            try:
+                self._execute(job)
+                # 后台导出全部写完才算完成，写入失败时任务失败（files 中的文件不完整）
+                errors = self.spider.flush_exports()
+                if errors:
+                    raise ExportError("; ".join(errors))
+                job["status"] = "done"
+            except Exception as e:
+                traceback.print_exc()
+                job["status"] = "failed"
+                job["error"] = f"{type(e).__name__}: {e}"
+            job["finished_at"] = time.time()
+    
+    def _execute(self, job: dict):
+        spider = self.spider
+        params = job["params"]
+        
+        if job["type"] == "hashtag_users":
+            hashtag = params["hashtag"]
+            result = spider.get_hashtag_users(hashtag, params.get("max_posts"))
+            if result and job["save"]:
+                job["files"] = spider.save_results(result, f"hashtag_{hashtag}_users")
+            job["count"] = len(result)
+        
+        elif job["type"] == "post_comments":
+            media_id = str(params["media_id"])
+            result = spider.get_post_comment_users(media_id, params.get("max_comments"))
+            if result and job["save"]:
+                job["files"] = spider.save_results(result, f"post_{media_id}_comment_users", data_type="comment")
+            job["count"] = len(result)
+        
+        elif job["type"] == "retry_failed":
+            result = retry_dead_letters(spider, params.get("limit"), params.get("max_posts"),
+                                        params.get("max_comments"), save=job["save"])
+            job["files"] = result.pop("files")
+            job["count"] = result["users"] + result["comments"]
+        
+        else:
+            hashtag = params["hashtag"]
+            result = spider.get_hashtag_posts_with_comments(
+                hashtag, params.get("max_posts", 10), params.get("max_comments", 50)
+            )
+            if result and job["save"]:
+                job["files"] = {"excel": spider.save_posts_with_comments(result, f"hashtag_{hashtag}_posts_comments")}
+            # JSON 的 key 必须是字符串
+            result = {str(pk): post for pk, post in result.items()}
+            job["count"] = len(result)
+        
+        job["result"] = result
+
+
+def make_handler(scheduler: JobScheduler):
+    """创建绑定了调度器的请求处理类"""
+    
+    class JobHandler(BaseHTTPRequestHandler):
+        
+        def _send(self, status: int, data):
+            body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def do_GET(self):
+            parts = [p for p in self.path.split("?")[0].split("/") if p]
+            
+            if parts == ["jobs"]:
+                with scheduler._lock:
+                    job_ids = list(scheduler.jobs)
+                self._send(200, [scheduler.describe(jid) for jid in job_ids])
+            elif len(parts) == 2 and parts[0] == "jobs":
+                job = scheduler.describe(parts[1])
+                if job is None:
+                    self._send(404, {"error": "任务不存在"})
+                else:
+                    self._send(200, job)
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+                job = scheduler.describe(parts[1])
+                if job is None:
+                    self._send(404, {"error": "任务不存在"})
+                elif job["status"] != "done":
+                    self._send(409, {"error": f"任务状态为 {job['status']}", "job": job})
+                else:
+                    self._send(200, scheduler.result(parts[1]))
+            elif parts == ["metrics"]:
+                self._send(200, scheduler.spider.get_metrics())
+            else:
+                self._send(404, {"error": "未知路径"})
+        
+        def do_POST(self):
+            if self.path.split("?")[0].rstrip("/") != "/jobs":
+                self._send(404, {"error": "未知路径"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                default_priority = RETRY_PRIORITY if body.get("type") == "retry_failed" else 0
+                job = scheduler.submit(
+                    body.get("type", ""),
+                    body.get("params", {}),
+                    priority=int(body.get("priority", default_priority)),
+                    save=bool(body.get("save", True)),
+                )
+            except (ValueError, json.JSONDecodeError) as e:
+                self._send(400, {"error": str(e)})
+                return
+            self._send(202, job)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    return JobHandler
+
+
+def serve(spider, host: str = "127.0.0.1", port: int = 8765):
+    """
+    启动常驻服务（阻塞直到 Ctrl+C）
+    
+    Args:
+        spider: 已登录的 IGSpider 实例
+        host: 监听地址，默认只监听本机
+        port: 监听端口
+    """
+    scheduler = JobScheduler(spider)
+    server = ThreadingHTTPServer((host, port), make_handler(scheduler))
+    print(f"\n🚀 服务已启动: http://{host}:{server.server_address[1]}")
+    print("   POST /jobs 提交任务，GET /jobs/<id> 查询状态，GET /jobs/<id>/result 获取结果")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 服务已停止")
+    finally:
+        server.server_close()
+        spider.flush_exports()
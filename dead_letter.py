@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+失败请求（死信）存储模块
+评论分页、子评论分页、话题搜索分页请求失败时，把接口地址、参数、游标和错误类型持久化到 SQLite，
+之后由 main.py retry-failed 或常驻服务的低优先级任务从失败的游标继续，只补抓缺失的部分
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from config import CONFIG
+from singleflight import request_key
+
+# 支持的失败请求类型
+KINDS = ("hashtag", "comments", "child")
+
+# 每次请求随机生成的参数，同一分页重试时会变化，去重时忽略
+RETRY_VOLATILE_PARAMS = ("rank_token", "search_session_id")
+
+# 标记为 retrying 超过这么多秒仍未结束，视为重试进程已中断，重新变为待重试
+RETRYING_TIMEOUT = 3600
+
+
+class DeadLetterStore:
+    """基于 SQLite 的失败请求存储（同一请求只保留一条，重复失败时累加次数）"""
+    
+    def __init__(self, path: Optional[str] = None, max_attempts: Optional[int] = None):
+        """
+        Args:
+            path: SQLite 数据库文件路径，缺省使用 CONFIG["dead_letter_path"]
+            max_attempts: 单个请求最多失败次数，超过后标记为 failed 不再重试
+        """
+        self.path = path or CONFIG.get("dead_letter_path") or os.path.join(
+            CONFIG.get("output_dir", "output"), "dead_letters.db")
+        self.max_attempts = max_attempts or CONFIG.get("dead_letter_max_attempts", 5)
+        
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                params TEXT NOT NULL,
+                context TEXT NOT NULL,
+                cursor TEXT,
+                error TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 1,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_dead_letters_status ON dead_letters (status, created_at)"
+        )
+    
+    def add(self, kind: str, endpoint: str, params: dict, context: dict, error: str):
+        """
+        记录一次失败的请求
+        
+        Args:
+            kind: 请求类型（hashtag / comments / child）
+            endpoint: 接口地址
+            params: 请求参数
+            context: 重试所需的信息（hashtag / media_id / comment_pk / cursor）
+            error: 错误类型，如 HTTP 500、ReadTimeout、JSONDecodeError
+        """
+        if kind not in KINDS:
+            raise ValueError(f"不支持的失败请求类型: {kind}")
+        
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO dead_letters (key, kind, endpoint, params, context, cursor, error, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "attempts = dead_letters.attempts + 1, error = excluded.error, updated_at = excluded.updated_at, "
+                "status = CASE WHEN dead_letters.attempts + 1 >= ? THEN 'failed' ELSE 'pending' END",
+                (request_key(endpoint, params, RETRY_VOLATILE_PARAMS), kind, endpoint,
+                 json.dumps(params, ensure_ascii=False), json.dumps(context, ensure_ascii=False),
+                 context.get("cursor"), error, now, now, self.max_attempts)
+            )
+    
+    def pending(self, limit: Optional[int] = None) -> list[dict]:
+        """
+        待重试的请求（按失败时间先后），取出后标记为 retrying
+        
+        Args:
+            limit: 最多取出多少条，None 表示全部
+        
+        Returns:
+            [{"id", "kind", "endpoint", "params", "context", "cursor", "error", "attempts"}, ...]
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "UPDATE dead_letters SET status = 'pending' WHERE status = 'retrying' AND updated_at < ?",
+                (now - RETRYING_TIMEOUT,)
+            )
+            rows = self.conn.execute(
+                "SELECT * FROM dead_letters WHERE status = 'pending' ORDER BY created_at LIMIT ?",
+                (limit if limit is not None else -1,)
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE dead_letters SET status = 'retrying', updated_at = ? WHERE id = ?",
+                [(now, row["id"]) for row in rows]
+            )
+        
+        return [{
+            "id": row["id"],
+            "kind": row["kind"],
+            "endpoint": row["endpoint"],
+            "params": json.loads(row["params"]),
+            "context": json.loads(row["context"]),
+            "cursor": row["cursor"],
+            "error": row["error"],
+            "attempts": row["attempts"],
+        } for row in rows]
+    
+    def resolve(self, letter_id: int) -> bool:
+        """
+        标记重试成功；重试时再次失败的请求已被 add 改回 pending / failed，不受影响
+        
+        Returns:
+            是否标记成功（False 表示重试时再次失败）
+        """
+        with self._lock:
+            cur = self.conn.execute(
+                "UPDATE dead_letters SET status = 'done', updated_at = ? WHERE id = ? AND status = 'retrying'",
+                (time.time(), letter_id)
+            )
+        return cur.rowcount > 0
+    
+    def release(self, letter_id: int, error: Optional[str] = None):
+        """
+        放回待重试状态
+        
+        Args:
+            letter_id: 失败请求 ID
+            error: 重试时出现的异常类型，为 None 时（如预算用尽未重试）不累加失败次数
+        """
+        failed = 1 if error else 0
+        with self._lock:
+            self.conn.execute(
+                "UPDATE dead_letters SET attempts = attempts + ?, error = COALESCE(?, error), "
+                "status = CASE WHEN attempts + ? >= ? THEN 'failed' ELSE 'pending' END, updated_at = ? "
+                "WHERE id = ? AND status = 'retrying'",
+                (failed, error, failed, self.max_attempts, time.time(), letter_id)
+            )
+    
+    def stats(self) -> dict:
+        """各状态的失败请求数量"""
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM dead_letters GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+    
+    def close(self):
+        self.conn.close()
+
+
+def retry_dead_letters(spider, limit: Optional[int] = None, max_posts: Optional[int] = None,
+                       max_comments: Optional[int] = None, save: bool = True) -> dict:
+    """
+    从失败的游标继续抓取，结果按话题 / 帖子合并保存
+    
+    Args:
+        spider: 已登录的 IGSpider 实例（spider.dead_letters 不能为空）
+        limit: 最多重试多少条失败请求
+        max_posts: 话题请求最多补抓的帖子数，缺省为 CONFIG["max_posts_per_hashtag"]
+        max_comments: 每条评论 / 子评论请求最多补抓的评论数，缺省为 CONFIG["max_comments_per_post"]
+        save: 是否保存为文件
+    
+    Returns:
+        {"retried", "resolved", "users", "comments", "files", "stats"}
+    """
+    store = spider.dead_letters
+    if max_posts is None:
+        max_posts = CONFIG.get("max_posts_per_hashtag", 50)
+    if max_comments is None:
+        max_comments = CONFIG.get("max_comments_per_post", 100)
+    
+    letters = store.pending(limit)
+    print(f"\n🔁 正在重试 {len(letters)} 个失败请求...")
+    if spider.storage:
+        spider.storage.start_run("retry_failed", limit=limit)
+    
+    users = {}      # {hashtag: {username: record}}
+    comments = {}   # {media_id: [record, ...]}
+    resolved = 0
+    
+    for letter in letters:
+        ctx = letter["context"]
+        print(f"  [{letter['kind']}] {ctx} - 上次错误: {letter['error']}（第 {letter['attempts']} 次失败）")
+        
+        if spider.budget.exhausted:
+            store.release(letter["id"])
+            continue
+        
+        try:
+            if letter["kind"] == "hashtag":
+                found = users.setdefault(ctx["hashtag"], {})
+                count = 0
+                # 游标只在原搜索会话中有效，沿用失败时的请求参数，只从游标处继续
+                for media_item, _ in spider.iter_hashtag_medias(ctx["hashtag"], ctx.get("cursor"),
+                                                                params=letter["params"]):
+                    media = media_item.get("media", media_item)
+                    username = ((media.get("caption") or {}).get("user") or {}).get("username")
+                    if username and username not in found:
+                        found[username] = spider._hashtag_user_record(media_item)
+                        if spider.storage:
+                            spider.storage.add_posts([found[username]], ctx["hashtag"])
+                    count += 1
+                    if count >= max_posts:
+                        break
+            
+            elif letter["kind"] == "comments":
+                batch = []
+                for comment, _ in spider.iter_comments(ctx["media_id"], ctx.get("cursor"), paginate_children=False):
+                    batch.append(comment)
+                    if len(batch) >= max_comments:
+                        break
+                comments.setdefault(ctx["media_id"], []).extend(batch)
+                if spider.storage:
+                    spider.storage.add_comments(batch)
+            
+            else:
+                batch = []
+                for child, _ in spider.iter_child_comments(ctx["media_id"], ctx["comment_pk"], ctx.get("cursor") or ""):
+                    batch.append(child)
+                    if len(batch) >= max_comments:
+                        break
+                comments.setdefault(ctx["media_id"], []).extend(batch)
+                if spider.storage:
+                    # 只有子评论，父评论关系由 parent_pk 指定
+                    spider.storage.add_comments(batch, parent_pk=ctx["comment_pk"])
+        except Exception as e:
+            print(f"  ✗ 重试失败: {e}")
+            store.release(letter["id"], type(e).__name__)
+            continue
+        
+        if store.resolve(letter["id"]):
+            resolved += 1
+    
+    if spider.storage:
+        spider.storage.finish_run()
+    
+    files = {}
+    for hashtag, found in users.items():
+        if found and save:
+            files[f"hashtag_{hashtag}"] = spider.save_results(list(found.values()), f"hashtag_{hashtag}_users_retry")
+    
+    for media_id, records in comments.items():
+        if records and save:
+            files[f"post_{media_id}"] = spider.save_results(
+                records, f"post_{media_id}_comment_users_retry", data_type="comment")
+    
+    stats = store.stats()
+    print(f"✓ 重试完成: {resolved}/{len(letters)} 个请求成功，失败请求状态: {stats}")
+    return {
+        "retried": len(letters),
+        "resolved": resolved,
+        "users": sum(len(found) for found in users.values()),
+        "comments": sum(len(records) for records in comments.values()),
+        "files": files,
+        "stats": stats,
+    }
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+优先级爬取队列（Frontier）
+把待爬的帖子、评论分页、子评论分页任务放进同一个优先队列，
+按 comment_count / like_count / 发布时间等信号打分，
+在请求预算或时间限制下优先采集最有价值的数据
+"""
+import heapq
+import itertools
+import math
+import time
+from typing import Optional
+
+from config import CONFIG
+
+# 默认打分权重
+DEFAULT_WEIGHTS = {
+    "comment_count": 1.0,
+    "like_count": 0.5,
+    "recency": 1.0,
+}
+
+
+class CrawlFrontier:
+    """
+    优先级任务队列
+    
+    任务为 dict，包含 type 字段：
+        post     - 帖子第一页评论
+        comments - 帖子后续评论分页（带 cursor）
+        child    - 子评论分页（带 comment_pk 和 cursor）
+    """
+    
+    def __init__(self, weights: Optional[dict] = None, time_limit: Optional[float] = None):
+        """
+        Args:
+            weights: 打分权重，缺省使用 CONFIG["frontier_weights"]
+            time_limit: 时间限制（秒），超时后不再弹出任务，None 表示不限制
+        """
+        self.weights = dict(DEFAULT_WEIGHTS)
+        self.weights.update(weights if weights is not None else CONFIG.get("frontier_weights", {}))
+        self.page_decay = CONFIG.get("frontier_page_decay", 0.9)
+        self.child_decay = CONFIG.get("frontier_child_decay", 0.8)
+        self.deadline = time.monotonic() + time_limit if time_limit else None
+        self._heap = []
+        self._counter = itertools.count()
+    
+    def __len__(self) -> int:
+        return len(self._heap)
+    
+    @property
+    def expired(self) -> bool:
+        """是否已超过时间限制"""
+        return self.deadline is not None and time.monotonic() >= self.deadline
+    
+    def score_post(self, media: dict) -> float:
+        """
+        根据帖子元数据打分
+        
+        Args:
+            media: 搜索接口返回的 media 数据
+        
+        Returns:
+            分数，越高越优先
+        """
+        comment_count = media.get("comment_count") or 0
+        like_count = media.get("like_count") or 0
+        
+        # 发布时间越近分数越高，一天前的帖子得 0.5 分
+        taken_at = media.get("taken_at") or (media.get("caption") or {}).get("created_at")
+        recency = 0.0
+        if taken_at:
+            age_hours = max(time.time() - taken_at, 0) / 3600
+            recency = 1 / (1 + age_hours / 24)
+        
+        return (
+            self.weights.get("comment_count", 0) * math.log1p(comment_count)
+            + self.weights.get("like_count", 0) * math.log1p(like_count)
+            + self.weights.get("recency", 0) * recency
+        )
+    
+    def score_page(self, parent_score: float) -> float:
+        """后续评论分页的分数（越往后越低）"""
+        return parent_score * self.page_decay
+    
+    def score_child(self, parent_score: float, child_count: int) -> float:
+        """子评论分页的分数，子评论越多分数越高"""
+        return parent_score * self.child_decay + 0.1 * math.log1p(child_count)
+    
+    def push(self, task: dict, score: float):
+        """加入任务"""
+        task["score"] = score
+        heapq.heappush(self._heap, (-score, next(self._counter), task))
+    
+    def pop(self) -> Optional[dict]:
+        """弹出分数最高的任务，队列为空或超时返回 None"""
+        if not self._heap or self.expired:
+            return None
+        return heapq.heappop(self._heap)[2]
@@ -5,16 +5,36 @@ Instagram Spider 核心模块
 基于 Instagram GraphQL API
 """
 import json
+import math
 import os
 import random
+import threading
 import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional
+from types import MappingProxyType
+from typing import Iterator, Optional
 
 import pandas as pd
 import requests
 
+from budget import RequestBudget, SEARCH_PAGE_SIZE, child_thread_stats, estimate_comment_requests, estimate_seconds
+from concurrency import AIMDController, ERROR, HTML, OK, THROTTLE_PAUSE, THROTTLED
 from config import CONFIG
+from cooccur import CooccurrenceIndex
+from dead_letter import DeadLetterStore
+from frontier import CrawlFrontier
+from profiles import PROFILE_COLUMN_WIDTHS, PROFILE_FIELDS, ProfileEnricher
+from profiling import PHASES
+from proxy_pool import ProxyPool
+from rotation import ExcelSink, JSONSink
+from sampling import apply_crawl_stats, draw_sample
+from singleflight import SingleFlight, request_key
+from spill import SpillablePosts
+from snapshot_diff import SnapshotStore, build_index, diff_index, write_delta
+from storage import SQLiteStorage
+from transport import ACCEPT_ENCODING, can_decode, merge_endpoints, mount_pool
+from writer import ExportWriter
 
 # Session 文件存储路径
 SESSION_DIR = "sessions"
@@ -29,6 +49,21 @@ USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0",
 ]
 
+# API 请求固定的请求头（X-CSRFToken / X-IG-WWW-Claim 随登录状态变化，见 IGSpider._build_api_headers）
+API_HEADERS = MappingProxyType({
+    "X-IG-App-ID": "936619743392459",
+    "X-ASBD-ID": "359341",
+    "X-Requested-With": "XMLHttpRequest",
+    "Accept": "*/*",
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Site": "same-origin",
+})
+
+# 子评论接口，与父评论接口同在 www 主机（请求头按 same-origin 发送）
+# 实时抓取、记录失败请求和重试都使用这个地址，保证同一分页的去重键一致
+CHILD_COMMENTS_API = "https://www.instagram.com/api/v1/media/{media_id}/comments/{comment_pk}/child_comments/"
+
 
 class IGSpider:
     """Instagram 爬虫类 - 基于 GraphQL API"""
@@ -36,26 +71,79 @@ class IGSpider:
     def __init__(self):
         """初始化爬虫"""
         self.session = requests.Session()
+        # 线程安全的连接池，多线程 / 常驻服务模式下保持连接复用
+        self.connection_stats = mount_pool(self.session)
         self.session_id = None
         self.csrf_token = None
         self.ig_www_claim = None
         self.is_logged_in = False
         self.username = None
         
+        # 硬性请求预算
+        self.budget = RequestBudget(CONFIG.get("max_requests"))
+        
+        # SQLite 存储，未配置 storage_path 时不启用
+        self.storage = SQLiteStorage() if CONFIG.get("storage_path") else None
+        
+        # 后台导出线程，关闭后在主线程直接写文件
+        self.writer = ExportWriter() if CONFIG.get("background_export", True) else None
+        
+        # 代理池，未配置代理时直接使用 self.session
+        self.proxy_pool = None
+        
+        # 自适应限速（AIMD），未启用时使用固定的 request_delay
+        self.controller = AIMDController() if CONFIG.get("adaptive_rate") else None
+        
+        # 合并同时进行的相同请求
+        self.single_flight = SingleFlight()
+        
+        # 失败请求（死信）存储，未配置 dead_letter_path 时失败的分页直接丢弃
+        self.dead_letters = DeadLetterStore() if CONFIG.get("dead_letter_path") else None
+        
+        # 每个线程最近一次请求的错误类型，供记录失败请求使用
+        self._local = threading.local()
+        
+        # 话题标签 / @提及 共现索引，未配置 cooccur_path 时不建立
+        self.cooccur = CooccurrenceIndex() if CONFIG.get("cooccur_path") else None
+        
+        # 用户资料补充（粉丝数、账号类型等），未启用 enrich_profiles 时不补充
+        self.profiles = ProfileEnricher(self) if CONFIG.get("enrich_profiles") else None
+        
+        # 字段投影，未配置时提取全部列
+        self.set_fields(CONFIG.get("hashtag_fields"), CONFIG.get("comment_fields"))
+        
         # 设置默认 headers
         self.session.headers.update({
             "User-Agent": random.choice(USER_AGENTS),
             "Accept": "*/*",
             "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-            "Accept-Encoding": "gzip, deflate, br",
+            # 只声明已安装解码器的压缩格式（br 需要 brotli，zstd 需要 zstd 解码库）
+            "Accept-Encoding": ACCEPT_ENCODING,
             "Origin": "https://www.instagram.com",
             "Referer": "https://www.instagram.com/",
             "X-Requested-With": "XMLHttpRequest",
         })
         
+        # API 请求头，只在登录状态变化时重建，请求时不修改 session.headers
+        self._api_headers = self._build_api_headers()
+        
+        if CONFIG.get("proxies"):
+            self.set_proxies(CONFIG["proxies"])
+        
         # 尝试加载已保存的 session
         self._try_load_session()
     
+    def set_proxies(self, proxies: list[str]):
+        """
+        设置代理池（共享当前 session 的 headers 和 cookies）
+        
+        Args:
+            proxies: 代理地址列表，如 ["http://1.2.3.4:8080", "socks5://5.6.7.8:1080"]，空列表表示不使用代理
+        """
+        self.proxy_pool = ProxyPool(proxies, self.session) if proxies else None
+        if self.proxy_pool:
+            print(f"🌐 已启用代理池: {len(self.proxy_pool)} 个代理")
+    
     def _try_load_session(self) -> bool:
         """尝试加载已保存的 session"""
         session_file = os.path.join(SESSION_DIR, "instagram_session.json")
@@ -94,7 +182,18 @@ class IGSpider:
             self.session.cookies.set("sessionid", self.session_id, domain=".instagram.com")
         if self.csrf_token:
             self.session.cookies.set("csrftoken", self.csrf_token, domain=".instagram.com")
-            self.session.headers["X-CSRFToken"] = self.csrf_token
+        self._api_headers = self._build_api_headers()
+    
+    def _build_api_headers(self) -> MappingProxyType:
+        """
+        构建 API 请求头（只读），多个线程共用同一份，不需要加锁
+        未设置 csrf_token 时 X-CSRFToken 在请求时从 cookie 读取
+        """
+        headers = dict(API_HEADERS)
+        headers["X-IG-WWW-Claim"] = self.ig_www_claim or "0"
+        if self.csrf_token:
+            headers["X-CSRFToken"] = self.csrf_token
+        return MappingProxyType(headers)
     
     def _save_session(self):
         """保存 session 到文件"""
@@ -190,9 +289,11 @@ class IGSpider:
         
         self.session_id = None
         self.csrf_token = None
+        self.ig_www_claim = None
         self.is_logged_in = False
         self.username = None
         self.session.cookies.clear()
+        self._api_headers = self._build_api_headers()
         
         print("✓ 已登出")
     
@@ -219,61 +320,212 @@ class IGSpider:
             print("  提示: 请检查 VPN 是否正常工作")
             return False
     
-    def _api_request(self, url: str, params: dict = None) -> Optional[dict]:
+    def _api_request(self, url: str, params: dict = None, context: Optional[dict] = None) -> Optional[dict]:
         """
-        发送 API 请求并获取 JSON 响应
+        发送 API 请求并获取 JSON 响应，失败时错误类型记在 self._local.error
         
         Args:
             url: API URL
             params: 请求参数
+            context: 失败时写入死信存储的重试信息，如 {"kind": "comments", "media_id": ..., "cursor": ...}，
+                None 表示失败不记录
         
         Returns:
-            JSON 响应数据
+            JSON 响应数据（可能与其他调用方共享，只读使用）
+        """
+        data, error = self._api_call(url, params, context)
+        self._local.error = error
+        return data
+    
+    def _api_call(self, url: str, params: dict = None,
+                  context: Optional[dict] = None) -> tuple[Optional[dict], Optional[str]]:
         """
+        发送 API 请求，返回响应和错误类型
+        多个线程同时请求同一接口（URL + 全部参数相同）时只发送一次，所有调用方共享响应和错误类型
+        
+        Args:
+            url: API URL
+            params: 请求参数
+            context: 同 _api_request
+        
+        Returns:
+            (JSON 响应数据, 错误类型)，成功时错误类型为 None，如 HTTP 404、HTML、ReadTimeout
+        """
+        params = dict(params or {})
+        
+        def fetch():
+            data = self._send_request(url, params)
+            # 错误类型只在实际发送的线程中可见，随结果一起返回给合并的调用方
+            error = getattr(self._local, "error", None) if data is None else None
+            # 合并的请求只由实际发送的线程记录一次
+            if data is None and context:
+                self._record_failure(url, params, context, error)
+            return data, error
+        
+        data, error = self.single_flight.do(request_key(url, params), fetch)
+        if data is None:
+            self._note_error(error)
+        return data, error
+    
+    def _record_failure(self, url: str, params: dict, context: dict, error: Optional[str]):
+        """
+        把失败的请求写入死信存储（请求预算用尽属于主动停止，不记录）
+        
+        Args:
+            url: API URL
+            params: 请求参数
+            context: 重试信息，kind 之外的键原样保存
+            error: 错误类型
+        """
+        if not self.dead_letters or error == "BudgetExhausted":
+            return
+        context = dict(context)
+        kind = context.pop("kind")
+        try:
+            self.dead_letters.add(kind, url, params, context, error or "Unknown")
+        except Exception as e:
+            print(f"⚠ 记录失败请求出错: {e}")
+    
+    @contextmanager
+    def collect_errors(self) -> Iterator[list[str]]:
+        """
+        收集当前线程在 with 块内的失败请求和中断的错误类型
+        抓取方法遇到失败时只打印并返回已获取的部分，调用方（如 worker）用它判断结果是否完整
+        
+        Yields:
+            错误类型列表，如 ["HTTP 500", "ReadTimeout"]，全部成功时为空
+        """
+        errors = []
+        previous = getattr(self._local, "errors", None)
+        self._local.errors = errors
+        try:
+            yield errors
+        finally:
+            self._local.errors = previous
+    
+    def _note_error(self, error: Optional[str]):
+        """把错误类型加入当前线程 collect_errors 的列表（没有在收集时忽略）"""
+        errors = getattr(self._local, "errors", None)
+        if errors is not None:
+            errors.append(error or "Unknown")
+    
+    def _send_request(self, url: str, params: dict, attempt: int = 0) -> Optional[dict]:
+        """
+        实际发送 API 请求（限速、代理选择、429 重试），失败时把错误类型记在 self._local.error
+        
+        Args:
+            url: API URL
+            params: 请求参数
+            attempt: 已经因 429 重试的次数，超过 CONFIG["max_retries"] 后放弃
+        """
+        self._local.error = None
+        if not self.budget.consume():
+            print(f"⚠ 请求预算已用尽（{self.budget.summary()}），停止发送请求")
+            self._local.error = "BudgetExhausted"
+            return None
+        
+        ticket = None
+        latency = None
+        outcome = ERROR
+        
         try:
-            time.sleep(CONFIG.get("request_delay", 2) + random.uniform(0, 1))
+            with PHASES.phase("sleep"):
+                if self.controller:
+                    ticket = self.controller.acquire()
+                else:
+                    time.sleep(CONFIG.get("request_delay", 2) + random.uniform(0, 1))
             
-            # 从 cookie 中获取 csrftoken
-            csrftoken = self.csrf_token or self.session.cookies.get("csrftoken", "")
+            # API 请求头，未设置 csrf_token 时从 cookie 中获取
+            headers = self._api_headers
+            if "X-CSRFToken" not in headers:
+                headers = {**headers, "X-CSRFToken": self.session.cookies.get("csrftoken", "")}
             
-            # 设置 API 请求必要的请求头
-            headers = {
-                "X-IG-App-ID": "936619743392459",
-                "X-ASBD-ID": "359341",
-                "X-CSRFToken": csrftoken,
-                "X-IG-WWW-Claim": self.ig_www_claim or "0",
-                "X-Requested-With": "XMLHttpRequest",
-                "Accept": "*/*",
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-origin",
-            }
+            # 有代理池时按分数选择代理，每个代理使用自己的连接池
+            if self.proxy_pool and not self.proxy_pool.available():
+                # 全部代理都在暂停期，做一次健康检查，恢复因连接错误暂停、现已可用的代理
+                print("🔍 所有代理都在暂停期，正在做健康检查...")
+                self.proxy_pool.health_check()
+                # 仍然没有可用代理（都因 429 暂停）时等到最早的代理恢复，保证限流退避生效
+                wait = self.proxy_pool.next_available_in()
+                if wait > 0:
+                    print(f"⚠ 所有代理都被限流，等待 {wait:.0f} 秒...")
+                    with PHASES.phase("sleep"):
+                        time.sleep(wait)
+            proxy = self.proxy_pool.choose() if self.proxy_pool else None
+            http = proxy.session if proxy else self.session
             
-            resp = self.session.get(
-                url,
-                params=params,
-                headers=headers,
-                timeout=CONFIG.get("timeout", 30)
-            )
+            started = time.monotonic()
+            try:
+                with PHASES.phase("http"):
+                    resp = http.get(
+                        url,
+                        params=params,
+                        headers=headers,
+                        timeout=CONFIG.get("timeout", 30)
+                    )
+            except Exception:
+                if proxy:
+                    self.proxy_pool.report(proxy, None, error=True)
+                raise
+            latency = time.monotonic() - started
+            self.budget.record_latency(latency)
             
             # 调试信息
             content_type = resp.headers.get('Content-Type', '')
-            if 'json' not in content_type and 'text/html' in content_type:
+            is_html = 'json' not in content_type and 'text/html' in content_type
+            
+            if proxy:
+                self.proxy_pool.report(proxy, latency, resp.status_code, error=is_html)
+            
+            if is_html:
+                outcome = HTML
+            elif resp.status_code == 429:
+                outcome = THROTTLED
+            elif resp.status_code == 200:
+                outcome = OK
+            
+            if is_html:
                 print(f"⚠ 返回了 HTML 而不是 JSON，可能需要重新登录")
                 print(f"  Content-Type: {content_type}")
+                self._local.error = "HTML"
                 return None
             
             if resp.status_code == 200:
-                return resp.json()
+                content_encoding = resp.headers.get("Content-Encoding")
+                if not can_decode(content_encoding):
+                    print(f"⚠ 无法解码的响应压缩格式: {content_encoding}")
+                    self._local.error = f"Content-Encoding {content_encoding}"
+                    return None
+                with PHASES.phase("decode"):
+                    return resp.json()
             elif resp.status_code == 429:
-                print("⚠ 请求过于频繁，等待 60 秒...")
-                time.sleep(60)
-                return self._api_request(url, params)
+                # 重试前先归还并发名额
+                if ticket:
+                    self.controller.release(ticket, latency, outcome)
+                
+                if attempt >= CONFIG.get("max_retries", 3):
+                    print(f"✗ 请求过于频繁，已重试 {attempt} 次，放弃该请求")
+                    self._local.error = "HTTP 429"
+                    return None
+                
+                # 还有未被限流的代理时直接换代理重试
+                if self.proxy_pool and self.proxy_pool.available():
+                    print(f"⚠ 代理 {proxy.url} 请求过于频繁，切换代理重试...")
+                    return self._send_request(url, params, attempt + 1)
+                
+                # 有限速器时由它暂停或降速（下一次 acquire 会等待），不再额外固定等待
+                if not self.controller:
+                    print(f"⚠ 请求过于频繁，等待 {THROTTLE_PAUSE} 秒...")
+                    with PHASES.phase("sleep"):
+                        time.sleep(THROTTLE_PAUSE)
+                return self._send_request(url, params, attempt + 1)
             elif resp.status_code == 401:
                 print("✗ 未授权，请检查登录状态")
+                self._local.error = "HTTP 401"
                 return None
             else:
                 print(f"⚠ API 请求失败，状态码: {resp.status_code}")
+                self._local.error = f"HTTP {resp.status_code}"
                 return None
                 
         except json.JSONDecodeError as e:
@@ -281,10 +533,43 @@ class IGSpider:
             # 打印前 200 个字符帮助调试
             if 'resp' in locals():
                 print(f"  响应内容前 200 字符: {resp.text[:200]}...")
+            self._local.error = type(e).__name__
             return None
         except Exception as e:
             print(f"⚠ 请求异常: {e}")
+            self._local.error = type(e).__name__
             return None
+        finally:
+            if ticket:
+                self.controller.release(ticket, latency, outcome)
+    
+    def get_metrics(self) -> dict:
+        """
+        获取当前运行指标
+        
+        Returns:
+            请求数、平均延迟、自适应限速的当前速率和并发数、各代理统计
+        """
+        metrics = {
+            "requests": self.budget.used,
+            "request_budget": self.budget.limit,
+            "avg_latency": round(self.budget.avg_latency, 3),
+        }
+        metrics["single_flight"] = self.single_flight.stats()
+        metrics["connections"] = self.connection_stats.snapshot()
+        metrics["bandwidth"] = merge_endpoints(
+            self.connection_stats, *([e.connections for e in self.proxy_pool.entries] if self.proxy_pool else [])
+        )
+        if self.controller:
+            metrics["adaptive"] = self.controller.metrics()
+        if self.proxy_pool:
+            metrics["proxies"] = self.proxy_pool.stats()
+        if self.dead_letters:
+            metrics["dead_letters"] = self.dead_letters.stats()
+        if self.profiles:
+            metrics["profiles"] = self.profiles.stats()
+        metrics["phases"] = PHASES.snapshot()
+        return metrics
     
     def get_hashtag_users(self, hashtag: str, max_posts: Optional[int] = None) -> list[dict]:
         """
@@ -297,106 +582,49 @@ class IGSpider:
         Returns:
             用户信息列表
         """
-        import uuid
-        
         if max_posts is None:
             max_posts = CONFIG.get("max_posts_per_hashtag", 50)
         
         users = {}
+        if max_posts <= 0:
+            return []
         print(f"\n📌 正在获取话题 #{hashtag} 下的用户...")
         
-        # 使用 Instagram 搜索 API (你提供的实际接口)
-        api_url = "https://www.instagram.com/api/v1/fbsearch/web/top_serp/"
-        
-        # 生成 rank_token
-        rank_token = str(uuid.uuid4())
-        
-        params = {
-            "enable_metadata": "true",
-            "query": f"#{hashtag}",
-            "search_session_id": "",
-            "rank_token": rank_token,
-        }
-        
-        # 添加必要的 headers
-        self.session.headers.update({
-            "X-IG-App-ID": "936619743392459",
-        })
-        
         # 收集原始 media 数据
         all_raw_medias = []
+        next_max_id = None
+        
+        if self.storage:
+            self.storage.start_run("hashtag_users", hashtag=hashtag, max_posts=max_posts)
         
         try:
-            next_max_id = None
+            save_raw = CONFIG.get("save_raw_json", True)
             
-            while len(users) < max_posts:
-                if next_max_id:
-                    params["next_max_id"] = next_max_id
-                
-                print(f"  请求 API...")
-                data = self._api_request(api_url, params)
-                
-                if not data:
-                    print("✗ 无法获取话题数据")
-                    break
+            for media_item, next_max_id in self.iter_hashtag_medias(hashtag):
+                # 不保存原始数据时不在内存中保留完整的 media 对象
+                if save_raw:
+                    all_raw_medias.append(media_item)
                 
-                # 打印返回的数据结构（调试用）
-                print(f"  返回数据 keys: {list(data.keys())}")
-                
-                # 解析返回的数据 - 适配多种可能的结构
-                medias = self._extract_medias_from_response(data)
-                
-                # 收集原始数据
-                all_raw_medias.extend(medias)
-                
-                if not medias:
-                    print("  没有找到媒体数据")
-                    break
-                
-                print(f"  找到 {len(medias)} 个帖子")
-                
-                for media_item in medias:
-                    if len(users) >= max_posts:
-                        break
-                    
-                    # 处理数据结构: media_item -> media -> caption -> user
-                    media = media_item.get("media", media_item)
-                    caption = media.get("caption") or {}
-                    user = caption.get("user") or {}
-                    location = media.get("location") or {}
+                media = media_item.get("media", media_item)
+                username = ((media.get("caption") or {}).get("user") or {}).get("username")
+                if username and username not in users:
+                    record = self._hashtag_user_record(media_item)
+                    users[username] = record
+                    print(f"  [{len(users)}/{max_posts}] 用户: @{username}")
                     
-                    username = user.get("username")
-                    if username and username not in users:
-                        # 固定字段，按照 JSON 结构，缺失则为 None
-                        users[username] = {
-                             # caption.user 字段
-                            "username": user.get("username"),
-                            "full_name": user.get("full_name"),
-                            # media 字段
-                            "pk": media.get("pk"),
-                            "like_count": media.get("like_count"),
-                            "comment_count": media.get("comment_count"),
-                             # location 字段
-                            "location_name": location.get("name"),
-                            "location_address": location.get("address"),
-                            "location_city": location.get("city"),
-                            "location_short_name": location.get("short_name"),
-                            # caption 字段
-                            "content_type": caption.get("content_type"),
-                            "text": caption.get("text"),
-                            "text_translation": caption.get("text_translation"),
-                        }
-                        print(f"  [{len(users)}/{max_posts}] 用户: @{username}")
+                    # 新增的记录写入存储（存储内部按批次提交）
+                    if self.storage:
+                        self.storage.add_posts([record], hashtag)
                 
-                # 获取下一页 - next_max_id 在 media_grid 下面
-                media_grid = data.get("media_grid", {})
-                next_max_id = media_grid.get("next_max_id") or data.get("next_max_id")
-                if not next_max_id:
-                    print("  没有更多数据")
+                # 够数后立即停止，不再请求下一页
+                if len(users) >= max_posts:
                     break
             
             print(f"✓ 共获取 {len(users)} 个唯一用户")
             
+            if self.storage:
+                self.storage.finish_run()
+            
             # 保存原始 media 数据
             if all_raw_medias:
                 self.save_raw_medias(all_raw_medias, f"hashtag_{hashtag}_medias")
@@ -410,66 +638,251 @@ class IGSpider:
             
         except Exception as e:
             print(f"✗ 获取话题失败: {e}")
+            self._note_error(type(e).__name__)
             import traceback
             traceback.print_exc()
             return []
     
-    def get_hashtag_posts_with_comments(self, hashtag: str, max_posts: int = 10, 
-                                         max_comments_per_post: int = 50) -> dict:
+    def iter_hashtag_medias(self, hashtag: str, cursor: Optional[str] = None, max_pages: Optional[int] = None,
+                            params: Optional[dict] = None) -> Iterator[tuple[dict, Optional[str]]]:
         """
-        获取话题下的帖子及其评论
+        逐页获取话题搜索结果，每解析一页就逐条产出，调用方可以随时停止
+        下一页只在上一页消费完后才请求
         
         Args:
             hashtag: 话题标签（不含#号）
-            max_posts: 最多获取的帖子数量
-            max_comments_per_post: 每个帖子最多获取的评论数量
+            cursor: 分页游标（next_max_id），None 表示从第一页开始
+            max_pages: 最多请求的页数，None 表示不限制
+            params: 续抓时沿用的请求参数（如失败记录中保存的参数），游标属于原搜索会话，
+                必须和原来的 rank_token / search_session_id 一起使用；None 表示新建搜索会话
+        
+        Yields:
+            (media_item, next_cursor)：原始 media 数据和所在页的下一页游标，
+            把 next_cursor 传给 cursor 参数可以从下一页继续，最后一页为 None
+        """
+        import uuid
+        
+        # 使用 Instagram 搜索 API (你提供的实际接口)
+        api_url = "https://www.instagram.com/api/v1/fbsearch/web/top_serp/"
+        
+        if params:
+            params = dict(params)
+        else:
+            params = {
+                "enable_metadata": "true",
+                "query": f"#{hashtag}",
+                "search_session_id": "",
+                "rank_token": str(uuid.uuid4()),
+            }
+        
+        pages = 0
+        while max_pages is None or pages < max_pages:
+            pages += 1
+            if cursor:
+                params["next_max_id"] = cursor
+            
+            print(f"  请求 API...")
+            data = self._api_request(api_url, params, {"kind": "hashtag", "hashtag": hashtag, "cursor": cursor})
+            
+            if not data:
+                print("✗ 无法获取话题数据")
+                return
+            
+            # 打印返回的数据结构（调试用）
+            print(f"  返回数据 keys: {list(data.keys())}")
+            
+            # 解析返回的数据 - 适配多种可能的结构
+            medias = self._extract_medias_from_response(data)
+            self._index_medias(medias)
+            
+            if not medias:
+                print("  没有找到媒体数据")
+                return
+            
+            print(f"  找到 {len(medias)} 个帖子")
+            
+            # 下一页 - next_max_id 在 media_grid 下面
+            cursor = data.get("media_grid", {}).get("next_max_id") or data.get("next_max_id")
+            self.last_next_max_id = cursor
+            
+            for media_item in medias:
+                yield media_item, cursor
+            
+            if not cursor:
+                print("  没有更多数据")
+                return
+    
+    @PHASES.timed("extract")
+    def _hashtag_user_record(self, media_item: dict) -> dict:
+        """把一条话题搜索结果转换为用户记录（只提取 self.hashtag_columns 中的字段）"""
+        # 处理数据结构: media_item -> media -> caption -> user
+        media = media_item.get("media", media_item)
+        caption = media.get("caption") or {}
+        user = caption.get("user") or {}
+        location = media.get("location") or {}
+        
+        # 固定字段，按照 JSON 结构，缺失则为 None
+        getters = self.HASHTAG_FIELD_GETTERS
+        return {field: getters[field](media, caption, user, location) for field in self.hashtag_columns}
+    
+    @classmethod
+    def build_hashtag_record(cls, media_item: dict, columns: list) -> dict:
+        """
+        不需要实例的 _hashtag_user_record，供离线重新导出（子进程中）使用
+        
+        Args:
+            media_item: 原始 media 数据（*_raw.json 中的一项）
+            columns: 输出列
+        """
+        media = media_item.get("media", media_item)
+        caption = media.get("caption") or {}
+        user = caption.get("user") or {}
+        location = media.get("location") or {}
+        getters = cls.HASHTAG_FIELD_GETTERS
+        return {field: getters[field](media, caption, user, location) for field in columns}
+    
+    def _collect_hashtag_medias(self, hashtag: str, max_posts: int, max_pages: Optional[int] = None) -> list[dict]:
+        """
+        分页收集话题帖子（去掉外层包装，只保留有 pk 的帖子）
+        
+        Args:
+            hashtag: 话题标签（不含#号）
+            max_posts: 最多收集的帖子数量
+            max_pages: 最多请求的搜索页数
         
         Returns:
-            {post_pk: {post_info, comments: [...]}, ...}
+            media 数据列表
         """
-        print(f"\n📌 正在获取话题 #{hashtag} 下的帖子及评论...")
+        medias = {}
+        for media_item, _ in self.iter_hashtag_medias(hashtag, max_pages=max_pages):
+            media = media_item.get("media", media_item)
+            if media.get("pk"):
+                medias.setdefault(media["pk"], media)
+            if len(medias) >= max_posts:
+                break
+        return list(medias.values())
+    
+    def search_hashtag_medias(self, hashtag: str, max_posts: Optional[int] = None) -> list[dict]:
+        """
+        获取话题搜索第一页的帖子（只请求一次）
         
-        # 先获取话题下的帖子
-        posts_data = {}
+        Args:
+            hashtag: 话题标签（不含#号）
+            max_posts: 最多返回的帖子数量，None 表示不限制
         
-        # 使用搜索 API
+        Returns:
+            media 数据列表（已去掉外层包装，只保留有 pk 的帖子）
+        """
         import uuid
-        api_url = "https://www.instagram.com/api/v1/fbsearch/web/top_serp/"
-        rank_token = str(uuid.uuid4())
         
         params = {
             "enable_metadata": "true",
             "query": f"#{hashtag}",
             "search_session_id": "",
-            "rank_token": rank_token,
+            "rank_token": str(uuid.uuid4()),
         }
         
-        self.session.headers.update({
-            "X-IG-App-ID": "936619743392459",
-        })
+        print(f"  获取帖子列表...")
+        data = self._api_request("https://www.instagram.com/api/v1/fbsearch/web/top_serp/", params,
+                                 {"kind": "hashtag", "hashtag": hashtag, "cursor": None})
+        
+        if not data:
+            print("✗ 无法获取话题数据")
+            return []
+        
+        medias = []
+        media_items = self._extract_medias_from_response(data)
+        self._index_medias(media_items)
+        for media_item in media_items:
+            media = media_item.get("media", media_item)
+            if media.get("pk"):
+                medias.append(media)
+        
+        if not medias:
+            print("✗ 没有找到帖子")
+        
+        return medias[:max_posts] if max_posts else medias
+    
+    def get_hashtag_posts_with_comments(self, hashtag: str, max_posts: int = 10, 
+                                         max_comments_per_post: int = 50,
+                                         time_limit: Optional[float] = None,
+                                         since: Optional[float] = None,
+                                         until: Optional[float] = None,
+                                         sample_budget: Optional[int] = None,
+                                         sample_pages: Optional[int] = None,
+                                         child_rate: Optional[float] = None,
+                                         seed: Optional[int] = None) -> dict:
+        """
+        获取话题下的帖子及其评论
+        帖子、评论分页、子评论分页统一放入优先级队列，按帖子价值从高到低抓取，
+        请求预算或时间限制用尽时，已采集的是最有价值的部分
+        
+        设置 sample_budget 时为分层抽样模式：先收集最多 max_posts 个帖子作为抽样框，
+        按 comment_count 分层后在 sample_budget 个请求内抽取帖子，每个帖子只取 sample_pages 页父评论，
+        子评论串按 child_rate 抽取（只取第一页），抽样权重写入每个帖子的 "sample" 和 self.last_sample
+        
+        Args:
+            hashtag: 话题标签（不含#号）
+            max_posts: 最多获取的帖子数量（抽样模式下为抽样框大小）
+            max_comments_per_post: 每个帖子最多获取的评论数量
+            time_limit: 时间限制（秒），缺省使用 CONFIG["time_limit"]
+            since: 只保留该时间戳之后的评论，整页更早时停止翻页
+            until: 只保留该时间戳之前的评论
+            sample_budget: 抽样模式的总请求数（含搜索请求），None 表示不抽样
+            sample_pages: 抽样模式每个帖子获取的父评论页数，缺省使用 CONFIG["sample_pages_per_post"]
+            child_rate: 抽样模式子评论串的抽样比例，缺省使用 CONFIG["sample_child_rate"]
+            seed: 抽样随机种子，固定后结果可复现
+        
+        Returns:
+            {post_pk: {post_info, comments: [...]}, ...}
+        """
+        print(f"\n📌 正在获取话题 #{hashtag} 下的帖子及评论...")
+        
+        if time_limit is None:
+            time_limit = CONFIG.get("time_limit")
+        
+        sampling = sample_budget is not None
+        if sampling:
+            sample_pages = sample_pages or CONFIG.get("sample_pages_per_post", 1)
+            if child_rate is None:
+                child_rate = CONFIG.get("sample_child_rate", 0.2)
+            request_limit = self.budget.used + sample_budget
+            rng = random.Random(seed)
+        else:
+            sample_pages = child_rate = request_limit = rng = None
+        self.last_sample = None
+        
+        # 先获取话题下的帖子，设置了内存上限时已完成的帖子可以落盘
+        posts_data = SpillablePosts() if CONFIG.get("memory_limit_mb") else {}
         
         try:
-            print(f"  获取帖子列表...")
-            data = self._api_request(api_url, params)
-            
-            if not data:
-                print("✗ 无法获取话题数据")
-                return {}
-            
-            medias = self._extract_medias_from_response(data)
+            if sampling:
+                # 抽样框最多使用一半预算
+                medias = self._collect_hashtag_medias(hashtag, max_posts, max(sample_budget // 2, 1))
+            else:
+                medias = self.search_hashtag_medias(hashtag)
             
             if not medias:
-                print("✗ 没有找到帖子")
                 return {}
             
+            if sampling:
+                frame_size = len(medias)
+                medias, self.last_sample = draw_sample(
+                    medias, request_limit - self.budget.used, sample_pages, child_rate, rng=rng
+                )
+                self.last_sample.update({"hashtag": hashtag, "seed": seed, "frame_size": frame_size})
+                strata = ", ".join(f"{k}: {v['sampled']}/{v['population']}" for k, v in self.last_sample["strata"].items())
+                print(f"  抽样框 {frame_size} 个帖子，分层抽取 {len(medias)} 个（{strata}）")
+                max_posts = len(medias)
+            
             print(f"  找到 {len(medias)} 个帖子，开始获取评论...")
             
-            count = 0
-            for media_item in medias:
-                if count >= max_posts:
+            frontier = CrawlFrontier(time_limit=time_limit)
+            
+            for media in medias:
+                if len(posts_data) >= max_posts:
                     break
                 
-                media = media_item.get("media", media_item)
                 media_pk = media.get("pk")
                 caption = media.get("caption") or {}
                 user = caption.get("user") or {}
@@ -492,27 +905,263 @@ class IGSpider:
                     "comments": []
                 }
                 
-                print(f"\n  [{count + 1}/{max_posts}] 帖子 {media_pk} - @{user.get('username', 'N/A')}")
-                
-                # 获取该帖子的评论
-                comment_users = self._get_post_comments_list(str(media_pk), max_comments_per_post)
-                posts_data[media_pk]["comments"] = comment_users
-                
-                print(f"    获取到 {len(comment_users)} 条评论")
-                
-                count += 1
+                # 抽样模式下所有帖子同等优先，预算提前用尽时不偏向热门帖子
+                frontier.push({"type": "post", "media_id": media_pk}, 1.0 if sampling else frontier.score_post(media))
+            
+            stats = self._crawl_frontier(frontier, posts_data, max_comments_per_post, since, until,
+                                         max_pages=sample_pages, child_rate=child_rate,
+                                         request_limit=request_limit, rng=rng)
+            
+            if sampling:
+                apply_crawl_stats(self.last_sample, stats)
+                for media_pk in posts_data:
+                    post_data = posts_data[media_pk]
+                    post_data["sample"] = self.last_sample["posts"][media_pk]
+                    # 已落盘的帖子需要写回
+                    posts_data[media_pk] = post_data
+            
+            if self.storage:
+                self.storage.start_run("hashtag_posts_comments", hashtag=hashtag, max_posts=max_posts,
+                                       max_comments_per_post=max_comments_per_post)
+                self.storage.add_posts_with_comments(posts_data, hashtag)
+                self.storage.finish_run()
             
             print(f"\n✓ 共获取 {len(posts_data)} 个帖子及其评论")
+            if isinstance(posts_data, SpillablePosts) and posts_data.spilled:
+                print(f"   其中 {posts_data.spilled} 个帖子已写入磁盘，导出时逐个读取")
             return posts_data
             
         except Exception as e:
             print(f"✗ 获取话题帖子及评论失败: {e}")
+            self._note_error(type(e).__name__)
             import traceback
             traceback.print_exc()
             return {}
     
+    def _crawl_frontier(self, frontier: CrawlFrontier, posts_data: dict, max_comments: int,
+                        since: Optional[float] = None, until: Optional[float] = None,
+                        max_pages: Optional[int] = None, child_rate: Optional[float] = None,
+                        request_limit: Optional[int] = None, rng: Optional[random.Random] = None) -> dict:
+        """
+        按优先级执行评论分页和子评论分页任务
+        
+        Args:
+            frontier: 已放入帖子任务的优先级队列
+            posts_data: {post_pk: {post_info, comments}, ...}，评论按树形顺序写回 comments；
+                        为 SpillablePosts 时，帖子的任务全部完成后立即写回并交给它决定是否落盘
+            max_comments: 每个帖子最多获取的评论数量（含子评论）
+            since: 时间窗口起点（时间戳），None 表示不限制
+            until: 时间窗口终点（时间戳），None 表示不限制
+            max_pages: 每个帖子最多获取的父评论页数，None 表示不限制
+            child_rate: 子评论串抽样比例（抽中的只取第一页），None 表示全部获取并分页
+            request_limit: budget.used 达到该值后停止，None 表示只受 self.budget 限制
+            rng: 子评论串抽样使用的随机数生成器
+        
+        Returns:
+            每个帖子的抓取统计 {post_pk: {pages, covered, complete, child_threads, child_threads_fetched}}
+        """
+        # 每个帖子的父评论列表和 {父评论pk: 子评论列表}
+        parents = {media_pk: [] for media_pk in posts_data}
+        children = {media_pk: {} for media_pk in posts_data}
+        stats = {media_pk: {"pages": 0, "covered": 0, "complete": False,
+                            "child_threads": 0, "child_threads_fetched": 0} for media_pk in posts_data}
+        rng = rng or random
+        
+        # 每个帖子在队列中尚未执行的任务数，降为 0 时该帖子已完成
+        pending = {media_pk: 1 for media_pk in posts_data}
+        finished = set()
+        
+        def collected(media_pk) -> int:
+            return len(parents[media_pk]) + sum(len(c) for c in children[media_pk].values())
+        
+        def push(task: dict, score: float):
+            pending[task["media_id"]] += 1
+            frontier.push(task, score)
+        
+        def finish(media_pk):
+            """按树形顺序（父评论后跟随其子评论）写回，释放中间数据"""
+            if media_pk in finished:
+                return
+            finished.add(media_pk)
+            comments = []
+            for parent in parents.pop(media_pk):
+                comments.append(parent)
+                comments.extend(children[media_pk].get(parent["pk"], []))
+            del children[media_pk]
+            post_data = posts_data[media_pk]
+            post_data["comments"] = comments
+            print(f"    帖子 {media_pk} 获取到 {len(comments)} 条评论")
+            if isinstance(posts_data, SpillablePosts):
+                posts_data.release(media_pk)
+        
+        while len(frontier):
+            if self.budget.exhausted:
+                print(f"⚠ 请求预算已用尽，停止获取评论（{self.budget.summary()}）")
+                break
+            if request_limit is not None and self.budget.used >= request_limit:
+                print(f"⚠ 抽样预算已用尽，停止获取评论（{self.budget.summary()}）")
+                break
+            
+            task = frontier.pop()
+            if task is None:
+                print("⚠ 已达到时间限制，停止获取评论")
+                break
+            
+            media_pk = task["media_id"]
+            pending[media_pk] -= 1
+            try:
+                remaining = max_comments - collected(media_pk)
+                if remaining <= 0:
+                    continue
+                
+                media_id = str(media_pk)
+                
+                if task["type"] in ("post", "comments"):
+                    if task["type"] == "post":
+                        print(f"\n  帖子 {media_id} - @{posts_data[media_pk]['post_info'].get('username', 'N/A')}")
+                    
+                    api_url = f"https://www.instagram.com/api/v1/media/{media_id}/comments/"
+                    params = {
+                        "can_support_threading": "true",
+                        "permalink_enabled": "false",
+                    }
+                    if task.get("cursor"):
+                        params["min_id"] = task["cursor"]
+                    
+                    data = self._api_request(api_url, params,
+                                             {"kind": "comments", "media_id": media_id, "cursor": task.get("cursor")})
+                    if not data:
+                        continue
+                    
+                    post_stats = stats[media_pk]
+                    post_stats["pages"] += 1
+                    
+                    comments = data.get("comments", [])
+                    for comment in comments:
+                        if collected(media_pk) >= max_comments:
+                            break
+                        
+                        # 窗口外的父评论不保存，也不获取其子评论
+                        if not self._in_window(comment, since, until):
+                            continue
+                        
+                        parents[media_pk].append(self._comment_record(comment, media_id))
+                        
+                        child_count = comment.get("child_comment_count", 0)
+                        post_stats["covered"] += 1 + child_count
+                        if child_count > 0 and comment.get("pk"):
+                            post_stats["child_threads"] += 1
+                            if child_rate is not None and rng.random() >= child_rate:
+                                continue
+                            post_stats["child_threads_fetched"] += 1
+                            children[media_pk][comment["pk"]] = []
+                            push(
+                                {"type": "child", "media_id": media_pk, "comment_pk": comment["pk"], "cursor": ""},
+                                frontier.score_child(task["score"], child_count)
+                            )
+                    
+                    next_cursor = data.get("next_min_id")
+                    page = task.get("page", 1)
+                    if not next_cursor:
+                        post_stats["complete"] = True
+                    elif (collected(media_pk) < max_comments and not self._page_before(comments, since)
+                          and (max_pages is None or page < max_pages)):
+                        push(
+                            {"type": "comments", "media_id": media_pk, "cursor": next_cursor, "page": page + 1},
+                            frontier.score_page(task["score"])
+                        )
+                
+                elif task["type"] == "child":
+                    comment_pk = task["comment_pk"]
+                    api_url = CHILD_COMMENTS_API.format(media_id=media_id, comment_pk=comment_pk)
+                    params = {
+                        "min_id": task.get("cursor", ""),
+                        "is_chronological": "true",
+                        "paging_direction": "view_more",
+                    }
+                    
+                    data = self._api_request(api_url, params, {
+                        "kind": "child", "media_id": media_id, "comment_pk": str(comment_pk), "cursor": task.get("cursor"),
+                    })
+                    if not data:
+                        continue
+                    
+                    child_comments = data.get("child_comments", [])
+                    child_list = children[media_pk][comment_pk]
+                    self._process_child_comments_page(
+                        [c for c in child_comments if self._in_window(c, since, until)],
+                        child_list, media_id, len(child_list) + remaining
+                    )
+                    
+                    # 抽样模式下子评论串只取第一页
+                    next_cursor = data.get("next_min_id")
+                    if (next_cursor and child_rate is None and collected(media_pk) < max_comments
+                            and not self._page_after(child_comments, until)):
+                        push(
+                            {"type": "child", "media_id": media_pk, "comment_pk": comment_pk, "cursor": next_cursor},
+                            frontier.score_page(task["score"])
+                        )
+            finally:
+                if not pending[media_pk]:
+                    finish(media_pk)
+        
+        # 预算或时间用尽时队列中剩余任务的帖子
+        for media_pk in list(parents):
+            finish(media_pk)
+        
+        return stats
+    
+    @PHASES.timed("extract")
+    def _comment_record(self, comment: dict, media_id: str, level: str = "") -> dict:
+        """
+        把一条评论转换为输出记录（只提取 self.comment_columns 中的字段）
+        
+        Args:
+            comment: 接口返回的评论
+            media_id: 帖子 media_id
+            level: 层级标记，父评论为空，子评论为缩进标记
+        """
+        user = comment.get("user", {})
+        if self.cooccur and comment.get("pk"):
+            self.cooccur.add(f"c:{comment['pk']}", comment.get("text"))
+        getters = self.COMMENT_FIELD_GETTERS
+        return {field: getters[field](comment, user, media_id, level) for field in self.comment_columns}
+    
+    def _child_comment_record(self, child: dict, media_id: str) -> dict:
+        """把一条子评论转换为输出记录"""
+        return self._comment_record(child, media_id, level="  └─")  # 子评论缩进标记
+    
+    @staticmethod
+    def _in_window(comment: dict, since: Optional[float], until: Optional[float]) -> bool:
+        """
+        评论的 created_at 是否在 [since, until] 时间窗口内（未设置的一端不限制）
+        没有 created_at 的评论时间未知，保留
+        """
+        created_at = comment.get("created_at")
+        if created_at is None:
+            return True
+        return (since is None or created_at >= since) and (until is None or created_at <= until)
+    
+    @staticmethod
+    def _page_before(comments: list, since: Optional[float]) -> bool:
+        """
+        整页评论都早于 since（父评论从新到旧翻页，之后的页只会更早）
+        只看有 created_at 的评论，整页都没有时间时不能判断，继续翻页
+        """
+        times = [c["created_at"] for c in comments if c.get("created_at") is not None]
+        return since is not None and bool(times) and all(t < since for t in times)
+    
+    @staticmethod
+    def _page_after(comments: list, until: Optional[float]) -> bool:
+        """
+        整页子评论都晚于 until（子评论按时间正序翻页，之后的页只会更晚）
+        只看有 created_at 的子评论，整页都没有时间时不能判断，继续翻页
+        """
+        times = [c["created_at"] for c in comments if c.get("created_at") is not None]
+        return until is not None and bool(times) and all(t > until for t in times)
+    
     def _get_post_comments_list(self, media_id: str, max_comments: int) -> list[dict]:
-        """获取帖子评论列表（不去重，支持分页）"""
+        """获取帖子评论列表（不去重，支持分页），中途失败时返回已获取的部分并记录失败的分页"""
         comments_list = []
         
         api_url = f"https://www.instagram.com/api/v1/media/{media_id}/comments/"
@@ -522,7 +1171,7 @@ class IGSpider:
         }
         
         try:
-            data = self._api_request(api_url, params)
+            data = self._api_request(api_url, params, {"kind": "comments", "media_id": media_id, "cursor": None})
             
             if not data:
                 return []
@@ -535,7 +1184,8 @@ class IGSpider:
             next_cursor = data.get("next_min_id")
             while next_cursor and len(comments_list) < max_comments:
                 params["min_id"] = next_cursor
-                data = self._api_request(api_url, params)
+                data = self._api_request(api_url, params,
+                                         {"kind": "comments", "media_id": media_id, "cursor": next_cursor})
                 
                 if not data:
                     break
@@ -547,27 +1197,21 @@ class IGSpider:
             
             return comments_list
             
-        except Exception:
-            return []
+        except Exception as e:
+            print(f"⚠ 获取帖子 {media_id} 评论中断: {e}")
+            self._note_error(type(e).__name__)
+            self._record_failure(api_url, params, {"kind": "comments", "media_id": media_id,
+                                                   "cursor": params.get("min_id")}, type(e).__name__)
+            return comments_list
     
+    @PHASES.timed("extract")
     def _process_comments_page(self, comments: list, comments_list: list, media_id: str, max_comments: int):
         """处理一页评论数据"""
         for comment in comments:
             if len(comments_list) >= max_comments:
                 break
             
-            user = comment.get("user", {})
-            comment_data = {
-                "level": "",
-                "username": user.get("username", ""),
-                "full_name": user.get("full_name", ""),
-                "text": comment.get("text", ""),
-                "comment_like_count": comment.get("comment_like_count", 0),
-                "child_comment_count": comment.get("child_comment_count", 0),
-                "pk": comment.get("pk"),
-                "media_id": media_id,
-            }
-            comments_list.append(comment_data)
+            comments_list.append(self._comment_record(comment, media_id))
             
             # 获取子评论
             child_count = comment.get("child_comment_count", 0)
@@ -578,62 +1222,38 @@ class IGSpider:
                     comments_list.extend(child_comments)
     
     def _get_child_comments_list(self, media_id: str, comment_pk: str, max_count: int) -> list[dict]:
-        """获取子评论列表（支持分页）"""
+        """获取子评论列表（支持分页），中途失败时返回已获取的部分并记录失败的分页"""
         child_list = []
+        if max_count <= 0:
+            return child_list
         
-        api_url = f"https://www.instagram.com/api/v1/media/{media_id}/comments/{comment_pk}/child_comments/"
-        params = {
-            "min_id": "",
-            "is_chronological": "true",
-            "paging_direction": "view_more",
-        }
-        
+        # 当前页的游标：产出的 next_cursor 变化说明进入了下一页
+        page_cursor, next_cursor = "", None
         try:
-            data = self._api_request(api_url, params)
-            
-            if not data:
-                return []
-            
-            # 处理第一页子评论
-            child_comments = data.get("child_comments", [])
-            self._process_child_comments_page(child_comments, child_list, media_id, max_count)
-            
-            # 分页获取更多子评论
-            next_cursor = data.get("next_min_id")
-            while next_cursor and len(child_list) < max_count:
-                params["min_id"] = next_cursor
-                data = self._api_request(api_url, params)
-                
-                if not data:
+            for child, cursor in self.iter_child_comments(media_id, comment_pk):
+                if child_list and cursor != next_cursor:
+                    page_cursor = next_cursor
+                next_cursor = cursor
+                child_list.append(child)
+                if len(child_list) >= max_count:
                     break
-                
-                child_comments = data.get("child_comments", [])
-                self._process_child_comments_page(child_comments, child_list, media_id, max_count)
-                
-                next_cursor = data.get("next_min_id")
-            
-            return child_list
-            
-        except Exception:
-            return []
+        except Exception as e:
+            print(f"⚠ 获取评论 {comment_pk} 的子评论中断: {e}")
+            self._note_error(type(e).__name__)
+            api_url = CHILD_COMMENTS_API.format(media_id=media_id, comment_pk=comment_pk)
+            params = {"min_id": page_cursor or "", "is_chronological": "true", "paging_direction": "view_more"}
+            self._record_failure(api_url, params, {"kind": "child", "media_id": str(media_id),
+                                                   "comment_pk": str(comment_pk), "cursor": page_cursor},
+                                 type(e).__name__)
+        return child_list
     
+    @PHASES.timed("extract")
     def _process_child_comments_page(self, child_comments: list, child_list: list, media_id: str, max_count: int):
         """处理一页子评论数据"""
         for child in child_comments:
             if len(child_list) >= max_count:
                 break
-            
-            user = child.get("user", {})
-            child_list.append({
-                "level": "  └─",
-                "username": user.get("username", ""),
-                "full_name": user.get("full_name", ""),
-                "text": child.get("text", ""),
-                "comment_like_count": child.get("comment_like_count", 0),
-                "child_comment_count": 0,
-                "pk": child.get("pk"),
-                "media_id": media_id,
-            })
+            child_list.append(self._child_comment_record(child, media_id))
     
     def save_posts_with_comments(self, posts_data: dict, filename: str) -> str:
         """
@@ -656,67 +1276,80 @@ class IGSpider:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         excel_path = f"{output_dir}/{filename}_{timestamp}.xlsx"
         
-        with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-            sheet_index = 1
+        # 落盘的帖子导出时逐个从磁盘读取，不整体复制到内存
+        posts = posts_data if isinstance(posts_data, SpillablePosts) else dict(posts_data)
+        self._export("excel", self._write_posts_with_comments, excel_path, posts)
+        return excel_path
+    
+    def _write_posts_with_comments(self, excel_path: str, posts_data: dict):
+        """写入帖子及评论 Excel（每个帖子一个 sheet，超出 sheet 数或行数限制时分片）"""
+        sink = ExcelSink(excel_path, self.comment_columns, self.COLUMN_WIDTHS_COMMENT)
+        
+        for sheet_index, post_data in enumerate(posts_data.values(), 1):
+            post_info = post_data["post_info"]
+            comments = post_data["comments"]
             
-            for post_pk, post_data in posts_data.items():
-                post_info = post_data["post_info"]
-                comments = post_data["comments"]
-                
-                # Sheet 名称：序号_用户名（限制长度）
-                username = post_info.get("username", "unknown")[:15]
-                sheet_name = f"{sheet_index}_{username}"[:31]  # Excel sheet 名最长 31 字符
-                
-                # 创建数据
-                rows = []
-                
-                # 第一行：帖子信息（特殊标记）
-                rows.append({
-                    "level": "📌",
-                    "username": post_info.get('username', ''),
-                    "full_name": post_info.get("full_name", ""),
-                    "text": post_info.get("text", ""),
-                    "comment_like_count": f"👍{post_info.get('like_count', 0)}",
-                    "child_comment_count": f"💬{post_info.get('comment_count', 0)}",
-                    "pk": post_info.get("pk"),
-                    "media_id": "",
-                })
-                
-                # 评论数据
-                for comment in comments:
-                    rows.append(comment)
-                
-                if not rows:
-                    rows.append({"username": "无评论"})
-                
-                # 写入 sheet
-                df = pd.DataFrame(rows, columns=self.EXCEL_COLUMNS_COMMENT)
-                df.to_excel(writer, index=False, sheet_name=sheet_name)
-                
-                # 设置列宽
-                worksheet = writer.sheets[sheet_name]
-                column_widths = {
-                    'level': 5,
-                    'username': 30,
-                    'full_name': 30,
-                    'text': 60,
-                    'comment_like_count': 30,
-                    'child_comment_count': 30,
-                    'pk': 20,
-                    'media_id': 20,
-                }
-                
-                for i, col in enumerate(self.EXCEL_COLUMNS_COMMENT):
-                    col_letter = chr(65 + i)
-                    width = column_widths.get(col, 15)
-                    worksheet.column_dimensions[col_letter].width = width
-                
-                sheet_index += 1
+            # Sheet 名称：序号_用户名（限制长度）
+            username = post_info.get("username", "unknown")[:15]
+            sheet_name = f"{sheet_index}_{username}"
+            
+            # 第一行：帖子信息（特殊标记），之后是评论数据
+            rows = [{
+                "level": "📌",
+                "username": post_info.get('username', ''),
+                "full_name": post_info.get("full_name", ""),
+                "text": post_info.get("text", ""),
+                "comment_like_count": f"👍{post_info.get('like_count', 0)}",
+                "child_comment_count": f"💬{post_info.get('comment_count', 0)}",
+                "pk": post_info.get("pk"),
+                "media_id": "",
+            }]
+            rows.extend(comments)
+            
+            sink.add_sheet(sheet_name, rows)
         
-        print(f"📊 已保存Excel: {excel_path}")
+        sink.close()
         print(f"   共 {len(posts_data)} 个 sheet（每个帖子一个）")
-        return excel_path
     
+    def _export(self, fmt: str, func, *args):
+        """
+        写入文件：启用后台导出时交给对应格式的写入线程，否则直接写入
+        
+        Args:
+            fmt: 格式名（excel / json / raw_json）
+            func: 写入函数
+            *args: 写入函数参数
+        """
+        func = PHASES.timed("export")(func)
+        if self.writer:
+            self.writer.submit(fmt, func, *args)
+        else:
+            func(*args)
+    
+    def flush_exports(self) -> list[str]:
+        """
+        等待所有后台写入完成
+        
+        Returns:
+            上次调用以来后台写入失败的错误信息，如 ["excel: PermissionError: ..."]，全部成功时为空
+        """
+        errors = []
+        if self.writer:
+            errors = [f"{fmt}: {type(e).__name__}: {e}" for fmt, e in self.writer.flush()]
+        if self.cooccur:
+            self.cooccur.flush()
+        return errors
+    
+    def _index_medias(self, media_items: list):
+        """把帖子正文加入共现索引"""
+        if not self.cooccur:
+            return
+        for media_item in media_items:
+            media = media_item.get("media", media_item)
+            if media.get("pk"):
+                self.cooccur.add(f"p:{media['pk']}", (media.get("caption") or {}).get("text"))
+    
+    @PHASES.timed("extract")
     def _extract_medias_from_response(self, data: dict) -> list:
         """从 API 响应中提取媒体列表"""
         medias = []
@@ -750,7 +1383,9 @@ class IGSpider:
     
    
     def get_post_comment_users(self, media_id: str, 
-                                max_comments: Optional[int] = None) -> list[dict]:
+                                max_comments: Optional[int] = None,
+                                since: Optional[float] = None,
+                                until: Optional[float] = None) -> list[dict]:
         """
         获取特定帖子下评论用户列表 (通过 API)
         返回树形结构的评论列表（父评论后跟随其子评论）
@@ -758,6 +1393,8 @@ class IGSpider:
         Args:
             media_id: 帖子的 media_id (pk)
             max_comments: 最多获取的评论数量
+            since: 只获取该时间戳之后的评论，整页更早时停止翻页
+            until: 只获取该时间戳之前的评论
         
         Returns:
             评论列表（按树形顺序）
@@ -773,6 +1410,55 @@ class IGSpider:
         comments_list = []  # 使用列表保持顺序
         print(f"\n💬 正在获取帖子 {media_id} 的评论（树形结构）...")
         
+        try:
+            # 树形接口每个子评论串只取一页
+            for comment, _ in self.iter_comments(media_id, paginate_children=False, since=since, until=until):
+                comments_list.append(comment)
+                username, text = comment.get("username", ""), comment.get("text") or ""
+                if comment["level"]:
+                    print(f"      └─ @{username} - {text[:25]}...")
+                else:
+                    print(f"  [{len(comments_list)}] @{username} - {text[:30]}...")
+                
+                # 够数后立即停止，不再请求子评论或下一页
+                if len(comments_list) >= max_comments:
+                    break
+            
+            print(f"✓ 共获取 {len(comments_list)} 条评论（树形结构）")
+            
+            if self.storage:
+                self.storage.start_run("post_comments", media_id=media_id, max_comments=max_comments)
+                self.storage.add_comments(comments_list)
+                self.storage.finish_run()
+            return comments_list
+            
+        except Exception as e:
+            print(f"✗ 获取帖子评论失败: {e}")
+            self._note_error(type(e).__name__)
+            import traceback
+            traceback.print_exc()
+            return []
+    
+    def iter_comments(self, media_id: str, cursor: Optional[str] = None,
+                      paginate_children: bool = True, since: Optional[float] = None,
+                      until: Optional[float] = None) -> Iterator[tuple[dict, Optional[str]]]:
+        """
+        逐页获取帖子评论，按树形顺序（父评论后跟随其子评论）逐条产出
+        子评论在父评论产出之后才请求，调用方提前停止时不会发出多余的请求
+        
+        Args:
+            media_id: 帖子的 media_id (pk)
+            cursor: 父评论分页游标（next_min_id），None 表示从第一页开始
+            paginate_children: 子评论是否分页获取，False 时每个子评论串只取第一页
+            since: 时间窗口起点（时间戳），整页父评论都更早时停止翻页
+            until: 时间窗口终点（时间戳），窗口外的评论不产出
+        
+        Yields:
+            (评论记录, next_cursor)：next_cursor 为该评论所在页的下一页游标，
+            把它传给 cursor 参数可以从下一页继续，最后一页为 None
+        """
+        media_id = str(media_id).strip()
+        
         # 使用评论 API
         api_url = f"https://www.instagram.com/api/v1/media/{media_id}/comments/"
         params = {
@@ -780,148 +1466,215 @@ class IGSpider:
             "permalink_enabled": "false",
         }
         
-        # 添加必要的 headers
-        self.session.headers.update({
-            "X-IG-App-ID": "936619743392459",
-        })
-        
-        try:
-            data = self._api_request(api_url, params)
+        first_page = not cursor
+        while True:
+            if cursor:
+                params["min_id"] = cursor
+            
+            data = self._api_request(api_url, params, {"kind": "comments", "media_id": media_id, "cursor": cursor})
             
             if not data:
-                print("✗ 无法获取评论数据")
-                return []
+                if first_page:
+                    print("✗ 无法获取评论数据")
+                return
             
             # 显示帖子信息
-            caption = data.get("caption", {})
-            if caption:
+            caption = data.get("caption") or {}
+            if first_page and caption:
                 print(f"  帖子作者: @{caption.get('user', {}).get('username', 'N/A')}")
                 print(f"  评论数: {data.get('comment_count', 'N/A')}")
+            first_page = False
             
-            # 解析第一层评论
+            cursor = data.get("next_min_id")
             comments = data.get("comments", [])
             
             for comment in comments:
-                if len(comments_list) >= max_comments:
-                    break
+                # 窗口外的父评论不产出，也不获取其子评论
+                if not self._in_window(comment, since, until):
+                    continue
                 
-                # 添加父评论
-                user = comment.get("user", {})
-                parent_comment = {
-                    "level": "",
-                    "username": user.get("username", ""),
-                    "full_name": user.get("full_name", ""),
-                    "text": comment.get("text", ""),
-                    "comment_like_count": comment.get("comment_like_count", 0),
-                    "child_comment_count": comment.get("child_comment_count", 0),
-                    "pk": comment.get("pk"),
-                    "media_id": media_id,
-                }
-                comments_list.append(parent_comment)
-                print(f"  [{len(comments_list)}] @{user.get('username', '')} - {comment.get('text', '')[:30]}...")
+                yield self._comment_record(comment, media_id), cursor
                 
-                # 获取子评论并紧跟在父评论后面
+                # 子评论紧跟在父评论后面
                 child_count = comment.get("child_comment_count", 0)
-                if child_count > 0 and len(comments_list) < max_comments:
-                    comment_pk = comment.get("pk")
-                    if comment_pk:
-                        print(f"    ↳ 获取 {child_count} 条子评论...")
-                        child_comments = self._get_child_comments_for_tree(
-                            media_id, str(comment_pk), 
-                            max_comments - len(comments_list)
-                        )
-                        comments_list.extend(child_comments)
+                if child_count > 0 and comment.get("pk"):
+                    print(f"    ↳ 获取 {child_count} 条子评论...")
+                    for child, _ in self.iter_child_comments(media_id, str(comment["pk"]),
+                                                             paginate=paginate_children,
+                                                             since=since, until=until):
+                        yield child, cursor
             
-            # 如果有更多第一层评论，继续获取
-            next_cursor = data.get("next_min_id")
-            while next_cursor and len(comments_list) < max_comments:
-                params["min_id"] = next_cursor
-                data = self._api_request(api_url, params)
-                
-                if not data:
-                    break
-                
-                comments = data.get("comments", [])
-                for comment in comments:
-                    if len(comments_list) >= max_comments:
-                        break
-                    
-                    user = comment.get("user", {})
-                    parent_comment = {
-                        "level": "",
-                        "username": user.get("username", ""),
-                        "full_name": user.get("full_name", ""),
-                        "text": comment.get("text", ""),
-                        "comment_like_count": comment.get("comment_like_count", 0),
-                        "child_comment_count": comment.get("child_comment_count", 0),
-                        "pk": comment.get("pk"),
-                        "media_id": media_id,
-                    }
-                    comments_list.append(parent_comment)
-                    print(f"  [{len(comments_list)}] @{user.get('username', '')} - {comment.get('text', '')[:30]}...")
-                    
-                    # 获取子评论
-                    child_count = comment.get("child_comment_count", 0)
-                    if child_count > 0 and len(comments_list) < max_comments:
-                        comment_pk = comment.get("pk")
-                        if comment_pk:
-                            child_comments = self._get_child_comments_for_tree(
-                                media_id, str(comment_pk),
-                                max_comments - len(comments_list)
-                            )
-                            comments_list.extend(child_comments)
-                
-                next_cursor = data.get("next_min_id")
-            
-            print(f"✓ 共获取 {len(comments_list)} 条评论（树形结构）")
-            return comments_list
-            
-        except Exception as e:
-            print(f"✗ 获取帖子评论失败: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+            if not cursor:
+                return
+            if self._page_before(comments, since):
+                print("  已超出时间窗口，停止翻页")
+                return
     
-    def _get_child_comments_for_tree(self, media_id: str, comment_pk: str, max_count: int) -> list:
-        """获取子评论列表（用于树形结构）"""
-        child_list = []
+    def iter_child_comments(self, media_id: str, comment_pk: str, cursor: str = "",
+                            paginate: bool = True, since: Optional[float] = None,
+                            until: Optional[float] = None) -> Iterator[tuple[dict, Optional[str]]]:
+        """
+        逐页获取子评论并逐条产出
         
-        api_url = f"https://i.instagram.com/api/v1/media/{media_id}/comments/{comment_pk}/child_comments/"
+        Args:
+            media_id: 帖子的 media_id (pk)
+            comment_pk: 父评论 pk
+            cursor: 子评论分页游标，空字符串表示从第一页开始
+            paginate: 是否继续请求后续页
+            since: 时间窗口起点（时间戳），窗口外的子评论不产出
+            until: 时间窗口终点（时间戳），整页子评论都更晚时停止翻页
+        
+        Yields:
+            (子评论记录, next_cursor)：next_cursor 为所在页的下一页游标，最后一页为 None
+        """
+        api_url = CHILD_COMMENTS_API.format(media_id=media_id, comment_pk=comment_pk)
         params = {
-            "min_id": "",
+            "min_id": cursor,
             "is_chronological": "true",
             "paging_direction": "view_more",
         }
         
-        try:
-            data = self._api_request(api_url, params)
+        while True:
+            data = self._api_request(api_url, params, {
+                "kind": "child", "media_id": str(media_id), "comment_pk": str(comment_pk), "cursor": params["min_id"],
+            })
             if not data:
-                return child_list
+                return
             
+            cursor = data.get("next_min_id")
             child_comments = data.get("child_comments", [])
-            
             for child in child_comments:
-                if len(child_list) >= max_count:
-                    break
-                
-                user = child.get("user", {})
-                child_data = {
-                    "level": "  └─",  # 子评论缩进标记
-                    "username": user.get("username", ""),
-                    "full_name": user.get("full_name", ""),
-                    "text": child.get("text", ""),
-                    "comment_like_count": child.get("comment_like_count", 0),
-                    "child_comment_count": 0,
-                    "pk": child.get("pk"),
-                    "media_id": media_id,
-                }
-                child_list.append(child_data)
-                print(f"      └─ @{user.get('username', '')} - {child.get('text', '')[:25]}...")
-            
-            return child_list
+                if self._in_window(child, since, until):
+                    yield self._child_comment_record(child, media_id), cursor
             
-        except Exception:
-            return child_list
+            if not cursor or not paginate or self._page_after(child_comments, until):
+                return
+            params["min_id"] = cursor
+    
+    def plan_hashtag_users(self, hashtag: str, max_posts: Optional[int] = None) -> dict:
+        """
+        估算 get_hashtag_users 所需的请求数和耗时（只请求第一页）
+        
+        Args:
+            hashtag: 话题标签（不含#号）
+            max_posts: 最多获取的帖子数量
+        
+        Returns:
+            规划结果字典
+        """
+        import uuid
+        
+        if max_posts is None:
+            max_posts = CONFIG.get("max_posts_per_hashtag", 50)
+        
+        params = {
+            "enable_metadata": "true",
+            "query": f"#{hashtag}",
+            "search_session_id": "",
+            "rank_token": str(uuid.uuid4()),
+        }
+        data = self._api_request("https://www.instagram.com/api/v1/fbsearch/web/top_serp/", params)
+        medias = self._extract_medias_from_response(data) if data else []
+        page_size = len(medias) or SEARCH_PAGE_SIZE
+        
+        requests_count = math.ceil(max_posts / page_size)
+        return {
+            "task": f"话题 #{hashtag} 用户（最多 {max_posts} 个帖子）",
+            "requests": requests_count,
+            "seconds": estimate_seconds(requests_count, self.budget.avg_latency),
+            "budget": self.budget.limit,
+        }
+    
+    def plan_hashtag_posts_with_comments(self, hashtag: str, max_posts: int = 10,
+                                         max_comments_per_post: int = 50) -> dict:
+        """
+        估算 get_hashtag_posts_with_comments 所需的请求数和耗时
+        请求话题第一页，根据每个帖子的 comment_count 推算评论请求数；
+        子评论请求按评论最多的 plan_comment_sample_posts 个帖子第一页评论中的 child_comment_count 推算，
+        这些帖子使用各自的第一页，其余帖子使用它们合并的统计（搜索结果不含子评论数）
+        
+        Args:
+            hashtag: 话题标签（不含#号）
+            max_posts: 最多获取的帖子数量
+            max_comments_per_post: 每个帖子最多获取的评论数量
+        
+        Returns:
+            规划结果字典
+        """
+        medias = self.search_hashtag_medias(hashtag, max_posts)
+        
+        # 评论最多的帖子决定大部分请求数，只对它们请求第一页评论
+        sample_size = CONFIG.get("plan_comment_sample_posts", 3)
+        sampled = sorted((m for m in medias if m.get("comment_count")),
+                         key=lambda m: m["comment_count"], reverse=True)[:sample_size]
+        first_pages = {}
+        for media in sampled:
+            data = self._api_request(f"https://www.instagram.com/api/v1/media/{media['pk']}/comments/", {
+                "can_support_threading": "true",
+                "permalink_enabled": "false",
+            }) or {}
+            if data.get("comments"):
+                first_pages[media["pk"]] = data["comments"]
+        pooled = [c for page in first_pages.values() for c in page]
+        child_stats = child_thread_stats(pooled) if pooled else None
+        
+        posts = []
+        requests_count = 1
+        for media in medias:
+            comment_count = media.get("comment_count", 0) or 0
+            post_requests = estimate_comment_requests(comment_count, max_comments_per_post,
+                                                      first_pages.get(media.get("pk")), child_stats=child_stats)
+            posts.append({
+                "pk": media.get("pk"),
+                "comment_count": comment_count,
+                "requests": post_requests,
+            })
+            requests_count += post_requests
+        
+        return {
+            "task": f"话题 #{hashtag} 帖子及评论（最多 {max_posts} 个帖子 × {max_comments_per_post} 条评论）",
+            "requests": requests_count,
+            "seconds": estimate_seconds(requests_count, self.budget.avg_latency),
+            "posts": posts,
+            "sampled_posts": len(first_pages),
+            "budget": self.budget.limit,
+        }
+    
+    def plan_post_comment_users(self, media_id: str, max_comments: Optional[int] = None) -> dict:
+        """
+        估算 get_post_comment_users 所需的请求数和耗时
+        只请求第一页评论，根据 comment_count 和 child_comment_count 推算
+        
+        Args:
+            media_id: 帖子的 media_id (pk)
+            max_comments: 最多获取的评论数量
+        
+        Returns:
+            规划结果字典
+        """
+        if max_comments is None:
+            max_comments = CONFIG.get("max_comments_per_post", 100)
+        
+        media_id = media_id.strip()
+        api_url = f"https://www.instagram.com/api/v1/media/{media_id}/comments/"
+        params = {
+            "can_support_threading": "true",
+            "permalink_enabled": "false",
+        }
+        data = self._api_request(api_url, params) or {}
+        comments = data.get("comments", [])
+        comment_count = data.get("comment_count") or len(comments)
+        
+        # 树形接口每个子评论串只请求一页
+        requests_count = estimate_comment_requests(
+            comment_count, max_comments, comments, paginate_children=False
+        )
+        return {
+            "task": f"帖子 {media_id} 评论（最多 {max_comments} 条）",
+            "requests": requests_count,
+            "seconds": estimate_seconds(requests_count, self.budget.avg_latency),
+            "budget": self.budget.limit,
+        }
     
     def save_raw_medias(self, medias: list[dict], filename: str) -> str:
         """
@@ -948,10 +1701,7 @@ class IGSpider:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         json_path = f"{output_dir}/{filename}_{timestamp}_raw.json"
         
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(medias, f, ensure_ascii=False, indent=2)
-        
-        print(f"📄 已保存原始 JSON: {json_path}")
+        self._export("raw_json", self._write_json_rows, json_path, list(medias), "📄 已保存原始 JSON")
         return json_path
     
     # 话题用户 Excel 列顺序
@@ -982,6 +1732,89 @@ class IGSpider:
         "media_id",
     ]
     
+    # Excel 列宽
+    COLUMN_WIDTHS_HASHTAG = {
+        'username': 20,
+        'full_name': 25,
+        'pk': 25,
+        'like_count': 12,
+        'comment_count': 15,
+        'location_name': 25,
+        'location_address': 30,
+        'location_city': 20,
+        'location_short_name': 25,
+        'content_type': 15,
+        'text': 80,
+        'text_translation': 80,
+    }
+    
+    COLUMN_WIDTHS_COMMENT = {
+        'level': 5,
+        'username': 30,
+        'full_name': 30,
+        'text': 60,
+        'comment_like_count': 30,
+        'child_comment_count': 30,
+        'pk': 20,
+        'media_id': 20,
+    }
+    
+    # 字段投影时始终保留的字段（去重、树形顺序和存储依赖它们）
+    REQUIRED_FIELDS_HASHTAG = ("pk",)
+    REQUIRED_FIELDS_COMMENT = ("level", "pk", "media_id")
+    
+    # 话题用户字段的提取函数 (media, caption, user, location) -> 值，未选中的字段不会被提取
+    HASHTAG_FIELD_GETTERS = {
+        # caption.user 字段
+        "username": lambda media, caption, user, location: user.get("username"),
+        "full_name": lambda media, caption, user, location: user.get("full_name"),
+        # media 字段
+        "pk": lambda media, caption, user, location: media.get("pk"),
+        "like_count": lambda media, caption, user, location: media.get("like_count"),
+        "comment_count": lambda media, caption, user, location: media.get("comment_count"),
+        # location 字段
+        "location_name": lambda media, caption, user, location: location.get("name"),
+        "location_address": lambda media, caption, user, location: location.get("address"),
+        "location_city": lambda media, caption, user, location: location.get("city"),
+        "location_short_name": lambda media, caption, user, location: location.get("short_name"),
+        # caption 字段
+        "content_type": lambda media, caption, user, location: caption.get("content_type"),
+        "text": lambda media, caption, user, location: caption.get("text"),
+        "text_translation": lambda media, caption, user, location: caption.get("text_translation"),
+    }
+    
+    # 评论字段的提取函数 (comment, user, media_id, level) -> 值
+    COMMENT_FIELD_GETTERS = {
+        "level": lambda comment, user, media_id, level: level,
+        "username": lambda comment, user, media_id, level: user.get("username", ""),
+        "full_name": lambda comment, user, media_id, level: user.get("full_name", ""),
+        "text": lambda comment, user, media_id, level: comment.get("text", ""),
+        "comment_like_count": lambda comment, user, media_id, level: comment.get("comment_like_count", 0),
+        "child_comment_count": lambda comment, user, media_id, level: comment.get("child_comment_count", 0),
+        "pk": lambda comment, user, media_id, level: comment.get("pk"),
+        "media_id": lambda comment, user, media_id, level: media_id,
+    }
+    
+    def set_fields(self, hashtag_fields: Optional[list[str]] = None, comment_fields: Optional[list[str]] = None):
+        """
+        设置字段投影：只提取、保存选中的列，未选中的字段在解析时就不会生成
+        
+        Args:
+            hashtag_fields: 话题用户字段（EXCEL_COLUMNS_HASHTAG 的子集），None 表示全部
+            comment_fields: 评论字段（EXCEL_COLUMNS_COMMENT 的子集），None 表示全部
+        """
+        self.hashtag_columns = self._project(self.EXCEL_COLUMNS_HASHTAG, hashtag_fields, self.REQUIRED_FIELDS_HASHTAG)
+        self.comment_columns = self._project(self.EXCEL_COLUMNS_COMMENT, comment_fields, self.REQUIRED_FIELDS_COMMENT)
+    
+    @staticmethod
+    def _project(columns: list, fields: Optional[list[str]], required: tuple) -> list:
+        if fields is None:
+            return list(columns)
+        unknown = set(fields) - set(columns)
+        if unknown:
+            raise ValueError(f"未知字段: {', '.join(sorted(unknown))}，可选: {', '.join(columns)}")
+        return [col for col in columns if col in fields or col in required]
+    
     def save_results(self, data: list[dict], filename: str, data_type: str = "hashtag") -> dict[str, str]:
         """
         保存结果到文件
@@ -1000,33 +1833,17 @@ class IGSpider:
         
         # 根据数据类型选择列
         if data_type == "comment":
-            excel_columns = self.EXCEL_COLUMNS_COMMENT
-            column_widths = {
-                'level': 5,
-                'username': 30,
-                'full_name': 30,
-                'text': 60,
-                'comment_like_count': 30,
-                'child_comment_count': 30,
-                'pk': 20,
-                'media_id': 20,
-            }
+            excel_columns = self.comment_columns
+            column_widths = self.COLUMN_WIDTHS_COMMENT
         else:
-            excel_columns = self.EXCEL_COLUMNS_HASHTAG
-            column_widths = {
-                'username': 20,
-                'full_name': 25,
-                'pk': 25,
-                'like_count': 12,
-                'comment_count': 15,
-                'location_name': 25,
-                'location_address': 30,
-                'location_city': 20,
-                'location_short_name': 25,
-                'content_type': 15,
-                'text': 80,
-                'text_translation': 80,
-            }
+            excel_columns = self.hashtag_columns
+            column_widths = self.COLUMN_WIDTHS_HASHTAG
+        
+        # 追加用户资料列，同一用户只查询一次
+        if self.profiles and "username" in excel_columns:
+            data = self.profiles.enrich(list(data))
+            excel_columns = excel_columns + PROFILE_FIELDS
+            column_widths = {**column_widths, **PROFILE_COLUMN_WIDTHS}
         
         saved_files = {}
         output_dir = CONFIG.get("output_dir", "output")
@@ -1038,40 +1855,62 @@ class IGSpider:
         # 保存为Excel
         if CONFIG.get("save_excel", True):
             excel_path = f"{output_dir}/{base_filename}.xlsx"
-            
-            # 确保所有记录都有固定的列，缺失的设为 None
-            normalized_data = []
-            for row in data:
-                normalized_row = {col: row.get(col) for col in excel_columns}
-                normalized_data.append(normalized_row)
-            
-            # 使用固定列顺序创建 DataFrame
-            df = pd.DataFrame(normalized_data, columns=excel_columns)
-            
-            # 写入 Excel 并设置列宽
-            with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='Sheet1')
-                
-                # 设置列宽
-                worksheet = writer.sheets['Sheet1']
-                
-                for i, col in enumerate(excel_columns):
-                    col_letter = chr(65 + i)  # A, B, C, ...
-                    width = column_widths.get(col, 15)
-                    worksheet.column_dimensions[col_letter].width = width
-            
+            self._export("excel", self._write_results_excel, excel_path, list(data), excel_columns, column_widths)
             saved_files["excel"] = excel_path
-            print(f"📊 已保存Excel: {excel_path}")
         
         # 保存为JSON
         if CONFIG.get("save_json", True):
             json_path = f"{output_dir}/{base_filename}.json"
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            self._export("json", self._write_json_rows, json_path, list(data))
             saved_files["json"] = json_path
-            print(f"📄 已保存JSON: {json_path}")
         
         return saved_files
+    
+    @PHASES.timed("export")
+    def save_delta(self, data: list[dict], name: str, key: str = "pk") -> str:
+        """
+        与上一次同名快照对比，只保存新增、删除、变化的记录
+        
+        Args:
+            data: 本次爬取的记录列表
+            name: 快照名称（如 hashtag_python_users）
+            key: 主键字段（帖子 pk 或评论 pk）
+        
+        Returns:
+            差异文件路径，没有变化时返回空字符串
+        """
+        store = SnapshotStore()
+        current = build_index(data, key)
+        previous = store.load(name)
+        
+        if previous is None:
+            print(f"📸 没有找到 {name} 的上一次快照，全部记录视为新增")
+            previous = {}
+        
+        delta = diff_index(previous, current)
+        store.save(name, current)
+        
+        print(f"🔍 快照对比: 新增 {len(delta['added'])}，删除 {len(delta['removed'])}，变化 {len(delta['changed'])}")
+        
+        if not (delta["added"] or delta["removed"] or delta["changed"]):
+            print("   与上一次快照相比没有变化")
+            return ""
+        
+        delta_path = write_delta(delta, name)
+        print(f"📄 已保存差异文件: {delta_path}")
+        return delta_path
+    
+    def _write_results_excel(self, excel_path: str, data: list[dict], excel_columns: list, column_widths: dict):
+        """按固定列顺序逐行写入 Excel（超出行数或大小限制时分片），缺失的列为空"""
+        sink = ExcelSink(excel_path, excel_columns, column_widths)
+        sink.write_rows(data)
+        sink.close()
+    
+    def _write_json_rows(self, json_path: str, rows: list, message: str = "📄 已保存JSON"):
+        """逐条写入 JSON 数组（超出记录数或大小限制时分片）"""
+        sink = JSONSink(json_path, message=message)
+        sink.write_rows(rows)
+        sink.close()
 
 
 if __name__ == "__main__":
@@ -4,8 +4,25 @@ Instagram Spider 主入口
 用于获取IG话题下用户列表和帖子评论用户列表
 """
 import argparse
+import os
+import re
+import time
+from datetime import datetime
 
+from budget import RequestBudget, estimate_seconds, format_plan
+from bulk import bulk_crawl_comments, read_media_ids
+from config import CONFIG
+from cooccur import CooccurrenceIndex
+from daemon import serve
+from dead_letter import retry_dead_letters
 from ig_spider import IGSpider
+from profiling import profile_session
+from proxy_pool import load_proxies
+from reexport import FORMATS, KINDS, export_archives, export_storage
+from sampling import save_sample
+from shortcode import POST_REF_HINT, parse_post_ref, resolve_media_ids
+from work_queue import open_queue
+from worker import run_worker
 
 
 def main():
@@ -22,6 +39,43 @@ def main():
 
   # 获取特定帖子的评论用户
   python main.py --post https://www.instagram.com/p/XXXXX/ --max-comments 100
+
+  # 批量获取文件中所有帖子的评论，4 个线程共享限速，每 500 个帖子一个文件
+  python main.py --media-file media_ids.txt --workers 4 --shard-size 500
+
+  # 只需要用户名和 pk 时只提取这两列，记录和输出文件都更小
+  python main.py --hashtag python --max-posts 500 --fields username,pk
+
+  # 监控：只获取最近 24 小时的评论，翻到更早的评论页时停止
+  python main.py --media-id 3123456789012345678 --since 24h
+
+  # 情感分析抽样：500 个帖子的抽样框，300 个请求内按评论数分层抽样，每帖 1 页评论
+  python main.py --hashtag python --with-comments --max-posts 500 --sample-budget 300 --seed 1
+
+  # 性能分析：输出 cProfile / 内存分析文件和各阶段耗时
+  python main.py --hashtag python --max-posts 50 --profile
+
+  # 获取话题下的帖子及评论，只估算请求数和耗时，不实际爬取
+  python main.py --hashtag python --with-comments --max-posts 10 --dry-run
+
+  # 分布式：向共享队列提交任务，再在多台机器上启动 worker
+  python main.py enqueue --queue /shared/queue.db --hashtag python --with-comments
+  python main.py worker --queue /shared/queue.db --output-dir /shared/output
+
+  # 补抓之前失败的分页请求（从失败的游标继续，只发送缺失的请求）
+  python main.py retry-failed --limit 100
+
+  # 用归档的原始数据和 JSON 结果重新导出（换列或换格式，不发送请求）
+  python main.py --fields username,pk,like_count export output/ --format parquet
+  python main.py export --from-storage output/ig_spider.db --hashtag python
+
+  # 查询与 #python 共同出现最多的标签（爬取时增量建立的共现索引，不需要登录）
+  python main.py --cooccur output/cooccur.db --hashtag python --max-posts 100
+  python main.py --cooccur output/cooccur.db related python --kind "#" --limit 20
+
+  # 常驻服务：保持登录和连接，通过本地 HTTP API 提交任务
+  python main.py serve --port 8765
+  curl -X POST localhost:8765/jobs -d '{"type": "hashtag_users", "params": {"hashtag": "python"}}'
         """
     )
     
@@ -34,7 +88,34 @@ def main():
     parser.add_argument(
         "--media-id", "-m",
         type=str,
-        help="要获取评论的帖子 media_id (pk)"
+        help="要获取评论的帖子 media_id (pk)，也可以是帖子链接或 10-11 位 shortcode"
+    )
+    
+    parser.add_argument(
+        "--post", "-p",
+        type=str,
+        help="要获取评论的帖子链接（本地转换为 media_id，不发送请求）"
+    )
+    
+    parser.add_argument(
+        "--media-file",
+        type=str,
+        default=None,
+        help="批量模式：media_id 或帖子链接列表文件（每行一个），结果汇总为一张带 media_id 的表"
+    )
+    
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="配合 --media-file 使用，并发线程数（共享同一限速，默认 CONFIG['bulk_workers']）"
+    )
+    
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=None,
+        help="配合 --media-file 使用，每个输出文件包含的帖子数（默认全部写入一个文件）"
     )
     
     parser.add_argument(
@@ -51,10 +132,243 @@ def main():
         help="帖子最多获取的评论数量（默认100）"
     )
     
+    parser.add_argument(
+        "--with-comments",
+        action="store_true",
+        help="配合 --hashtag 使用，获取话题下的帖子及评论（每帖一个sheet）"
+    )
+    
+    parser.add_argument(
+        "--since",
+        type=parse_time_arg,
+        default=None,
+        help="只获取该时间之后的评论：24h / 7d / 30m 表示最近一段时间，或 2026-01-01 / Unix 时间戳"
+    )
+    
+    parser.add_argument(
+        "--until",
+        type=parse_time_arg,
+        default=None,
+        help="只获取该时间之前的评论，格式同 --since"
+    )
+    
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        default=None,
+        help="硬性请求预算，超出后提前结束爬取（默认不限制）"
+    )
+    
+    parser.add_argument(
+        "--time-limit",
+        type=float,
+        default=None,
+        help="配合 --with-comments 使用，时间限制（秒），按帖子价值优先采集（默认不限制）"
+    )
+    
+    parser.add_argument(
+        "--sample-budget",
+        type=int,
+        default=None,
+        help="配合 --with-comments 使用，分层抽样模式的总请求数：按 comment_count 分层抽取帖子，--max-posts 为抽样框大小"
+    )
+    
+    parser.add_argument(
+        "--sample-pages",
+        type=int,
+        default=CONFIG.get("sample_pages_per_post", 1),
+        help="抽样模式每个帖子获取的父评论页数（默认1）"
+    )
+    
+    parser.add_argument(
+        "--child-rate",
+        type=float,
+        default=CONFIG.get("sample_child_rate", 0.2),
+        help="抽样模式子评论串的抽样比例，抽中的只取第一页（默认0.2）"
+    )
+    
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="抽样随机种子，固定后抽样结果可复现"
+    )
+    
+    parser.add_argument(
+        "--storage",
+        type=str,
+        default=None,
+        help="同时把结果写入 SQLite 数据库（如 output/ig_spider.db），便于跨任务查询"
+    )
+    
+    parser.add_argument(
+        "--cooccur",
+        type=str,
+        default=None,
+        help="爬取时建立话题标签 / @提及 共现索引（如 output/cooccur.db），之后用 related 命令查询"
+    )
+    
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="与上一次同名快照对比，只输出新增、删除、变化的记录"
+    )
+    
+    parser.add_argument(
+        "--proxy-file",
+        type=str,
+        default=None,
+        help="代理列表文件（每行一个 http:// 或 socks5:// 代理），按延迟和限流情况自动选择"
+    )
+    
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="启用自适应限速（AIMD），根据延迟和 429 自动调整请求速率"
+    )
+    
+    parser.add_argument(
+        "--enrich",
+        action="store_true",
+        help="保存结果时补充用户资料列（粉丝数、关注数、帖子数、账号类型），结果缓存，同一用户只查询一次"
+    )
+    
+    parser.add_argument(
+        "--fields",
+        type=str,
+        default=None,
+        help="只提取并保存这些列，逗号分隔（如 username,pk），未选中的字段不会生成"
+    )
+    
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="在 cProfile 和 tracemalloc 下运行，输出性能分析文件和分阶段耗时（sleep / http / decode / extract / export）"
+    )
+    
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="只请求第一页，估算所需请求数和耗时，不实际爬取"
+    )
+    
+    subparsers = parser.add_subparsers(dest="command")
+    
+    enqueue_parser = subparsers.add_parser("enqueue", help="向共享任务队列提交任务")
+    enqueue_parser.add_argument("--queue", default=CONFIG.get("queue_path"), help="任务队列地址")
+    enqueue_parser.add_argument("--hashtag", "-t", action="append", default=[], help="话题标签，可重复")
+    enqueue_parser.add_argument("--media-id", "-m", action="append", default=[], help="帖子 media_id 或链接，可重复")
+    enqueue_parser.add_argument("--max-posts", type=int, default=50, help="话题最多获取的帖子数量（默认50）")
+    enqueue_parser.add_argument("--max-comments", type=int, default=100, help="帖子最多获取的评论数量（默认100）")
+    enqueue_parser.add_argument("--with-comments", action="store_true", help="话题任务拆分为帖子评论任务")
+    enqueue_parser.add_argument("--priority", type=int, default=0, help="任务优先级，越大越先执行")
+    
+    worker_parser = subparsers.add_parser("worker", help="从共享任务队列领取任务并执行")
+    worker_parser.add_argument("--queue", default=CONFIG.get("queue_path"), help="任务队列地址")
+    worker_parser.add_argument("--output-dir", default=None, help="结果输出目录（多台机器共享）")
+    worker_parser.add_argument("--lease", type=float, default=CONFIG.get("queue_lease_seconds", 600),
+                               help="任务租约时长（秒），执行期间自动续租，worker 崩溃后超时的任务会被其他 worker 重新领取")
+    worker_parser.add_argument("--exit-when-empty", action="store_true", help="队列为空时退出")
+    
+    serve_parser = subparsers.add_parser("serve", help="常驻服务，通过本地 HTTP API 接收任务")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认只监听本机）")
+    serve_parser.add_argument("--port", type=int, default=CONFIG.get("daemon_port", 8765), help="监听端口")
+    
+    retry_parser = subparsers.add_parser("retry-failed", help="重试之前失败的分页请求，只补抓缺失的部分")
+    retry_parser.add_argument("--limit", type=int, default=None, help="最多重试多少个失败请求（默认全部）")
+    retry_parser.add_argument("--max-posts", type=int, default=50, help="每个话题请求最多补抓的帖子数量（默认50）")
+    retry_parser.add_argument("--max-comments", type=int, default=100, help="每个评论请求最多补抓的评论数量（默认100）")
+    
+    export_parser = subparsers.add_parser("export", help="从归档的 *_raw.json、JSON 结果或 SQLite 存储离线重建话题用户表和评论表")
+    export_parser.add_argument("paths", nargs="*", help="输入文件、目录或通配符（目录下递归查找 *.json）")
+    export_parser.add_argument("--from-storage", metavar="DB", default=None,
+                               help="从 SQLite 存储（--storage 写入的数据库）导出，而不是归档文件")
+    export_parser.add_argument("--hashtag", default=None, help="配合 --from-storage：只导出该话题的帖子及其评论")
+    export_parser.add_argument("--run-id", type=int, default=None, help="配合 --from-storage：只导出该次任务写入的记录")
+    export_parser.add_argument("--format", choices=FORMATS, default="excel", help="输出格式（默认 excel）")
+    export_parser.add_argument("--kind", choices=KINDS + ("all",), default="all", help="只重建话题用户表或评论表（默认都重建）")
+    export_parser.add_argument("--workers", type=int, default=None, help="解析文件的进程数（默认 CPU 核数）")
+    export_parser.add_argument("--name", default="export", help="输出文件名前缀（默认 export）")
+    export_parser.add_argument("--output-dir", default=None, help="输出目录（默认 output）")
+    
+    related_parser = subparsers.add_parser("related", help="查询与某个标签 / 用户共同出现最多的标签和用户")
+    related_parser.add_argument("token", help="标签或用户，如 python、#python、@someone")
+    related_parser.add_argument("--limit", type=int, default=20, help="返回条数（默认20）")
+    related_parser.add_argument("--kind", choices=["#", "@"], default=None, help="只返回标签（#）或用户（@）")
+    related_parser.add_argument("--by", choices=["count", "jaccard"], default="count",
+                                help="排序方式：共现次数（count）或 Jaccard 相似度（jaccard）")
+    
     args = parser.parse_args()
     
+    if args.profile:
+        with profile_session(CONFIG.get("output_dir", "output")):
+            run(args)
+    else:
+        run(args)
+
+
+def run(args):
+    """按命令行参数执行任务"""
+    if args.storage:
+        CONFIG["storage_path"] = args.storage
+    
+    if args.cooccur:
+        CONFIG["cooccur_path"] = args.cooccur
+    
+    if args.proxy_file:
+        CONFIG["proxies"] = load_proxies(args.proxy_file)
+    
+    if args.adaptive:
+        CONFIG["adaptive_rate"] = True
+    
+    if args.enrich:
+        CONFIG["enrich_profiles"] = True
+    
+    if args.fields:
+        fields = [f.strip() for f in args.fields.split(",") if f.strip()]
+        known = set(IGSpider.EXCEL_COLUMNS_HASHTAG) | set(IGSpider.EXCEL_COLUMNS_COMMENT)
+        unknown = [f for f in fields if f not in known]
+        if unknown:
+            print(f"✗ 未知字段: {', '.join(unknown)}")
+            return
+        CONFIG["hashtag_fields"] = [f for f in fields if f in IGSpider.EXCEL_COLUMNS_HASHTAG]
+        CONFIG["comment_fields"] = [f for f in fields if f in IGSpider.EXCEL_COLUMNS_COMMENT]
+    
+    if args.command == "enqueue":
+        enqueue_command(args)
+        return
+    
+    if args.command == "worker":
+        worker_command(args)
+        return
+    
+    if args.command == "serve":
+        serve_command(args)
+        return
+    
+    if args.command == "retry-failed":
+        retry_failed_command(args)
+        return
+    
+    if args.command == "export":
+        export_command(args)
+        return
+    
+    if args.command == "related":
+        related_command(args)
+        return
+    
+    # 帖子链接 / shortcode 本地转换为 media_id
+    args.media_id = args.media_id or args.post
+    if args.media_id:
+        media_id = parse_post_ref(args.media_id)
+        if not media_id:
+            print(f"✗ 无法识别的帖子: {args.media_id}（{POST_REF_HINT}）")
+            return
+        args.media_id = media_id
+    
     # 交互模式
-    if not args.hashtag and not args.media_id:
+    if not args.hashtag and not args.media_id and not args.media_file:
         interactive_mode()
         return
     
@@ -65,19 +379,220 @@ def main():
         print("⚠ 未登录，请先登录")
         spider.interactive_login()
     
-    if args.hashtag:
+    if args.max_requests is not None:
+        spider.budget = RequestBudget(args.max_requests)
+    
+    if args.dry_run:
+        if args.hashtag and args.with_comments:
+            plan = spider.plan_hashtag_posts_with_comments(args.hashtag, args.max_posts, args.max_comments)
+            print(format_plan(plan))
+        elif args.hashtag:
+            print(format_plan(spider.plan_hashtag_users(args.hashtag, args.max_posts)))
+        if args.media_id:
+            print(format_plan(spider.plan_post_comment_users(args.media_id, args.max_comments)))
+        if args.media_file:
+            media_ids = read_media_ids(args.media_file)
+            if media_ids:
+                # 按第一个帖子估算，再乘以帖子数
+                plan = spider.plan_post_comment_users(media_ids[0], args.max_comments)
+                plan["task"] = f"批量 {len(media_ids)} 个帖子评论（按第一个帖子估算，最多 {args.max_comments} 条/帖）"
+                plan["requests"] *= len(media_ids)
+                plan["seconds"] = estimate_seconds(plan["requests"], spider.budget.avg_latency)
+                print(format_plan(plan))
+        return
+    
+    if args.hashtag and args.with_comments:
+        print(f"\n📌 任务: 获取话题 #{args.hashtag} 下的帖子及评论")
+        posts_data = spider.get_hashtag_posts_with_comments(
+            args.hashtag, args.max_posts, args.max_comments, time_limit=args.time_limit,
+            since=args.since, until=args.until, sample_budget=args.sample_budget,
+            sample_pages=args.sample_pages, child_rate=args.child_rate, seed=args.seed
+        )
+        if posts_data and args.diff:
+            spider.save_delta([p["post_info"] for p in posts_data.values()], f"hashtag_{args.hashtag}_posts")
+            spider.save_delta([c for p in posts_data.values() for c in p["comments"]],
+                              f"hashtag_{args.hashtag}_comments")
+        elif posts_data:
+            spider.save_posts_with_comments(posts_data, f"hashtag_{args.hashtag}_posts_comments")
+        if posts_data and spider.last_sample:
+            save_sample(spider.last_sample, f"hashtag_{args.hashtag}_sample")
+        print(f"   结果: 获取到 {len(posts_data)} 个帖子")
+    elif args.hashtag:
         print(f"\n📌 任务: 获取话题 #{args.hashtag} 下的用户")
         users = spider.get_hashtag_users(args.hashtag, args.max_posts)
-        if users:
+        if users and args.diff:
+            spider.save_delta(users, f"hashtag_{args.hashtag}_users")
+        elif users:
             spider.save_results(users, f"hashtag_{args.hashtag}_users")
         print(f"   结果: 获取到 {len(users)} 个用户")
     
     if args.media_id:
         print(f"\n💬 任务: 获取帖子评论用户")
-        users = spider.get_post_comment_users(args.media_id, args.max_comments)
-        if users:
+        users = spider.get_post_comment_users(args.media_id, args.max_comments, args.since, args.until)
+        if users and args.diff:
+            spider.save_delta(users, f"post_{args.media_id}_comment_users")
+        elif users:
             spider.save_results(users, f"post_{args.media_id}_comment_users", data_type="comment")
         print(f"   结果: 获取到 {len(users)} 个评论用户")
+    
+    if args.media_file:
+        media_ids = read_media_ids(args.media_file)
+        print(f"\n💬 任务: 批量获取 {len(media_ids)} 个帖子的评论用户")
+        name = os.path.splitext(os.path.basename(args.media_file))[0]
+        summary = bulk_crawl_comments(spider, media_ids, args.max_comments, args.workers,
+                                      name=f"bulk_{name}", shard_size=args.shard_size,
+                                      since=args.since, until=args.until)
+        print(f"   结果: {summary['posts']} 个帖子，{summary['comments']} 条评论")
+    
+    # 等待后台导出写完
+    spider.flush_exports()
+    
+    if args.max_requests is not None:
+        print(f"   请求预算: {spider.budget.summary()}")
+    
+    if spider.controller and CONFIG.get("adaptive_rate"):
+        print(f"   自适应限速: {spider.controller.metrics()}")
+
+
+def parse_time_arg(value: str) -> float:
+    """
+    解析时间参数
+    
+    Args:
+        value: 24h / 7d / 30m（距现在的时长）、2026-01-01 / 2026-01-01T08:00（本地时间）或 Unix 时间戳
+    
+    Returns:
+        Unix 时间戳
+    """
+    value = value.strip()
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([mhd])", value)
+    if match:
+        seconds = float(match.group(1)) * {"m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        return time.time() - seconds
+    if re.fullmatch(r"\d{9,}(?:\.\d+)?", value):
+        return float(value)
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无法识别的时间: {value}")
+
+
+def enqueue_command(args):
+    """向共享任务队列提交任务"""
+    queue = open_queue(args.queue, CONFIG.get("max_retries", 3))
+    
+    for hashtag in args.hashtag:
+        queue.put("hashtag", {
+            "hashtag": hashtag,
+            "max_posts": args.max_posts,
+            "max_comments": args.max_comments,
+            "with_comments": args.with_comments,
+        }, priority=args.priority)
+        print(f"✓ 已提交话题任务: #{hashtag}")
+    
+    for ref, media_id in zip(args.media_id, resolve_media_ids(args.media_id)):
+        if not media_id:
+            print(f"⚠ 无法识别的帖子，已跳过: {ref}（{POST_REF_HINT}）")
+            continue
+        queue.put("media", {
+            "media_id": media_id,
+            "max_comments": args.max_comments,
+        }, priority=args.priority)
+        print(f"✓ 已提交帖子任务: {media_id}")
+    
+    print(f"   队列状态: {queue.stats()}")
+
+
+def worker_command(args):
+    """启动 worker，使用本机保存的 session"""
+    if args.output_dir:
+        CONFIG["output_dir"] = args.output_dir
+    
+    spider = IGSpider()
+    if not spider.is_logged_in:
+        print("✗ 未登录，worker 无法运行。请先在本机运行 python main.py 登录")
+        return
+    
+    if args.max_requests is not None:
+        spider.budget = RequestBudget(args.max_requests)
+    
+    queue = open_queue(args.queue, CONFIG.get("max_retries", 3))
+    run_worker(spider, queue, lease_seconds=args.lease, exit_when_empty=args.exit_when_empty)
+
+
+def serve_command(args):
+    """启动常驻服务"""
+    spider = IGSpider()
+    if not spider.is_logged_in:
+        print("⚠ 未登录，请先登录")
+        if not spider.interactive_login():
+            return
+    
+    if args.max_requests is not None:
+        spider.budget = RequestBudget(args.max_requests)
+    
+    serve(spider, args.host, args.port)
+
+
+def retry_failed_command(args):
+    """重试死信存储中的失败请求"""
+    spider = IGSpider()
+    if not spider.dead_letters:
+        print("✗ 未配置 dead_letter_path，没有失败请求记录")
+        return
+    
+    if not spider.is_logged_in:
+        print("⚠ 未登录，请先登录")
+        if not spider.interactive_login():
+            return
+    
+    if args.max_requests is not None:
+        spider.budget = RequestBudget(args.max_requests)
+    
+    summary = retry_dead_letters(spider, args.limit, args.max_posts, args.max_comments)
+    spider.flush_exports()
+    print(f"   结果: 补抓 {summary['users']} 个用户，{summary['comments']} 条评论")
+
+
+def export_command(args):
+    """离线重新导出，不需要登录"""
+    if args.output_dir:
+        CONFIG["output_dir"] = args.output_dir
+    
+    kinds = KINDS if args.kind == "all" else (args.kind,)
+    if not args.from_storage and not args.paths:
+        print("✗ 请指定输入文件或目录，或使用 --from-storage")
+        return
+    
+    try:
+        if args.from_storage:
+            export_storage(args.from_storage, args.format, kinds, args.name, args.hashtag, args.run_id)
+        else:
+            export_archives(args.paths, args.format, kinds, args.workers, args.name)
+    except FileNotFoundError as e:
+        print(f"✗ {e}")
+    except ImportError as e:
+        print(f"✗ 缺少依赖: {e}（Parquet 需要安装 pyarrow）")
+
+
+def related_command(args):
+    """查询共现索引"""
+    path = CONFIG.get("cooccur_path")
+    if not path or not os.path.exists(path):
+        print("✗ 共现索引不存在，请先用 --cooccur（或 config.py 中的 cooccur_path）爬取数据建立索引")
+        return
+    
+    index = CooccurrenceIndex(path)
+    results = index.related(args.token, args.limit, args.kind, args.by)
+    index.close()
+    
+    if not results:
+        print(f"⚠ 没有与 {args.token} 共同出现的标签或用户")
+        return
+    
+    print(f"\n📊 与 {args.token} 共同出现最多的{'标签' if args.kind == '#' else '用户' if args.kind == '@' else '标签 / 用户'}:")
+    for i, item in enumerate(results, 1):
+        print(f"  {i:>3}. {item['token']:<32} 共现 {item['count']:>6} 次  Jaccard {item['jaccard']:.4f}")
 
 
 def interactive_mode():
@@ -136,10 +651,14 @@ def interactive_mode():
                 print("⚠ 请先登录后再操作")
                 continue
             
-            media_id = input("请输入帖子的 media_id (pk): ").strip()
-            if not media_id:
+            post_ref = input("请输入帖子的 media_id (pk) 或链接: ").strip()
+            if not post_ref:
                 print("⚠ media_id 不能为空")
                 continue
+            media_id = parse_post_ref(post_ref)
+            if not media_id:
+                print(f"⚠ 无法识别的帖子: {post_ref}（{POST_REF_HINT}）")
+                continue
             
             max_comments = input("最多获取评论数量（默认100）: ").strip()
             max_comments = int(max_comments) if max_comments.isdigit() else 100
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+用户资料补充模块
+为导出记录补充粉丝数、关注数、帖子数、账号类型等列：同一批记录中的用户名先去重，
+依次查内存 LRU 缓存和磁盘 TTL 缓存（SQLite），只对未命中的用户用有上限的线程池请求资料，
+同一个用户在 500 条评论中出现也只查询一次，隔天重复运行时在 TTL 内不再请求
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from concurrency import shared_rate_gate
+from config import CONFIG
+
+# 补充的列（追加在导出列之后）
+PROFILE_FIELDS = [
+    "follower_count",
+    "following_count",
+    "media_count",
+    "account_type",
+    "category",
+    "is_private",
+    "is_verified",
+]
+
+PROFILE_COLUMN_WIDTHS = {
+    "follower_count": 15,
+    "following_count": 15,
+    "media_count": 12,
+    "account_type": 12,
+    "category": 20,
+    "is_private": 10,
+    "is_verified": 10,
+}
+
+PROFILE_API = "https://www.instagram.com/api/v1/users/web_profile_info/"
+
+
+def parse_profile(user: dict) -> dict:
+    """
+    从 web_profile_info 返回的 user 中提取补充列
+    
+    Args:
+        user: data.user
+    
+    Returns:
+        {PROFILE_FIELDS 中的字段: 值}
+    """
+    if user.get("is_business_account"):
+        account_type = "business"
+    elif user.get("is_professional_account"):
+        account_type = "creator"
+    else:
+        account_type = "personal"
+    return {
+        "follower_count": (user.get("edge_followed_by") or {}).get("count"),
+        "following_count": (user.get("edge_follow") or {}).get("count"),
+        "media_count": (user.get("edge_owner_to_timeline_media") or {}).get("count"),
+        "account_type": account_type,
+        "category": user.get("category_name") or user.get("business_category_name") or "",
+        "is_private": user.get("is_private"),
+        "is_verified": user.get("is_verified"),
+    }
+
+
+class ProfileCache:
+    """内存 LRU + SQLite TTL 两级缓存（线程安全）"""
+    
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        """
+        Args:
+            path: 磁盘缓存路径，缺省使用 CONFIG["profile_cache_path"]，为 None 时只使用内存缓存
+            ttl: 缓存有效期（秒），缺省使用 CONFIG["profile_cache_ttl"]
+            max_entries: 内存 LRU 最多保留的用户数，缺省使用 CONFIG["profile_cache_size"]
+        """
+        self.path = path if path is not None else CONFIG.get("profile_cache_path")
+        self.ttl = ttl if ttl is not None else CONFIG.get("profile_cache_ttl", 86400)
+        self.max_entries = max_entries or CONFIG.get("profile_cache_size", 10000)
+        
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()   # {username: (fetched_at, profile)}
+        self.conn = None
+        if self.path:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS profiles (
+                    username TEXT PRIMARY KEY,
+                    profile TEXT,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            self.conn.commit()
+    
+    def get_many(self, usernames: list[str]) -> tuple[dict, dict]:
+        """
+        批量查询缓存
+        
+        Args:
+            usernames: 去重后的用户名列表
+        
+        Returns:
+            ({username: profile}, {"memory": 命中数, "disk": 命中数})，profile 为 None 表示用户不存在
+        """
+        now = time.time()
+        found, hits = {}, {"memory": 0, "disk": 0}
+        with self._lock:
+            missing = []
+            for username in usernames:
+                entry = self._lru.get(username)
+                if entry and now - entry[0] < self.ttl:
+                    self._lru.move_to_end(username)
+                    found[username] = entry[1]
+                    hits["memory"] += 1
+                else:
+                    missing.append(username)
+            
+            if self.conn and missing:
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    rows = self.conn.execute(
+                        f"SELECT username, profile, fetched_at FROM profiles "
+                        f"WHERE username IN ({','.join('?' * len(chunk))}) AND fetched_at > ?",
+                        chunk + [now - self.ttl]
+                    ).fetchall()
+                    for username, profile, fetched_at in rows:
+                        found[username] = json.loads(profile) if profile else None
+                        self._remember(username, fetched_at, found[username])
+                        hits["disk"] += 1
+        return found, hits
+    
+    def put_many(self, profiles: dict):
+        """
+        写入缓存
+        
+        Args:
+            profiles: {username: profile}，profile 为 None 表示用户不存在（同样缓存，避免重复查询）
+        """
+        if not profiles:
+            return
+        now = time.time()
+        with self._lock:
+            for username, profile in profiles.items():
+                self._remember(username, now, profile)
+            if self.conn:
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO profiles (username, profile, fetched_at) VALUES (?, ?, ?)",
+                        [(u, json.dumps(p, ensure_ascii=False) if p is not None else None, now)
+                         for u, p in profiles.items()]
+                    )
+    
+    def _remember(self, username: str, fetched_at: float, profile: Optional[dict]):
+        self._lru[username] = (fetched_at, profile)
+        self._lru.move_to_end(username)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+    
+    def close(self):
+        if self.conn:
+            self.conn.close()
+
+
+class ProfileEnricher:
+    """为导出记录补充用户资料列"""
+    
+    def __init__(self, spider, cache: Optional[ProfileCache] = None, workers: Optional[int] = None):
+        """
+        Args:
+            spider: IGSpider 实例（请求走它的限速、预算、代理和连接池）
+            cache: 资料缓存，缺省按 CONFIG 新建
+            workers: 并发请求数，缺省使用 CONFIG["profile_workers"]
+        """
+        self.spider = spider
+        self.cache = cache or ProfileCache()
+        self.workers = workers or CONFIG.get("profile_workers", 4)
+        self._stats_lock = threading.Lock()
+        self._stats = {"users": 0, "memory_hits": 0, "disk_hits": 0, "fetched": 0, "failed": 0}
+    
+    def fetch(self, username: str) -> tuple[Optional[dict], bool]:
+        """
+        请求单个用户的资料
+        
+        Returns:
+            (补充列, 是否可以缓存)：用户不存在时为 (None, True)，请求失败时为 (None, False)
+        """
+        # 错误类型随结果返回（请求被合并时，本线程的 _local.error 不是这次请求的结果）
+        data, error = self.spider._api_call(PROFILE_API, {"username": username})
+        if data is None:
+            return None, error == "HTTP 404"
+        user = (data.get("data") or {}).get("user")
+        return (parse_profile(user) if user else None), True
+    
+    def lookup(self, usernames: list[str]) -> dict:
+        """
+        查询一组用户的资料（先查缓存，未命中的并发请求）
+        
+        Args:
+            usernames: 用户名列表（可重复）
+        
+        Returns:
+            {username: 补充列}，查询失败或用户不存在的不在结果中
+        """
+        unique = list(dict.fromkeys(u for u in usernames if u))
+        found, hits = self.cache.get_many(unique)
+        missing = [u for u in unique if u not in found]
+        
+        fetched, failed = {}, 0
+        if missing:
+            print(f"👤 补充用户资料: {len(unique)} 个用户，缓存命中 {len(found)} 个，需要请求 {len(missing)} 个")
+            
+            # 未启用自适应限速时用固定速率闸门，让所有线程共享 request_delay（只在本次查询期间生效）
+            with shared_rate_gate(self.spider, self.workers):
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="profile") as executor:
+                    for username, (profile, cacheable) in zip(missing, executor.map(self.fetch, missing)):
+                        if cacheable:
+                            fetched[username] = profile
+                        else:
+                            failed += 1
+            self.cache.put_many(fetched)
+            found.update(fetched)
+        
+        with self._stats_lock:
+            self._stats["users"] += len(unique)
+            self._stats["memory_hits"] += hits["memory"]
+            self._stats["disk_hits"] += hits["disk"]
+            self._stats["fetched"] += len(fetched)
+            self._stats["failed"] += failed
+        if failed:
+            print(f"⚠ {failed} 个用户资料获取失败，对应列留空")
+        return {u: p for u, p in found.items() if p}
+    
+    def enrich(self, records: list[dict], key: str = "username") -> list[dict]:
+        """
+        给记录追加 PROFILE_FIELDS 列（返回新列表，不修改原记录）
+        
+        Args:
+            records: 导出记录
+            key: 用户名字段
+        
+        Returns:
+            追加了补充列的记录
+        """
+        profiles = self.lookup([r.get(key) for r in records])
+        empty = dict.fromkeys(PROFILE_FIELDS)
+        return [{**r, **profiles.get(r.get(key), empty)} for r in records]
+    
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self._stats)
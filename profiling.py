@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+性能分析模块
+PHASES 按阶段（sleep / http / decode / extract / export）累计耗时，计时开销很小，始终开启；
+profile_session 在一次运行外层包上 cProfile 和 tracemalloc，结束后写出分析文件和分阶段耗时报告
+"""
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# 报告中的阶段顺序
+PHASE_NAMES = ("sleep", "http", "decode", "extract", "export")
+
+
+class PhaseTimer:
+    """
+    分阶段计时器（线程安全）
+    阶段嵌套时只给最内层计时，外层阶段暂停，各阶段耗时互不重叠
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._totals = {}
+        self._counts = {}
+    
+    def start(self, name: str):
+        """
+        开始计时，返回值传给 stop
+        
+        Args:
+            name: 阶段名（sleep / http / decode / extract / export）
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        
+        # 同名阶段嵌套时并入外层
+        if stack and stack[-1][0] == name:
+            return None
+        
+        now = time.perf_counter()
+        if stack:
+            self._add(stack[-1][0], now - stack[-1][1], 0)
+        entry = [name, now]
+        stack.append(entry)
+        return entry
+    
+    def stop(self, entry):
+        """结束 start 开始的计时，外层阶段从此刻继续计时"""
+        if entry is None:
+            return
+        stack = self._local.stack
+        now = time.perf_counter()
+        stack.pop()
+        self._add(entry[0], now - entry[1], 1)
+        if stack:
+            stack[-1][1] = now
+    
+    @contextmanager
+    def phase(self, name: str):
+        """统计一段代码的耗时"""
+        entry = self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(entry)
+    
+    def timed(self, name: str):
+        """装饰器版本的 phase"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                entry = self.start(name)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.stop(entry)
+            return wrapper
+        return decorator
+    
+    def _add(self, name: str, seconds: float, count: int):
+        with self._lock:
+            self._totals[name] = self._totals.get(name, 0.0) + seconds
+            self._counts[name] = self._counts.get(name, 0) + count
+    
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self._totals.clear()
+            self._counts.clear()
+    
+    def snapshot(self) -> dict:
+        """
+        当前统计
+        
+        Returns:
+            {阶段: {"seconds", "count"}}
+        """
+        with self._lock:
+            names = [n for n in PHASE_NAMES if n in self._totals] + sorted(set(self._totals) - set(PHASE_NAMES))
+            return {n: {"seconds": round(self._totals[n], 4), "count": self._counts[n]} for n in names}
+    
+    def report(self, wall_seconds: float) -> str:
+        """
+        格式化分阶段耗时
+        
+        Args:
+            wall_seconds: 运行总耗时（秒）
+        """
+        lines = [f"⏱ 分阶段耗时（总耗时 {wall_seconds:.2f} 秒，多线程时各阶段合计可能超过总耗时）"]
+        accounted = 0.0
+        for name, item in self.snapshot().items():
+            accounted += item["seconds"]
+            share = item["seconds"] / wall_seconds * 100 if wall_seconds else 0
+            lines.append(f"   {name:<8} {item['seconds']:>10.3f} 秒  {share:5.1f}%  （{item['count']} 次）")
+        other = max(wall_seconds - accounted, 0)
+        lines.append(f"   {'other':<8} {other:>10.3f} 秒  {other / wall_seconds * 100 if wall_seconds else 0:5.1f}%")
+        return "\n".join(lines)
+
+
+# 全局计时器
+PHASES = PhaseTimer()
+
+
+@contextmanager
+def profile_session(output_dir: str, name: str = "profile", top: int = 40):
+    """
+    在 cProfile 和 tracemalloc 下运行一段代码，结束后写出：
+        <name>_<时间>.prof         cProfile 原始数据（可用 snakeviz / pstats 打开）
+        <name>_<时间>_stats.txt    按累计耗时排序的函数列表
+        <name>_<时间>_memory.txt   内存峰值和分配最多的代码行
+        <name>_<时间>_phases.json  分阶段耗时
+    cProfile 只统计主线程，分阶段耗时包含所有线程
+    
+    Args:
+        output_dir: 输出目录
+        name: 文件名前缀
+        top: 文本报告中列出的条目数
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    prefix = os.path.join(output_dir, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    
+    PHASES.reset()
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield prefix
+    finally:
+        profiler.disable()
+        wall = time.perf_counter() - started
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        
+        profiler.dump_stats(f"{prefix}.prof")
+        
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(top)
+        with open(f"{prefix}_stats.txt", 'w', encoding='utf-8') as f:
+            f.write(text.getvalue())
+        
+        with open(f"{prefix}_memory.txt", 'w', encoding='utf-8') as f:
+            f.write(f"current: {current / 1024 / 1024:.2f} MiB\npeak: {peak / 1024 / 1024:.2f} MiB\n\n")
+            for stat in snapshot.statistics("lineno")[:top]:
+                f.write(f"{stat}\n")
+        
+        with open(f"{prefix}_phases.json", 'w', encoding='utf-8') as f:
+            json.dump({"wall_seconds": round(wall, 4), "phases": PHASES.snapshot()}, f, ensure_ascii=False, indent=2)
+        
+        print(f"\n{PHASES.report(wall)}")
+        print(f"   内存峰值: {peak / 1024 / 1024:.2f} MiB")
+        print(f"📄 已保存性能分析: {prefix}.prof / _stats.txt / _memory.txt / _phases.json")
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+代理池模块
+多个 HTTP / SOCKS 代理，每个代理有独立的连接池，
+按延迟滑动平均、429 比例、错误率打分选择代理，被限流或出错的代理暂停使用，
+因连接错误暂停的代理可以通过健康检查提前恢复，因 429 暂停的代理必须等到暂停期结束
+SOCKS 代理需要安装 requests[socks]
+"""
+import random
+import threading
+import time
+from typing import Optional
+
+import requests
+
+from config import CONFIG
+from transport import mount_pool
+
+# 滑动平均的平滑系数
+EWMA_ALPHA = 0.3
+
+
+class ProxyEntry:
+    """单个代理及其统计"""
+    
+    def __init__(self, url: str, base_session: requests.Session, pool_size: Optional[int] = None):
+        """
+        Args:
+            url: 代理地址，如 http://127.0.0.1:8080 或 socks5://127.0.0.1:1080
+            base_session: 主 session，共享其 headers 和 cookies（登录状态）
+            pool_size: 该代理的连接池大小，缺省使用 transport.default_pool_size()
+        """
+        self.url = url
+        self.session = requests.Session()
+        self.session.headers = base_session.headers
+        self.session.cookies = base_session.cookies
+        self.session.proxies = {"http": url, "https": url}
+        self.connections = mount_pool(self.session, pool_size)
+        
+        self.latency = None
+        self.error_rate = 0.0
+        self.throttle_rate = 0.0
+        self.requests = 0
+        self.strikes = 0
+        self.rested_until = 0.0
+        # 当前暂停是否由 429 引起（首页能打开不代表 API 已解除限流，健康检查不能提前恢复）
+        self.throttled = False
+    
+    @property
+    def resting(self) -> bool:
+        return time.monotonic() < self.rested_until
+    
+    @property
+    def score(self) -> float:
+        """分数越低越好：延迟 ×（1 + 错误惩罚 + 限流惩罚），未使用过的代理优先试用"""
+        latency = self.latency if self.latency is not None else 0.0
+        return latency * (1 + 5 * self.error_rate + 10 * self.throttle_rate)
+    
+    def stats(self) -> dict:
+        return {
+            "proxy": self.url,
+            "requests": self.requests,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "throttle_rate": round(self.throttle_rate, 3),
+            "resting": self.resting,
+            "connections": self.connections.snapshot(),
+        }
+
+
+class ProxyPool:
+    """按分数选择代理的代理池"""
+    
+    def __init__(self, proxies: list[str], base_session: requests.Session,
+                 rest_seconds: Optional[float] = None):
+        """
+        Args:
+            proxies: 代理地址列表
+            base_session: 主 session（共享 headers 和 cookies）
+            rest_seconds: 代理被限流或出错后的基础暂停时长（秒），连续出错时翻倍
+        """
+        self.entries = [ProxyEntry(url, base_session) for url in proxies]
+        self.rest_seconds = rest_seconds if rest_seconds is not None else CONFIG.get("proxy_rest_seconds", 120)
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def available(self) -> list[ProxyEntry]:
+        """未在暂停期的代理"""
+        return [e for e in self.entries if not e.resting]
+    
+    def next_available_in(self) -> float:
+        """距离最早恢复的代理还有多少秒，已有可用代理时为 0"""
+        with self._lock:
+            if not self.entries:
+                return 0.0
+            return max(0.0, min(e.rested_until for e in self.entries) - time.monotonic())
+    
+    def choose(self) -> Optional[ProxyEntry]:
+        """
+        按分数加权随机选择一个代理（分数越低概率越高），全部暂停时返回最早恢复的代理
+        
+        Returns:
+            选中的代理，代理池为空时返回 None
+        """
+        with self._lock:
+            if not self.entries:
+                return None
+            candidates = self.available()
+            if not candidates:
+                return min(self.entries, key=lambda e: e.rested_until)
+            weights = [1 / max(e.score, 1e-3) for e in candidates]
+            return random.choices(candidates, weights=weights)[0]
+    
+    def report(self, entry: ProxyEntry, latency: Optional[float], status_code: Optional[int] = None,
+               error: bool = False):
+        """
+        记录一次请求结果
+        
+        Args:
+            entry: 使用的代理
+            latency: 请求耗时（秒），失败时为 None
+            status_code: HTTP 状态码
+            error: 是否网络错误或返回了非 JSON
+        """
+        with self._lock:
+            entry.requests += 1
+            throttled = status_code == 429
+            failed = error or (status_code is not None and status_code >= 500)
+            
+            if latency is not None:
+                entry.latency = latency if entry.latency is None else (
+                    EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * entry.latency
+                )
+            entry.throttle_rate = EWMA_ALPHA * throttled + (1 - EWMA_ALPHA) * entry.throttle_rate
+            entry.error_rate = EWMA_ALPHA * failed + (1 - EWMA_ALPHA) * entry.error_rate
+            
+            if throttled or failed:
+                entry.throttled = throttled
+                entry.strikes += 1
+                entry.rested_until = time.monotonic() + self.rest_seconds * 2 ** (entry.strikes - 1)
+                print(f"⚠ 代理 {entry.url} 暂停 {self.rest_seconds * 2 ** (entry.strikes - 1):.0f} 秒")
+            else:
+                entry.strikes = 0
+    
+    def health_check(self, url: Optional[str] = None, timeout: float = 10) -> dict:
+        """
+        对所有代理发送测试请求，恢复健康的代理、暂停不可用的代理
+        因 429 暂停的代理不做探测，等暂停期结束后再使用，避免健康检查绕过限流退避
+        
+        Args:
+            url: 测试地址，缺省使用 CONFIG["proxy_health_url"]（测试时可指向本地服务）
+            timeout: 超时时间（秒）
+        
+        Returns:
+            {代理地址: 是否可用}
+        """
+        url = url or CONFIG.get("proxy_health_url", "https://www.instagram.com/")
+        results = {}
+        for entry in self.entries:
+            if entry.throttled and entry.resting:
+                results[entry.url] = False
+                continue
+            started = time.monotonic()
+            try:
+                resp = entry.session.get(url, timeout=timeout)
+                healthy = resp.status_code < 400
+                latency = time.monotonic() - started
+            except Exception:
+                healthy, latency = False, None
+            
+            if healthy:
+                with self._lock:
+                    entry.strikes = 0
+                    entry.rested_until = 0.0
+                    entry.latency = latency if entry.latency is None else (
+                        EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * entry.latency
+                    )
+            else:
+                self.report(entry, None, error=True)
+            results[entry.url] = healthy
+        return results
+    
+    def stats(self) -> list[dict]:
+        """各代理的统计信息"""
+        return [e.stats() for e in self.entries]
+
+
+def load_proxies(path: str) -> list[str]:
+    """从文件读取代理列表（每行一个，# 开头为注释）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
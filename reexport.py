@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+离线重新导出模块
+从归档的原始 media（*_raw.json）和 JSON 结果文件重建话题用户表和评论表，
+用进程池并行解析文件（也可以直接从 SQLite 存储导出），按输入顺序合并去重后写为 Excel / Parquet / JSONL，
+列的提取和投影与 save_results 相同（包括 --fields），不发送任何请求
+"""
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
+from typing import Optional
+
+from config import CONFIG
+from ig_spider import IGSpider
+from rotation import ExcelSink, JSONLSink, ParquetSink
+from storage import SQLiteStorage
+
+# 支持的输出格式
+FORMATS = ("excel", "parquet", "jsonl")
+
+# 重建的表
+KINDS = ("hashtag", "comment")
+
+EXTENSIONS = {"excel": "xlsx", "parquet": "parquet", "jsonl": "jsonl"}
+
+
+def find_inputs(paths: list[str]) -> list[str]:
+    """
+    展开输入路径（文件、目录或通配符），目录下递归查找 *.json，跳过分片清单
+    
+    Args:
+        paths: 输入路径列表
+    
+    Returns:
+        去重后的文件列表（目录和通配符按文件名排序）
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            matched = sorted(glob.glob(os.path.join(path, "**", "*.json"), recursive=True))
+        else:
+            matched = sorted(glob.glob(path)) or [path]
+        files.extend(f for f in matched if not f.endswith("_manifest.json"))
+    return list(dict.fromkeys(files))
+
+
+def detect_kind(item: dict) -> Optional[str]:
+    """
+    根据第一条记录判断文件类型
+    
+    Returns:
+        raw（原始 media）/ hashtag（话题用户结果）/ comment（评论结果），无法识别时为 None
+    """
+    if "media" in item or isinstance(item.get("caption"), dict):
+        return "raw"
+    if "media_id" in item or "level" in item:
+        return "comment"
+    if "username" in item or "pk" in item:
+        return "hashtag"
+    return None
+
+
+def parse_file(path: str, hashtag_columns: list, comment_columns: list) -> dict:
+    """
+    解析一个归档文件（在子进程中运行）
+    
+    Args:
+        path: 文件路径
+        hashtag_columns: 话题用户表的列
+        comment_columns: 评论表的列
+    
+    Returns:
+        {"path", "kind", "source", "rows", "missing", "error"}，kind 为 None 表示跳过该文件
+    """
+    result = {"path": path, "kind": None, "source": None, "rows": [], "missing": [], "error": None}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+    
+    if not isinstance(data, list) or not data or not isinstance(data[0], dict):
+        result["error"] = "不是记录列表"
+        return result
+    
+    kind = detect_kind(data[0])
+    if kind == "raw":
+        # 原始 media 包含全部字段，按当前列重新提取
+        result.update(kind="hashtag", source="raw", rows=[
+            IGSpider.build_hashtag_record(item, hashtag_columns) for item in data if isinstance(item, dict)
+        ])
+    elif kind in KINDS:
+        # 结果文件只能投影已有的列，爬取时未保存的列为空
+        columns = hashtag_columns if kind == "hashtag" else comment_columns
+        present = set().union(*(item.keys() for item in data[:100] if isinstance(item, dict)))
+        result.update(kind=kind, source="json", missing=[col for col in columns if col not in present], rows=[
+            {col: item.get(col) for col in columns} for item in data if isinstance(item, dict)
+        ])
+    else:
+        result["error"] = "无法识别的记录格式"
+    return result
+
+
+def _open_sink(fmt: str, path: str, columns: list, column_widths: dict):
+    if fmt == "excel":
+        return ExcelSink(path, columns, column_widths)
+    if fmt == "parquet":
+        return ParquetSink(path, columns)
+    return JSONLSink(path, columns)
+
+
+def _default_columns(hashtag_columns: Optional[list], comment_columns: Optional[list]) -> dict:
+    """话题用户表和评论表的列，缺省按 CONFIG 中的字段投影（与 save_results 相同）"""
+    if hashtag_columns is None:
+        hashtag_columns = IGSpider._project(IGSpider.EXCEL_COLUMNS_HASHTAG, CONFIG.get("hashtag_fields"),
+                                            IGSpider.REQUIRED_FIELDS_HASHTAG)
+    if comment_columns is None:
+        comment_columns = IGSpider._project(IGSpider.EXCEL_COLUMNS_COMMENT, CONFIG.get("comment_fields"),
+                                            IGSpider.REQUIRED_FIELDS_COMMENT)
+    return {"hashtag": hashtag_columns, "comment": comment_columns}
+
+
+def _write_results(results, fmt: str, kinds: tuple, name: str, columns: dict, inputs: int) -> dict:
+    """
+    按顺序合并解析结果（话题用户按用户名、评论按 pk 去重）并写入输出文件
+    
+    Args:
+        results: parse_file 格式的结果（可迭代，逐个合并）
+        fmt: 输出格式
+        kinds: 要重建的表
+        name: 输出文件名前缀
+        columns: {kind: 列}
+        inputs: 输入文件数（写入汇总）
+    
+    Returns:
+        export_archives 的汇总
+    """
+    widths = {"hashtag": IGSpider.COLUMN_WIDTHS_HASHTAG, "comment": IGSpider.COLUMN_WIDTHS_COMMENT}
+    # 话题用户表与 get_hashtag_users 一样每个用户一行，评论按 pk 去重
+    keys = {"hashtag": "username" if "username" in columns["hashtag"] else "pk", "comment": "pk"}
+    
+    output_dir = CONFIG.get("output_dir", "output")
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    sinks, seen = {}, {kind: set() for kind in kinds}
+    summary = {
+        "inputs": inputs,
+        "rows": {kind: 0 for kind in kinds},
+        "duplicates": {kind: 0 for kind in kinds},
+        "files": {},
+        "skipped": [],
+    }
+    
+    for result in results:
+        kind = result["kind"]
+        if result["error"] or kind is None:
+            print(f"  ⚠ 跳过 {result['path']}: {result['error']}")
+            summary["skipped"].append(result["path"])
+            continue
+        if kind not in kinds:
+            continue
+        
+        key = keys[kind]
+        rows = []
+        for row in result["rows"]:
+            value = row.get(key)
+            if value is not None and value != "":
+                if value in seen[kind]:
+                    summary["duplicates"][kind] += 1
+                    continue
+                seen[kind].add(value)
+            rows.append(row)
+        
+        if kind not in sinks:
+            path = f"{output_dir}/{name}_{kind}_users_{timestamp}.{EXTENSIONS[fmt]}"
+            sinks[kind] = _open_sink(fmt, path, columns[kind], widths[kind])
+        sinks[kind].write_rows(rows)
+        summary["rows"][kind] += len(rows)
+        
+        note = f"（缺少列: {', '.join(result['missing'])}）" if result["missing"] else ""
+        print(f"  ✓ {result['path']}: {result['source']} → {kind}，{len(rows)} 行{note}")
+    
+    for kind, sink in sinks.items():
+        summary["files"][kind] = sink.close()
+    
+    print("✓ 导出完成: " + "，".join(
+        f"{kind} {summary['rows'][kind]} 行（去重 {summary['duplicates'][kind]}）" for kind in kinds
+    ) + (f"，跳过 {len(summary['skipped'])} 个文件" if summary["skipped"] else ""))
+    return summary
+
+
+def export_archives(paths: list[str], fmt: str = "excel", kinds: tuple = KINDS, workers: Optional[int] = None,
+                    name: str = "export", hashtag_columns: Optional[list] = None,
+                    comment_columns: Optional[list] = None) -> dict:
+    """
+    从归档文件重建话题用户表和评论表
+    
+    Args:
+        paths: 输入文件、目录或通配符
+        fmt: 输出格式（excel / parquet / jsonl）
+        kinds: 要重建的表（hashtag / comment）
+        workers: 解析文件的进程数，缺省使用 CONFIG["export_workers"] 或 CPU 核数
+        name: 输出文件名前缀
+        hashtag_columns: 话题用户表的列，缺省按 CONFIG["hashtag_fields"] 投影
+        comment_columns: 评论表的列，缺省按 CONFIG["comment_fields"] 投影
+    
+    Returns:
+        {"inputs", "rows": {kind: 行数}, "duplicates": {kind: 重复数}, "files": {kind: [路径]}, "skipped": [路径]}
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的格式: {fmt}，可选: {', '.join(FORMATS)}")
+    
+    columns = _default_columns(hashtag_columns, comment_columns)
+    files = find_inputs(paths)
+    workers = min(workers or CONFIG.get("export_workers") or os.cpu_count() or 1, max(len(files), 1))
+    print(f"\n📦 离线重新导出: {len(files)} 个文件，{workers} 个进程，格式 {fmt}")
+    
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map 按输入顺序返回，先解析完的文件在主进程中等待合并
+            results = executor.map(parse_file, files, repeat(columns["hashtag"]), repeat(columns["comment"]))
+            return _write_results(results, fmt, kinds, name, columns, len(files))
+    results = (parse_file(path, columns["hashtag"], columns["comment"]) for path in files)
+    return _write_results(results, fmt, kinds, name, columns, len(files))
+
+
+def export_storage(path: str, fmt: str = "excel", kinds: tuple = KINDS, name: str = "export",
+                   hashtag: Optional[str] = None, run_id: Optional[int] = None,
+                   hashtag_columns: Optional[list] = None, comment_columns: Optional[list] = None) -> dict:
+    """
+    把 SQLite 存储（--storage）中的帖子和评论导出为话题用户表和评论表
+    
+    Args:
+        path: 存储数据库路径
+        fmt: 输出格式（excel / parquet / jsonl）
+        kinds: 要导出的表（hashtag / comment）
+        name: 输出文件名前缀
+        hashtag: 只导出该话题的帖子（及这些帖子的评论）
+        run_id: 只导出该次任务写入的记录
+        hashtag_columns: 话题用户表的列，缺省按 CONFIG["hashtag_fields"] 投影
+        comment_columns: 评论表的列，缺省按 CONFIG["comment_fields"] 投影
+    
+    Returns:
+        同 export_archives
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的格式: {fmt}，可选: {', '.join(FORMATS)}")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"存储数据库不存在: {path}")
+    
+    columns = _default_columns(hashtag_columns, comment_columns)
+    print(f"\n📦 从存储导出: {path}，格式 {fmt}")
+    
+    storage = SQLiteStorage(path)
+    try:
+        posts = storage.load_hashtag_users(hashtag=hashtag, run_id=run_id)
+        if hashtag is not None:
+            comments = [c for post in posts for c in storage.load_comments(media_id=post["pk"], run_id=run_id)]
+        else:
+            comments = storage.load_comments(run_id=run_id)
+    finally:
+        storage.close()
+    
+    results = [
+        {"path": path, "kind": kind, "source": "storage", "error": None, "missing": [],
+         "rows": [{col: row.get(col) for col in columns[kind]} for row in rows]}
+        for kind, rows in (("hashtag", posts), ("comment", comments)) if rows
+    ]
+    return _write_results(results, fmt, kinds, name, columns, 1)
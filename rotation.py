@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+分片输出模块
+Excel / JSON 按行数、sheet 数或字节数滚动写入编号分片，
+第一个分片使用原文件名，之后依次为 _part002、_part003 …，
+产生多个分片时额外写一个 _xlsx_manifest.json / _json_manifest.json 列出所有分片
+Excel 使用 openpyxl 的 write_only 模式逐行写入，内存占用与总行数无关
+"""
+import json
+import os
+from typing import Optional
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+from config import CONFIG
+
+# Excel 单个 sheet 最多 1,048,576 行（含表头）
+EXCEL_MAX_ROWS = 1048575
+
+
+class RotatingSink:
+    """分片写入基类：负责分片命名、滚动判断和清单"""
+    
+    def __init__(self, path: str, max_rows: Optional[int] = None, max_bytes: Optional[int] = None):
+        """
+        Args:
+            path: 第一个分片的文件路径，后续分片在扩展名前加 _partNNN
+            max_rows: 每个分片最多的数据行数，缺省为 CONFIG["output_max_rows"]
+            max_bytes: 每个分片最多的字节数（Excel 按未压缩内容估算），缺省为 CONFIG["output_max_bytes"]
+        """
+        self.path = path
+        self.max_rows = max_rows or CONFIG.get("output_max_rows")
+        self.max_bytes = max_bytes or CONFIG.get("output_max_bytes")
+        self.shards = []
+        self._root, self._ext = os.path.splitext(path)
+        self._rows = 0
+        self._bytes = 0
+        self._open_shard = False
+    
+    def _shard_path(self, index: int) -> str:
+        return self.path if index == 1 else f"{self._root}_part{index:03d}{self._ext}"
+    
+    def _full(self, incoming_rows: int = 1) -> bool:
+        """当前分片再写入 incoming_rows 行是否超出限制"""
+        if not self._open_shard or not self._rows:
+            return False
+        if self.max_rows and self._rows + incoming_rows > self.max_rows:
+            return True
+        return bool(self.max_bytes and self._bytes >= self.max_bytes)
+    
+    def _rotate(self):
+        if self._open_shard:
+            self._close_shard()
+        self._start_shard(self._shard_path(len(self.shards) + 1))
+        self._open_shard = True
+        self._rows = 0
+        self._bytes = 0
+    
+    def _start_shard(self, path: str):
+        raise NotImplementedError
+    
+    def _close_shard(self):
+        raise NotImplementedError
+    
+    def close(self) -> list[str]:
+        """
+        写完最后一个分片，有多个分片时写入清单
+        
+        Returns:
+            所有分片路径
+        """
+        if self._open_shard:
+            self._close_shard()
+            self._open_shard = False
+        
+        if len(self.shards) > 1:
+            manifest_path = f"{self._root}_{self._ext.lstrip('.')}_manifest.json"
+            with open(manifest_path, 'w', encoding='utf-8') as f:
+                json.dump({"shards": self.shards}, f, ensure_ascii=False, indent=2)
+            print(f"📄 已保存分片清单: {manifest_path}（{len(self.shards)} 个分片）")
+        
+        return [shard["path"] for shard in self.shards]
+
+
+class ExcelSink(RotatingSink):
+    """按行数 / sheet 数 / 字节数滚动的 Excel 写入器"""
+    
+    def __init__(self, path: str, columns: list, column_widths: Optional[dict] = None,
+                 max_rows: Optional[int] = None, max_sheets: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        """
+        Args:
+            path: 第一个分片的文件路径
+            columns: 固定列顺序
+            column_widths: {列名: 列宽}
+            max_rows: 每个分片最多的数据行数（不超过 Excel 上限）
+            max_sheets: 每个分片最多的 sheet 数，缺省为 CONFIG["output_max_sheets"]
+            max_bytes: 每个分片最多的字节数（按未压缩内容估算）
+        """
+        super().__init__(path, max_rows, max_bytes)
+        self.max_rows = min(self.max_rows or EXCEL_MAX_ROWS, EXCEL_MAX_ROWS)
+        self.max_sheets = max_sheets or CONFIG.get("output_max_sheets")
+        self.columns = columns
+        self.column_widths = column_widths or {}
+        self._workbook = None
+        self._sheet = None
+        self._sheet_rows = 0
+        self._sheets = 0
+    
+    def _start_shard(self, path: str):
+        self._workbook = Workbook(write_only=True)
+        self._current_path = path
+        self._sheet = None
+        self._sheets = 0
+    
+    def _close_shard(self):
+        self._workbook.save(self._current_path)
+        self.shards.append({
+            "path": self._current_path,
+            "rows": self._rows,
+            "sheets": self._sheets,
+            "bytes": os.path.getsize(self._current_path),
+        })
+        print(f"📊 已保存Excel: {self._current_path}")
+        self._workbook = None
+    
+    def _new_sheet(self, sheet_name: str):
+        sheet = self._workbook.create_sheet(sheet_name[:31])  # Excel sheet 名最长 31 字符
+        
+        # write_only 模式下列宽必须在写入数据前设置
+        for i, col in enumerate(self.columns, 1):
+            sheet.column_dimensions[get_column_letter(i)].width = self.column_widths.get(col, 15)
+        
+        header = []
+        for col in self.columns:
+            cell = WriteOnlyCell(sheet, value=col)
+            cell.font = Font(bold=True)
+            header.append(cell)
+        sheet.append(header)
+        
+        self._sheet = sheet
+        self._sheet_rows = 0
+        self._sheets += 1
+    
+    def _append(self, row: dict):
+        values = [row.get(col) for col in self.columns]
+        self._sheet.append(values)
+        self._sheet_rows += 1
+        self._rows += 1
+        self._bytes += sum(len(str(v)) for v in values if v is not None)
+    
+    def write_rows(self, rows: list[dict], sheet_name: str = "Sheet1"):
+        """
+        写入一张长表，超出限制时在新分片中继续（同名 sheet）
+        
+        Args:
+            rows: 记录列表
+            sheet_name: sheet 名称
+        """
+        for row in rows:
+            if not self._open_shard or self._full():
+                self._rotate()
+            if self._sheet is None:
+                self._new_sheet(sheet_name)
+            self._append(row)
+        
+        # 没有数据时也生成带表头的文件
+        if not self._open_shard:
+            self._rotate()
+            self._new_sheet(sheet_name)
+    
+    def add_sheet(self, sheet_name: str, rows: list[dict]):
+        """
+        写入一个独立的 sheet，当前分片放不下时先滚动到新分片；
+        单个 sheet 超过行数上限时拆成多个 sheet（名称加 _2、_3 …）
+        
+        Args:
+            sheet_name: sheet 名称
+            rows: 记录列表
+        """
+        chunks = [rows[i:i + self.max_rows] for i in range(0, len(rows), self.max_rows)] or [[]]
+        for part, chunk in enumerate(chunks, 1):
+            if (not self._open_shard or self._full(len(chunk))
+                    or (self.max_sheets and self._sheets >= self.max_sheets)):
+                self._rotate()
+            name = sheet_name if part == 1 else f"{sheet_name[:27]}_{part}"
+            self._new_sheet(name)
+            for row in chunk:
+                self._append(row)
+
+
+class JSONSink(RotatingSink):
+    """按行数 / 字节数滚动的 JSON 数组写入器（格式与 json.dump(indent=2) 相同）"""
+    
+    def __init__(self, path: str, max_rows: Optional[int] = None, max_bytes: Optional[int] = None,
+                 message: str = "📄 已保存JSON"):
+        """
+        Args:
+            path: 第一个分片的文件路径
+            max_rows: 每个分片最多的记录数
+            max_bytes: 每个分片最多的字节数
+            message: 每个分片保存后打印的提示
+        """
+        super().__init__(path, max_rows, max_bytes)
+        self.message = message
+        self._file = None
+    
+    def _start_shard(self, path: str):
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write("[")
+    
+    def _close_shard(self):
+        self._file.write("\n]" if self._rows else "]")
+        self._file.close()
+        self.shards.append({
+            "path": self._file.name,
+            "rows": self._rows,
+            "bytes": os.path.getsize(self._file.name),
+        })
+        print(f"{self.message}: {self._file.name}")
+        self._file = None
+    
+    def write_rows(self, rows: list):
+        """
+        追加记录
+        
+        Args:
+            rows: 可 JSON 序列化的记录列表
+        """
+        for row in rows:
+            if not self._open_shard or self._full():
+                self._rotate()
+            item = json.dumps(row, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+            chunk = ("," if self._rows else "") + "\n  " + item
+            self._file.write(chunk)
+            self._rows += 1
+            self._bytes += len(chunk.encode("utf-8"))
+        
+        if not self._open_shard:
+            self._rotate()
+
+
+class JSONLSink(RotatingSink):
+    """按行数 / 字节数滚动的 JSON Lines 写入器（每行一条记录）"""
+    
+    def __init__(self, path: str, columns: Optional[list] = None, max_rows: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        """
+        Args:
+            path: 第一个分片的文件路径
+            columns: 固定列顺序，None 表示原样写入记录
+            max_rows: 每个分片最多的记录数
+            max_bytes: 每个分片最多的字节数
+        """
+        super().__init__(path, max_rows, max_bytes)
+        self.columns = columns
+        self._file = None
+    
+    def _start_shard(self, path: str):
+        self._file = open(path, 'w', encoding='utf-8')
+    
+    def _close_shard(self):
+        self._file.close()
+        self.shards.append({
+            "path": self._file.name,
+            "rows": self._rows,
+            "bytes": os.path.getsize(self._file.name),
+        })
+        print(f"📄 已保存JSONL: {self._file.name}")
+        self._file = None
+    
+    def write_rows(self, rows: list):
+        """
+        追加记录
+        
+        Args:
+            rows: 可 JSON 序列化的记录列表
+        """
+        for row in rows:
+            if not self._open_shard or self._full():
+                self._rotate()
+            if self.columns is not None:
+                row = {col: row.get(col) for col in self.columns}
+            line = json.dumps(row, ensure_ascii=False) + "\n"
+            self._file.write(line)
+            self._rows += 1
+            self._bytes += len(line.encode("utf-8"))
+        
+        if not self._open_shard:
+            self._rotate()
+
+
+class ParquetSink(RotatingSink):
+    """
+    按行数滚动的 Parquet 写入器，每个分片的行在内存中缓冲，分片结束时用 pandas 一次写入
+    需要安装 pyarrow 或 fastparquet
+    """
+    
+    def __init__(self, path: str, columns: list, max_rows: Optional[int] = None):
+        """
+        Args:
+            path: 第一个分片的文件路径
+            columns: 固定列顺序
+            max_rows: 每个分片最多的数据行数
+        """
+        import pandas as pd
+        
+        # 提前检查 parquet 引擎，避免写到最后才失败
+        pd.io.parquet.get_engine("auto")
+        super().__init__(path, max_rows)
+        self.columns = columns
+        self._buffer = []
+    
+    def _start_shard(self, path: str):
+        self._current_path = path
+        self._buffer = []
+    
+    def _close_shard(self):
+        import pandas as pd
+        
+        df = pd.DataFrame(self._buffer, columns=self.columns)
+        # 混合类型的列（如数字和空字符串）统一转为字符串，parquet 每列只能有一种类型
+        for col in df.columns:
+            if df[col].dtype == object and df[col].dropna().map(type).nunique() > 1:
+                df[col] = df[col].map(lambda v: None if v is None else str(v))
+        df.to_parquet(self._current_path, index=False)
+        self.shards.append({
+            "path": self._current_path,
+            "rows": self._rows,
+            "bytes": os.path.getsize(self._current_path),
+        })
+        print(f"📄 已保存Parquet: {self._current_path}")
+        self._buffer = []
+    
+    def write_rows(self, rows: list[dict]):
+        """
+        追加记录
+        
+        Args:
+            rows: 记录列表
+        """
+        for row in rows:
+            if not self._open_shard or self._full():
+                self._rotate()
+            self._buffer.append([row.get(col) for col in self.columns])
+            self._rows += 1
+        
+        if not self._open_shard:
+            self._rotate()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+分层抽样模块
+按 comment_count 把话题帖子分层，把固定的请求预算按各层帖子数比例分配，
+每个帖子只取固定页数的父评论，子评论串按设定比例抽取（只取第一页），
+并记录每个帖子的抽样权重，事后可以用加权的方式修正总体估计
+"""
+import json
+import os
+import random
+from datetime import datetime
+from typing import Optional
+
+from budget import COMMENT_PAGE_SIZE
+from config import CONFIG
+
+# 默认分层边界（comment_count），得到 0-9 / 10-99 / 100-999 / 1000+ 四层
+DEFAULT_STRATA = (10, 100, 1000)
+
+
+def stratum_label(comment_count: int, bounds: tuple) -> str:
+    """
+    帖子所在的层
+    
+    Args:
+        comment_count: 帖子评论数
+        bounds: 升序的分层边界
+    
+    Returns:
+        层名称，如 "10-99"、"1000+"
+    """
+    lower = 0
+    for upper in bounds:
+        if comment_count < upper:
+            return f"{lower}-{upper - 1}"
+        lower = upper
+    return f"{lower}+"
+
+
+def expected_post_cost(pages_per_post: int, child_rate: float) -> float:
+    """
+    抽中一个帖子预计消耗的请求数：父评论页数 + 按比例抽取的子评论串（每串一页）
+    
+    Args:
+        pages_per_post: 每个帖子获取的父评论页数
+        child_rate: 子评论串抽样比例
+    """
+    threads_per_page = COMMENT_PAGE_SIZE * CONFIG.get("plan_child_thread_ratio", 0.2)
+    return pages_per_post * (1 + threads_per_page * child_rate)
+
+
+def allocate(sizes: dict, n: int) -> dict:
+    """
+    按各层大小比例分配样本量（最大余数法），样本量足够时每个非空层至少 1 个
+    
+    Args:
+        sizes: {层: 帖子数}
+        n: 总样本量
+    
+    Returns:
+        {层: 样本量}
+    """
+    total = sum(sizes.values())
+    n = min(n, total)
+    if n <= 0:
+        return {label: 0 for label in sizes}
+    
+    quotas = {label: n * size / total for label, size in sizes.items()}
+    counts = {label: int(q) for label, q in quotas.items()}
+    
+    if n >= len([s for s in sizes.values() if s]):
+        for label, size in sizes.items():
+            if size and not counts[label]:
+                counts[label] = 1
+    
+    # 余数最大的层补足，超出时从样本最多的层扣减
+    order = sorted(sizes, key=lambda label: quotas[label] - int(quotas[label]), reverse=True)
+    while sum(counts.values()) < n:
+        for label in order:
+            if sum(counts.values()) >= n:
+                break
+            if counts[label] < sizes[label]:
+                counts[label] += 1
+    while sum(counts.values()) > n:
+        label = max(counts, key=counts.get)
+        counts[label] -= 1
+    return counts
+
+
+def draw_sample(medias: list[dict], request_budget: int, pages_per_post: int, child_rate: float,
+                bounds: Optional[tuple] = None, rng: Optional[random.Random] = None) -> tuple[list[dict], dict]:
+    """
+    按 comment_count 分层，在请求预算内抽取帖子
+    
+    Args:
+        medias: 抽样框（搜索接口返回的 media 数据）
+        request_budget: 可用于获取评论的请求数
+        pages_per_post: 每个帖子获取的父评论页数
+        child_rate: 子评论串抽样比例
+        bounds: 分层边界，缺省为 CONFIG["sample_strata"]
+        rng: 随机数生成器（固定 seed 时结果可复现）
+    
+    Returns:
+        (抽中的 media 列表, 抽样信息 {"strata": {...}, "posts": {pk: {...}}, ...})
+    """
+    bounds = tuple(sorted(bounds or CONFIG.get("sample_strata") or DEFAULT_STRATA))
+    rng = rng or random.Random()
+    
+    strata = {}
+    for media in medias:
+        strata.setdefault(stratum_label(media.get("comment_count") or 0, bounds), []).append(media)
+    
+    n = int(request_budget // expected_post_cost(pages_per_post, child_rate))
+    counts = allocate({label: len(group) for label, group in strata.items()}, n)
+    
+    sampled, posts, summary = [], {}, {}
+    for label, group in strata.items():
+        chosen = rng.sample(group, counts[label])
+        summary[label] = {"population": len(group), "sampled": len(chosen)}
+        for media in chosen:
+            sampled.append(media)
+            posts[media["pk"]] = {
+                "stratum": label,
+                "comment_count": media.get("comment_count") or 0,
+                # 层内抽样比例的倒数
+                "post_weight": len(group) / len(chosen),
+            }
+    
+    # 打乱顺序，预算提前用尽时各层受到的影响相同
+    rng.shuffle(sampled)
+    
+    sample = {
+        "request_budget": request_budget,
+        "pages_per_post": pages_per_post,
+        "child_rate": child_rate,
+        "strata_bounds": list(bounds),
+        "strata": summary,
+        "posts": posts,
+    }
+    return sampled, sample
+
+
+def apply_crawl_stats(sample: dict, stats: dict):
+    """
+    根据实际抓取情况补全每个帖子的权重
+    
+    parent_weight = post_weight × 评论覆盖修正（未翻到最后一页时，总评论数 / 已抓父评论及其子评论数）
+    child_weight  = parent_weight × 子评论串修正（子评论串总数 / 抽中的子评论串数）
+    
+    Args:
+        sample: draw_sample 返回的抽样信息（原地修改）
+        stats: _crawl_frontier 返回的 {post_pk: {pages, covered, complete, child_threads, child_threads_fetched}}
+    """
+    for pk, post in sample["posts"].items():
+        s = stats.get(pk) or {}
+        covered = s.get("covered", 0)
+        if s.get("complete") or not covered:
+            page_factor = 1.0
+        else:
+            page_factor = max(post["comment_count"] / covered, 1.0)
+        
+        threads, fetched = s.get("child_threads", 0), s.get("child_threads_fetched", 0)
+        child_factor = threads / fetched if fetched else 1.0
+        
+        post.update({
+            "pages": s.get("pages", 0),
+            "complete": bool(s.get("complete")),
+            "child_threads": threads,
+            "child_threads_fetched": fetched,
+            "parent_weight": round(post["post_weight"] * page_factor, 6),
+            "child_weight": round(post["post_weight"] * page_factor * child_factor, 6),
+        })
+
+
+def save_sample(sample: dict, filename: str) -> str:
+    """
+    保存抽样信息（分层、每个帖子的权重）为 JSON
+    
+    Args:
+        sample: 抽样信息
+        filename: 文件名（不含扩展名）
+    
+    Returns:
+        保存的文件路径
+    """
+    output_dir = CONFIG.get("output_dir", "output")
+    os.makedirs(output_dir, exist_ok=True)
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = f"{output_dir}/{filename}_{timestamp}.json"
+    
+    data = dict(sample)
+    data["posts"] = [{"pk": pk, **post} for pk, post in sample["posts"].items()]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"📄 已保存抽样权重: {path}")
+    return path
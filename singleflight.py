@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+请求合并模块（single-flight）
+多个线程 / 任务同时请求同一个接口（规范化后的 URL + 全部参数相同）时，
+只有第一个调用真正发送请求，其余调用等待并共享同一个解析结果，不额外消耗请求预算
+"""
+import threading
+from typing import Callable, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+
+def request_key(url: str, params: Optional[dict] = None, ignore: tuple = ()) -> str:
+    """
+    规范化 URL 和参数，生成合并 key
+    
+    Args:
+        url: 请求地址
+        params: 请求参数
+        ignore: 计算 key 时忽略的参数（只用于去重，合并请求时必须使用全部参数：
+            rank_token / search_session_id 不同的搜索会话返回的分页游标互不通用）
+    
+    Returns:
+        key 字符串（域名小写、去掉结尾的 /、参数排序，值为 None 的参数不会发送，也不计入）
+    """
+    parts = urlsplit(url)
+    path = parts.path.rstrip("/") or "/"
+    base = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+    items = sorted(
+        (str(k), str(v)) for k, v in (params or {}).items()
+        if k not in ignore and v is not None
+    )
+    return base + "?" + "&".join(f"{k}={v}" for k, v in items)
+
+
+class _Call:
+    """一次进行中的请求"""
+    
+    __slots__ = ("done", "result", "error")
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """按 key 合并同时进行的相同调用（线程安全）"""
+    
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+    
+    def do(self, key: str, func: Callable):
+        """
+        执行 func，同一 key 已有进行中的调用时等待并返回它的结果
+        
+        等待的调用方不会执行 func，也就看不到它在执行线程里留下的状态（如 threading.local 中的错误类型），
+        调用方需要的错误信息应当包含在返回值里；func 抛出的异常会原样抛给所有等待的调用方
+        
+        Args:
+            key: 合并 key
+            func: 无参数的调用
+        
+        Returns:
+            func 的返回值（多个调用方共享同一个对象，只读使用）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+    
+    def stats(self) -> dict:
+        """实际执行和被合并的调用次数"""
+        with self._lock:
+            return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._calls)}
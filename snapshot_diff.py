@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+快照对比模块
+按帖子 pk / 评论 pk 建立哈希索引，把本次爬取结果和上一次快照对比，
+只输出新增、删除、变化的记录，适合每日监控
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+from config import CONFIG
+
+
+def record_hash(record: dict) -> str:
+    """计算记录内容的哈希（字段顺序无关）"""
+    payload = json.dumps(record, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def build_index(records: list[dict], key: str = "pk") -> dict:
+    """
+    建立 {key: {"hash", "record"}} 索引
+    
+    Args:
+        records: 记录列表
+        key: 主键字段
+    """
+    index = {}
+    for record in records:
+        if record.get(key) is None:
+            continue
+        index[str(record[key])] = {"hash": record_hash(record), "record": record}
+    return index
+
+
+def diff_index(previous: dict, current: dict) -> dict:
+    """
+    对比两个索引
+    
+    Args:
+        previous: 上一次快照的索引
+        current: 本次爬取的索引
+    
+    Returns:
+        {"added": [...], "removed": [...], "changed": [...]}，
+        changed 中每项包含 record 和 changes {字段: [旧值, 新值]}
+    """
+    added, changed = [], []
+    for pk, entry in current.items():
+        old = previous.get(pk)
+        if old is None:
+            added.append(entry["record"])
+        elif old["hash"] != entry["hash"]:
+            old_record, new_record = old["record"], entry["record"]
+            changes = {
+                field: [old_record.get(field), new_record.get(field)]
+                for field in set(old_record) | set(new_record)
+                if old_record.get(field) != new_record.get(field)
+            }
+            changed.append({"record": new_record, "changes": changes})
+    
+    removed = [entry["record"] for pk, entry in previous.items() if pk not in current]
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+class SnapshotStore:
+    """按名称保存上一次的爬取快照（如 hashtag_python_users）"""
+    
+    def __init__(self, snapshot_dir: Optional[str] = None):
+        """
+        Args:
+            snapshot_dir: 快照目录，缺省为 CONFIG["snapshot_dir"]
+        """
+        self.snapshot_dir = snapshot_dir or CONFIG.get(
+            "snapshot_dir", os.path.join(CONFIG.get("output_dir", "output"), "snapshots")
+        )
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+    
+    def _path(self, name: str) -> str:
+        return os.path.join(self.snapshot_dir, f"{name}.json")
+    
+    def load(self, name: str) -> Optional[dict]:
+        """读取快照索引，没有快照时返回 None"""
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def save(self, name: str, index: dict):
+        """覆盖保存快照索引（先写临时文件再替换，避免中断时损坏）"""
+        path = self._path(name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+
+def write_delta(delta: dict, name: str, output_dir: Optional[str] = None) -> str:
+    """
+    把差异写为紧凑的 JSON Lines 文件，每行一条记录，带 _change 字段
+    
+    Args:
+        delta: diff_index 的结果
+        name: 快照名称
+        output_dir: 输出目录
+    
+    Returns:
+        文件路径
+    """
+    output_dir = output_dir or CONFIG.get("output_dir", "output")
+    os.makedirs(output_dir, exist_ok=True)
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    delta_path = f"{output_dir}/{name}_{timestamp}_delta.jsonl"
+    
+    with open(delta_path, 'w', encoding='utf-8') as f:
+        for record in delta["added"]:
+            f.write(json.dumps({"_change": "added", **record}, ensure_ascii=False, default=str) + "\n")
+        for record in delta["removed"]:
+            f.write(json.dumps({"_change": "removed", **record}, ensure_ascii=False, default=str) + "\n")
+        for item in delta["changed"]:
+            row = {"_change": "changed", "_changes": item["changes"], **item["record"]}
+            f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+    
+    return delta_path
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+内存保护模块
+get_hashtag_posts_with_comments 的结果按帖子保存，进程内存超过 memory_limit_mb 后，
+已抓取完成的帖子逐个写入磁盘（每个帖子一个紧凑的 JSON 文件），导出时再逐个读回，
+峰值内存只与正在抓取的帖子有关，与任务总规模无关
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections.abc import MutableMapping
+from typing import Optional
+
+from config import CONFIG
+
+# 无法读取进程内存时，按记录字段长度估算内存占用，每条记录另加的固定开销（字节）
+RECORD_OVERHEAD = 600
+
+
+def current_rss() -> Optional[int]:
+    """
+    当前进程的常驻内存（字节）
+    Linux 读取 /proc/self/statm，其他平台需要安装 psutil，都不可用时返回 None
+    """
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def estimate_post_size(post_data: dict) -> int:
+    """按字段长度粗略估算一个帖子（含评论）占用的内存（字节）"""
+    records = [post_data.get("post_info") or {}] + list(post_data.get("comments") or [])
+    return sum(RECORD_OVERHEAD + sum(len(str(v)) for v in record.values()) for record in records)
+
+
+class SpillablePosts(MutableMapping):
+    """
+    {post_pk: {post_info, comments}} 的有序映射，超过内存上限时把已完成的帖子写入磁盘
+    读取落盘的帖子时从文件加载，不常驻内存；遍历 values() / items() 时逐个加载
+    """
+    
+    def __init__(self, memory_limit_mb: Optional[float] = None, directory: Optional[str] = None):
+        """
+        Args:
+            memory_limit_mb: 内存上限（MiB），缺省使用 CONFIG["memory_limit_mb"]
+            directory: 落盘文件的上级目录，缺省使用 CONFIG["spill_dir"] 或 <output_dir>/.spill
+        """
+        limit = memory_limit_mb if memory_limit_mb is not None else CONFIG.get("memory_limit_mb")
+        self.limit_bytes = int(limit * 1024 * 1024) if limit else None
+        self.parent_dir = directory or CONFIG.get("spill_dir") or os.path.join(CONFIG.get("output_dir", "output"), ".spill")
+        self.directory = None
+        
+        self._lock = threading.Lock()
+        self._memory = {}     # {pk: post_data}，未落盘的帖子
+        self._files = {}      # {pk: 文件路径}，已落盘的帖子
+        self._sizes = {}      # {pk: 估算字节数}，已完成但未落盘的帖子
+        self._order = []
+        self.spilled = 0
+    
+    def __len__(self) -> int:
+        return len(self._order)
+    
+    def __iter__(self):
+        return iter(list(self._order))
+    
+    def __contains__(self, pk) -> bool:
+        return pk in self._memory or pk in self._files
+    
+    def __getitem__(self, pk) -> dict:
+        if pk in self._memory:
+            return self._memory[pk]
+        path = self._files[pk]
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def __setitem__(self, pk, post_data: dict):
+        with self._lock:
+            if pk not in self:
+                self._order.append(pk)
+            if pk in self._files:
+                # 已落盘的帖子直接覆盖文件
+                self._write(self._files[pk], post_data)
+            else:
+                self._memory[pk] = post_data
+    
+    def __delitem__(self, pk):
+        with self._lock:
+            self._order.remove(pk)
+            self._sizes.pop(pk, None)
+            if pk in self._files:
+                os.remove(self._files.pop(pk))
+            else:
+                del self._memory[pk]
+    
+    def release(self, pk):
+        """
+        帖子已抓取完成：超过内存上限时写入磁盘并从内存中移除
+        
+        Args:
+            pk: 帖子 pk
+        """
+        if not self.limit_bytes or pk not in self._memory:
+            return
+        
+        with self._lock:
+            self._sizes[pk] = estimate_post_size(self._memory[pk])
+            rss = current_rss()
+            used = rss if rss is not None else sum(self._sizes.values())
+            if used < self.limit_bytes:
+                return
+            
+            if self.directory is None:
+                os.makedirs(self.parent_dir, exist_ok=True)
+                self.directory = tempfile.mkdtemp(prefix="posts_", dir=self.parent_dir)
+                # 对象回收或进程退出时删除落盘文件（后台导出线程持有引用，导出完成前不会删除）
+                weakref.finalize(self, shutil.rmtree, self.directory, True)
+                print(f"💾 内存超过 {self.limit_bytes / 1024 / 1024:.0f} MiB，已完成的帖子将写入磁盘: {self.directory}")
+            
+            # 当前帖子和之前留在内存中的已完成帖子一起落盘
+            for done_pk in list(self._sizes):
+                path = os.path.join(self.directory, f"{done_pk}.json")
+                self._write(path, self._memory.pop(done_pk))
+                self._files[done_pk] = path
+                self.spilled += 1
+            self._sizes.clear()
+    
+    @staticmethod
+    def _write(path: str, post_data: dict):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(post_data, f, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite 存储模块
+把爬取结果写入规范化的 posts / users / comments / crawl_runs 表，
+爬取过程中批量 executemany 写入，支持跨多次运行快速查询
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from config import CONFIG
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawl_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    command TEXT NOT NULL,
+    hashtag TEXT,
+    media_id TEXT,
+    params TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    posts INTEGER NOT NULL DEFAULT 0,
+    comments INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    full_name TEXT,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS posts (
+    pk TEXT PRIMARY KEY,
+    username TEXT,
+    hashtag TEXT,
+    like_count INTEGER,
+    comment_count INTEGER,
+    location_name TEXT,
+    location_address TEXT,
+    location_city TEXT,
+    location_short_name TEXT,
+    content_type TEXT,
+    text TEXT,
+    text_translation TEXT,
+    run_id INTEGER,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS comments (
+    pk TEXT PRIMARY KEY,
+    media_id TEXT NOT NULL,
+    parent_pk TEXT,
+    level TEXT,
+    username TEXT,
+    text TEXT,
+    comment_like_count INTEGER,
+    child_comment_count INTEGER,
+    position INTEGER,
+    run_id INTEGER,
+    updated_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_posts_username ON posts (username);
+CREATE INDEX IF NOT EXISTS idx_posts_hashtag ON posts (hashtag);
+CREATE INDEX IF NOT EXISTS idx_comments_username ON comments (username);
+CREATE INDEX IF NOT EXISTS idx_comments_media_id ON comments (media_id, position);
+CREATE INDEX IF NOT EXISTS idx_crawl_runs_hashtag ON crawl_runs (hashtag);
+"""
+
+UPSERT_USER = """
+INSERT INTO users (username, full_name, updated_at) VALUES (?, ?, ?)
+ON CONFLICT (username) DO UPDATE SET
+    full_name = COALESCE(excluded.full_name, users.full_name),
+    updated_at = excluded.updated_at
+"""
+
+UPSERT_POST = """
+INSERT INTO posts (pk, username, hashtag, like_count, comment_count, location_name, location_address,
+                   location_city, location_short_name, content_type, text, text_translation, run_id, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (pk) DO UPDATE SET
+    username = excluded.username,
+    hashtag = COALESCE(excluded.hashtag, posts.hashtag),
+    like_count = excluded.like_count,
+    comment_count = excluded.comment_count,
+    location_name = COALESCE(excluded.location_name, posts.location_name),
+    location_address = COALESCE(excluded.location_address, posts.location_address),
+    location_city = COALESCE(excluded.location_city, posts.location_city),
+    location_short_name = COALESCE(excluded.location_short_name, posts.location_short_name),
+    content_type = COALESCE(excluded.content_type, posts.content_type),
+    text = COALESCE(excluded.text, posts.text),
+    text_translation = COALESCE(excluded.text_translation, posts.text_translation),
+    run_id = excluded.run_id,
+    updated_at = excluded.updated_at
+"""
+
+UPSERT_COMMENT = """
+INSERT INTO comments (pk, media_id, parent_pk, level, username, text, comment_like_count,
+                      child_comment_count, position, run_id, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (pk) DO UPDATE SET
+    parent_pk = excluded.parent_pk,
+    level = excluded.level,
+    username = excluded.username,
+    text = excluded.text,
+    comment_like_count = excluded.comment_like_count,
+    child_comment_count = excluded.child_comment_count,
+    position = COALESCE(comments.position, excluded.position),
+    run_id = excluded.run_id,
+    updated_at = excluded.updated_at
+"""
+
+
+class SQLiteStorage:
+    """SQLite 存储后端（WAL 模式 + 批量写入）"""
+    
+    def __init__(self, path: Optional[str] = None, batch_size: Optional[int] = None):
+        """
+        Args:
+            path: 数据库文件路径，缺省使用 CONFIG["storage_path"]
+            batch_size: 缓冲多少行后批量写入一次，缺省使用 CONFIG["storage_batch_size"]
+        """
+        self.path = path or CONFIG.get("storage_path") or os.path.join(CONFIG.get("output_dir", "output"), "ig_spider.db")
+        self.batch_size = batch_size or CONFIG.get("storage_batch_size", 500)
+        self.run_id = None
+        
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        
+        # 待写入的缓冲行
+        self._users = {}
+        self._posts = []
+        self._comments = []
+        
+        # 下一个评论位置 {(media_id, parent_pk): position}，父评论的 parent_pk 为 None
+        self._positions = {}
+    
+    def start_run(self, command: str, hashtag: Optional[str] = None,
+                  media_id: Optional[str] = None, **params) -> int:
+        """
+        记录一次爬取任务
+        
+        Args:
+            command: 任务类型，如 hashtag_users / post_comments / hashtag_posts_comments
+            hashtag: 话题标签
+            media_id: 帖子 media_id
+            **params: 其他参数（max_posts 等）
+        
+        Returns:
+            run_id
+        """
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO crawl_runs (command, hashtag, media_id, params, started_at) VALUES (?, ?, ?, ?, ?)",
+                (command, hashtag, media_id, json.dumps(params, ensure_ascii=False), time.time())
+            )
+            self.conn.commit()
+            self.run_id = cur.lastrowid
+        return self.run_id
+    
+    def finish_run(self):
+        """写入剩余缓冲，并记录本次任务的帖子数和评论数"""
+        self.flush()
+        if self.run_id is None:
+            return
+        with self._lock:
+            self.conn.execute(
+                "UPDATE crawl_runs SET finished_at = ?, "
+                "posts = (SELECT COUNT(*) FROM posts WHERE run_id = ?), "
+                "comments = (SELECT COUNT(*) FROM comments WHERE run_id = ?) WHERE id = ?",
+                (time.time(), self.run_id, self.run_id, self.run_id)
+            )
+            self.conn.commit()
+        self.run_id = None
+    
+    def add_posts(self, records: list[dict], hashtag: Optional[str] = None):
+        """
+        缓冲话题帖子记录（get_hashtag_users 的输出格式）
+        
+        Args:
+            records: 帖子记录列表
+            hashtag: 所属话题
+        """
+        now = time.time()
+        for r in records:
+            if r.get("pk") is None:
+                continue
+            self._add_user(r.get("username"), r.get("full_name"), now)
+            self._posts.append((
+                str(r["pk"]), r.get("username"), hashtag, r.get("like_count"), r.get("comment_count"),
+                r.get("location_name"), r.get("location_address"), r.get("location_city"),
+                r.get("location_short_name"), r.get("content_type"), r.get("text"),
+                r.get("text_translation"), self.run_id, now,
+            ))
+        self._maybe_flush()
+    
+    def add_comments(self, comments: list[dict], parent_pk: Optional[str] = None):
+        """
+        缓冲评论记录（树形顺序：父评论后跟随其子评论）
+        位置按父评论分别编号（父评论在帖子内编号，子评论在所属父评论内编号），并接着已保存的位置继续，
+        分页续抓或只补抓子评论时不会和已保存的评论冲突；已保存的评论保留原来的位置
+        
+        Args:
+            comments: 评论记录列表
+            parent_pk: 列表开头的子评论所属的父评论（只保存子评论时使用）
+        """
+        now = time.time()
+        for c in comments:
+            if c.get("pk") is None:
+                continue
+            is_child = bool((c.get("level") or "").strip())
+            if not is_child:
+                parent_pk = c["pk"]
+            media_id = str(c.get("media_id"))
+            thread = str(parent_pk) if is_child and parent_pk else None
+            self._add_user(c.get("username"), c.get("full_name"), now)
+            self._comments.append((
+                str(c["pk"]), media_id, thread,
+                c.get("level"), c.get("username"), c.get("text"), c.get("comment_like_count"),
+                c.get("child_comment_count"), self._next_position(media_id, thread), self.run_id, now,
+            ))
+        self._maybe_flush()
+    
+    def _next_position(self, media_id: str, parent_pk: Optional[str]) -> int:
+        """同一帖子（或同一父评论）下的下一个位置，第一次使用时从数据库已保存的最大位置继续"""
+        key = (media_id, parent_pk)
+        if key not in self._positions:
+            with self._lock:
+                row = self.conn.execute(
+                    "SELECT MAX(position) FROM comments WHERE media_id = ? AND parent_pk IS ?", key
+                ).fetchone()
+            self._positions[key] = row[0] + 1 if row[0] is not None else 0
+        position = self._positions[key]
+        self._positions[key] += 1
+        return position
+    
+    def add_posts_with_comments(self, posts_data: dict, hashtag: Optional[str] = None):
+        """缓冲 get_hashtag_posts_with_comments 的结果"""
+        for post_data in posts_data.values():
+            self.add_posts([post_data["post_info"]], hashtag)
+            self.add_comments(post_data["comments"])
+    
+    def _add_user(self, username: Optional[str], full_name: Optional[str], now: float):
+        if username:
+            self._users[username] = (username, full_name or None, now)
+    
+    def _maybe_flush(self):
+        if len(self._posts) + len(self._comments) + len(self._users) >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        """把缓冲的行批量写入数据库"""
+        with self._lock:
+            users, posts, comments = list(self._users.values()), self._posts, self._comments
+            self._users, self._posts, self._comments = {}, [], []
+            if not (users or posts or comments):
+                return
+            with self.conn:
+                self.conn.executemany(UPSERT_USER, users)
+                self.conn.executemany(UPSERT_POST, posts)
+                self.conn.executemany(UPSERT_COMMENT, comments)
+    
+    def load_hashtag_users(self, hashtag: Optional[str] = None, run_id: Optional[int] = None) -> list[dict]:
+        """
+        读取话题帖子记录，格式与 get_hashtag_users 一致，可直接传给 save_results
+        
+        Args:
+            hashtag: 按话题过滤
+            run_id: 按任务过滤
+        """
+        where, args = self._where(hashtag=hashtag, run_id=run_id)
+        rows = self.conn.execute(
+            f"SELECT p.*, u.full_name FROM posts p LEFT JOIN users u ON u.username = p.username {where} "
+            "ORDER BY p.updated_at",
+            args
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def load_comments(self, media_id: Optional[str] = None, username: Optional[str] = None,
+                      run_id: Optional[int] = None) -> list[dict]:
+        """
+        读取评论记录（树形顺序），格式与 get_post_comment_users 一致，
+        可直接传给 save_results(..., data_type="comment")
+        
+        Args:
+            media_id: 按帖子过滤
+            username: 按评论用户过滤（跨话题、跨任务）
+            run_id: 按任务过滤
+        """
+        where, args = self._where(media_id=media_id, username=username, run_id=run_id, table="c")
+        # 树形顺序：按父评论位置排序，子评论紧跟在父评论后面，再按子评论位置排序
+        rows = self.conn.execute(
+            f"SELECT c.*, u.full_name FROM comments c LEFT JOIN users u ON u.username = c.username "
+            f"LEFT JOIN comments p ON p.pk = c.parent_pk {where} "
+            "ORDER BY c.media_id, COALESCE(p.position, c.position), c.parent_pk IS NOT NULL, c.position",
+            args
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def load_posts_with_comments(self, hashtag: Optional[str] = None, run_id: Optional[int] = None) -> dict:
+        """
+        读取帖子及评论，格式与 get_hashtag_posts_with_comments 一致，
+        可直接传给 save_posts_with_comments
+        
+        Args:
+            hashtag: 按话题过滤
+            run_id: 按任务过滤
+        """
+        posts_data = {}
+        for post in self.load_hashtag_users(hashtag=hashtag, run_id=run_id):
+            posts_data[post["pk"]] = {
+                "post_info": post,
+                "comments": self.load_comments(media_id=post["pk"]),
+            }
+        return posts_data
+    
+    def _where(self, table: str = "p", **filters) -> tuple[str, list]:
+        clauses, args = [], []
+        for column, value in filters.items():
+            if value is not None:
+                clauses.append(f"{table}.{column} = ?")
+                args.append(str(value) if column in ("media_id", "pk") else value)
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", args
+    
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""爬取规划：子评论请求按第一页评论的 child_comment_count 估算（使用假的 HTTP 响应）"""
+import re
+
+import pytest
+
+from budget import child_thread_stats, estimate_comment_requests
+from config import CONFIG
+from ig_spider import IGSpider
+
+
+def page(child_counts):
+    return [{"pk": i, "child_comment_count": n} for i, n in enumerate(child_counts)]
+
+
+def test_child_thread_stats():
+    assert child_thread_stats(page([0, 4, 0, 2])) == (0.5, 1.5)
+
+
+def test_child_stats_replace_the_config_guess():
+    # 配置的假设值：20% 的父评论带 3 条子评论
+    assert estimate_comment_requests(100, 100) == 5 + 13
+    # 没有子评论：100 条父评论 = 7 页
+    assert estimate_comment_requests(100, 100, child_stats=(0.0, 0.0)) == 7
+    # 每条父评论都有 30 条子评论：4 条父评论 1 页，每个子评论串 2 页
+    assert estimate_comment_requests(100, 100, child_stats=(1.0, 30.0)) == 1 + 4 * 2
+    # 有该帖子自己的第一页时优先使用第一页
+    assert estimate_comment_requests(100, 100, page([0] * 15), child_stats=(1.0, 30.0)) == 7
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {"Content-Type": "application/json"}
+    text = ""
+    
+    def __init__(self, data):
+        self._data = data
+    
+    def json(self):
+        return self._data
+
+
+@pytest.fixture
+def spider(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    for key in ("proxies", "adaptive_rate", "storage_path", "dead_letter_path", "cooccur_path", "enrich_profiles"):
+        monkeypatch.setitem(CONFIG, key, None)
+    monkeypatch.setitem(CONFIG, "plan_comment_sample_posts", 2)
+    return IGSpider()
+
+
+def test_plan_uses_sampled_first_pages(spider):
+    # 4 个帖子，评论最多的 2 个会被请求第一页：帖子 1 的父评论都有 30 条子评论，帖子 2 没有子评论
+    medias = [{"media": {"pk": pk, "comment_count": count}} for pk, count in ((1, 500), (2, 400), (3, 100), (4, 0))]
+    pages = {"1": page([30] * 15), "2": page([0] * 15)}
+    requested = []
+    
+    def get(url, params=None, **kwargs):
+        requested.append(url)
+        if "top_serp" in url:
+            return FakeResponse({"media_grid": {"sections": [{"layout_content": {"medias": medias}}]}})
+        media_id = re.search(r"media/(\d+)/comments/", url).group(1)
+        return FakeResponse({"comments": pages[media_id]})
+    spider.session.get = get
+    
+    plan = spider.plan_hashtag_posts_with_comments("cats", max_posts=4, max_comments_per_post=100)
+    
+    assert len(requested) == 3 and plan["sampled_posts"] == 2
+    by_pk = {p["pk"]: p["requests"] for p in plan["posts"]}
+    assert by_pk[1] == estimate_comment_requests(500, 100, pages["1"])
+    assert by_pk[2] == estimate_comment_requests(400, 100, pages["2"]) == 7
+    # 未抽取的帖子使用两页合并的统计：一半父评论有子评论，平均 15 条
+    assert by_pk[3] == estimate_comment_requests(100, 100, child_stats=(0.5, 15.0))
+    assert by_pk[4] == 1
+    assert plan["requests"] == 1 + sum(by_pk.values())
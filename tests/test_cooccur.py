@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""共现索引：token 按文本顺序提取，超过 max_tokens 时保留文本中靠前的"""
+from cooccur import CooccurrenceIndex, extract_batch, extract_tokens
+
+
+def test_tokens_keep_text_order():
+    text = "#zebra @alice #apple #Zebra @bob"
+    assert extract_tokens(text) == ["#zebra", "@alice", "#apple", "@bob"]
+    assert extract_batch([text, "", "#b #a"]) == [["#zebra", "@alice", "#apple", "@bob"], [], ["#b", "#a"]]
+
+
+def test_truncation_keeps_the_first_tokens_in_text_order(tmp_path):
+    index = CooccurrenceIndex(str(tmp_path / "cooccur.db"), max_tokens=3)
+    index.add("p:1", "@zed #zoo #yak #aardvark #apple")
+    index.add("p:2", "#zoo #yak")
+    
+    # 按字母序截断会保留 #aardvark / #apple / #yak，并丢掉 @zed
+    assert {r["token"] for r in index.related("#zoo")} == {"@zed", "#yak"}
+    assert index.related("#aardvark") == []
+    assert index.related("@zed", kind="#")[0]["token"] in ("#zoo", "#yak")
+    index.close()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""常驻服务：通过本地 HTTP API 提交任务、查询状态和结果（使用假的 spider，不访问 Instagram）"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from daemon import JobScheduler, make_handler
+from ig_spider import IGSpider
+from writer import ExportWriter
+
+
+class FakeSpider:
+    """只实现调度器用到的接口，结果文件和 IGSpider 一样交给后台写入线程"""
+    
+    dead_letters = None
+    cooccur = None
+    flush_exports = IGSpider.flush_exports
+    
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.writer = ExportWriter()
+        self.write_gate = threading.Event()
+        self.write_gate.set()
+        self.fail_writes = set()
+        self.written = []
+    
+    def get_hashtag_users(self, hashtag, max_posts=None):
+        self.release.wait(5)
+        self.calls.append(("hashtag_users", hashtag))
+        return [{"username": f"{hashtag}_{i}", "pk": str(i)} for i in range(max_posts or 3)]
+    
+    def get_post_comment_users(self, media_id, max_comments=None):
+        self.calls.append(("post_comments", media_id))
+        raise RuntimeError("boom")
+    
+    def save_results(self, results, filename, data_type="hashtag"):
+        self.writer.submit("json", self._write, filename)
+        return {"json": f"{filename}.json"}
+    
+    def _write(self, filename):
+        self.write_gate.wait(5)
+        if filename in self.fail_writes:
+            raise PermissionError(f"{filename}.json")
+        self.written.append(filename)
+    
+    def get_metrics(self):
+        return {"requests": len(self.calls)}
+
+
+@pytest.fixture
+def service():
+    spider = FakeSpider()
+    scheduler = JobScheduler(spider)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(scheduler))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield spider, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    spider.writer.close()
+
+
+def call(url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method="POST" if data else "GET")
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def wait_for(base, job_id, statuses=("done", "failed")):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        status, job = call(f"{base}/jobs/{job_id}")
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"任务 {job_id} 未结束: {job}")
+
+
+def test_job_lifecycle(service):
+    spider, base = service
+    spider.release.clear()
+    
+    status, job = call(f"{base}/jobs", {"type": "hashtag_users", "params": {"hashtag": "cats", "max_posts": 2}})
+    assert status == 202
+    assert job["status"] in ("queued", "running")
+    
+    # 未完成的任务没有结果
+    status, body = call(f"{base}/jobs/{job['id']}/result")
+    assert status == 409
+    
+    spider.release.set()
+    job = wait_for(base, job["id"])
+    assert job["status"] == "done"
+    assert job["count"] == 2
+    assert job["files"] == {"json": "hashtag_cats_users.json"}
+    
+    status, result = call(f"{base}/jobs/{job['id']}/result")
+    assert status == 200
+    assert [r["username"] for r in result] == ["cats_0", "cats_1"]
+    
+    status, jobs = call(f"{base}/jobs")
+    assert [j["id"] for j in jobs] == [job["id"]]
+    assert call(f"{base}/metrics") == (200, {"requests": 1})
+
+
+def test_failed_job_reports_error(service):
+    spider, base = service
+    status, job = call(f"{base}/jobs", {"type": "post_comments", "params": {"media_id": "123"}})
+    assert status == 202
+    
+    job = wait_for(base, job["id"])
+    assert job["status"] == "failed"
+    assert job["error"] == "RuntimeError: boom"
+    assert call(f"{base}/jobs/{job['id']}/result")[0] == 409
+
+
+def test_invalid_jobs_rejected(service):
+    _, base = service
+    assert call(f"{base}/jobs", {"type": "nope"})[0] == 400
+    assert call(f"{base}/jobs", {"type": "hashtag_users", "params": {}})[0] == 400
+    # 没有配置死信存储时不能提交重试任务
+    assert call(f"{base}/jobs", {"type": "retry_failed"})[0] == 400
+    assert call(f"{base}/jobs/missing")[0] == 404
+
+
+def test_priority_order(service):
+    spider, base = service
+    spider.release.clear()
+    
+    # 第一个任务占住调度线程，之后提交的任务按优先级执行
+    first = call(f"{base}/jobs", {"type": "hashtag_users", "params": {"hashtag": "first", "max_posts": 1}})[1]
+    low = call(f"{base}/jobs", {"type": "hashtag_users", "params": {"hashtag": "low", "max_posts": 1}, "priority": -5})[1]
+    high = call(f"{base}/jobs", {"type": "hashtag_users", "params": {"hashtag": "high", "max_posts": 1}, "priority": 5})[1]
+    spider.release.set()
+    
+    for job in (first, low, high):
+        wait_for(base, job["id"])
+    assert [tag for _, tag in spider.calls] == ["first", "high", "low"]
+
+
+def test_job_finishes_after_its_files_are_written(service):
+    spider, base = service
+    spider.write_gate.clear()
+    
+    job = call(f"{base}/jobs", {"type": "hashtag_users", "params": {"hashtag": "cats", "max_posts": 1}})[1]
+    time.sleep(0.2)
+    # 抓取已结束，但后台还在写文件
+    assert call(f"{base}/jobs/{job['id']}")[1]["status"] == "running"
+    
+    spider.write_gate.set()
+    assert wait_for(base, job["id"])["status"] == "done"
+    assert spider.written == ["hashtag_cats_users"]
+
+
+def test_export_failure_fails_the_job(service):
+    spider, base = service
+    spider.fail_writes.add("hashtag_dogs_users")
+    
+    job = call(f"{base}/jobs", {"type": "hashtag_users", "params": {"hashtag": "dogs", "max_posts": 1}})[1]
+    job = wait_for(base, job["id"])
+    
+    assert job["status"] == "failed"
+    assert job["error"].startswith("ExportError: json: PermissionError")
+    
+    # 写入错误只归属于出错的任务
+    job = call(f"{base}/jobs", {"type": "hashtag_users", "params": {"hashtag": "cats", "max_posts": 1}})[1]
+    assert wait_for(base, job["id"])["status"] == "done"
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""失败请求重试：重试再次失败时累加同一条记录的次数，话题续抓沿用原搜索会话（使用假的 HTTP 响应）"""
+import pytest
+
+from config import CONFIG
+from dead_letter import DeadLetterStore, retry_dead_letters
+from ig_spider import CHILD_COMMENTS_API, IGSpider
+
+
+class FakeResponse:
+    def __init__(self, data, status=200):
+        self.status_code = status
+        self._data = data
+        self.headers = {"Content-Type": "application/json"}
+        self.text = ""
+    
+    def json(self):
+        return self._data
+
+
+def media(i):
+    return {"media": {"pk": i, "caption": {"user": {"username": f"user{i}"}, "text": "#cats"}}}
+
+
+@pytest.fixture
+def spider(tmp_path, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    # 不使用代理、限速器和任何本地数据库，死信存储放在临时目录
+    for key in ("proxies", "adaptive_rate", "storage_path", "dead_letter_path", "cooccur_path", "enrich_profiles"):
+        monkeypatch.setitem(CONFIG, key, None)
+    spider = IGSpider()
+    spider.dead_letters = DeadLetterStore(str(tmp_path / "dead_letters.db"), max_attempts=3)
+    spider.calls = []
+    yield spider
+    spider.dead_letters.close()
+
+
+def serve(spider, respond):
+    """把 session.get 换成 respond(url, params) -> FakeResponse，并记录请求"""
+    def get(url, params=None, **kwargs):
+        spider.calls.append((url, dict(params or {})))
+        return respond(url, dict(params or {}))
+    spider.session.get = get
+
+
+def letters(spider):
+    rows = spider.dead_letters.conn.execute("SELECT kind, status, attempts, endpoint FROM dead_letters").fetchall()
+    return [tuple(row) for row in rows]
+
+
+def test_failed_child_retry_counts_against_the_same_letter(spider):
+    serve(spider, lambda url, params: FakeResponse({}, 500))
+    endpoint = CHILD_COMMENTS_API.format(media_id="1", comment_pk="2")
+    
+    assert spider._get_child_comments_list("1", "2", 10) == []
+    assert letters(spider) == [("child", "pending", 1, endpoint)]
+    
+    result = retry_dead_letters(spider, save=False)
+    assert result["resolved"] == 0
+    assert letters(spider) == [("child", "pending", 2, endpoint)]
+    
+    retry_dead_letters(spider, save=False)
+    assert letters(spider) == [("child", "failed", 3, endpoint)]
+    assert spider.dead_letters.pending() == []
+    assert {url for url, _ in spider.calls} == {endpoint}
+
+
+def test_child_retry_resolves_once_the_page_loads(spider):
+    serve(spider, lambda url, params: FakeResponse({}, 500))
+    spider._get_child_comments_list("1", "2", 10)
+    
+    child = {"pk": 3, "text": "hi", "created_at": 1_700_000_000, "user": {"username": "kid"}}
+    serve(spider, lambda url, params: FakeResponse({"child_comments": [child], "next_min_id": None}))
+    result = retry_dead_letters(spider, save=False)
+    
+    assert result["resolved"] == 1 and result["comments"] == 1
+    assert letters(spider)[0][:2] == ("child", "done")
+
+
+def test_hashtag_retry_resumes_the_original_search_session(spider):
+    def first_page_only(url, params):
+        if params.get("next_max_id"):
+            return FakeResponse({}, 500)
+        return FakeResponse({"media_grid": {"sections": [{"layout_content": {"medias": [media(1)]}}],
+                                            "next_max_id": "page2"}})
+    serve(spider, first_page_only)
+    
+    assert len(list(spider.iter_hashtag_medias("cats"))) == 1
+    session = spider.calls[0][1]["rank_token"]
+    assert letters(spider)[0][:3] == ("hashtag", "pending", 1)
+    
+    serve(spider, lambda url, params: FakeResponse({"media_grid": {
+        "sections": [{"layout_content": {"medias": [media(2)]}}], "next_max_id": None}}))
+    result = retry_dead_letters(spider, save=False)
+    
+    url, params = spider.calls[-1]
+    assert params["next_max_id"] == "page2"
+    assert params["rank_token"] == session
+    assert result["resolved"] == 1 and result["users"] == 1
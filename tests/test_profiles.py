@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""用户资料补充：错误分类来自本次请求的结果，临时限速闸门在查询结束后恢复"""
+import threading
+
+from concurrency import RateGate
+from profiles import ProfileCache, ProfileEnricher
+
+USER = {
+    "edge_followed_by": {"count": 5},
+    "edge_follow": {"count": 2},
+    "edge_owner_to_timeline_media": {"count": 9},
+    "is_business_account": True,
+    "category_name": "Shop",
+    "is_private": False,
+    "is_verified": False,
+}
+
+
+class FakeSpider:
+    """_api_call 按用户名返回结果；_local.error 故意留着与本次请求无关的旧值"""
+    
+    def __init__(self):
+        self.controller = None
+        self.seen_controllers = []
+        self._local = threading.local()
+        self.calls = []
+    
+    def _api_call(self, url, params=None, context=None):
+        self.seen_controllers.append(self.controller)
+        self._local.error = "HTTP 500"
+        username = params["username"]
+        self.calls.append(username)
+        if username == "ghost":
+            return None, "HTTP 404"
+        if username == "flaky":
+            return None, "ReadTimeout"
+        return {"data": {"user": USER}}, None
+
+
+def make_enricher(tmp_path, workers=4):
+    spider = FakeSpider()
+    cache = ProfileCache(str(tmp_path / "profiles.db"), ttl=3600, max_entries=100)
+    return spider, ProfileEnricher(spider, cache, workers)
+
+
+def test_error_classification_comes_from_the_call(tmp_path):
+    spider, enricher = make_enricher(tmp_path)
+    profiles = enricher.lookup(["alice", "ghost", "flaky", "alice"])
+    
+    assert set(profiles) == {"alice"}
+    assert profiles["alice"]["account_type"] == "business"
+    assert enricher.stats()["fetched"] == 2
+    assert enricher.stats()["failed"] == 1
+    
+    # 不存在的用户缓存为 None，请求失败的用户不缓存
+    cached, _ = enricher.cache.get_many(["alice", "ghost", "flaky"])
+    assert set(cached) == {"alice", "ghost"}
+    assert cached["ghost"] is None
+    
+    enricher.lookup(["alice", "ghost", "flaky"])
+    assert sorted(spider.calls) == ["alice", "flaky", "flaky", "ghost"]
+
+
+def test_rate_gate_is_scoped_to_lookup(tmp_path):
+    spider, enricher = make_enricher(tmp_path)
+    enricher.lookup(["a", "b", "c"])
+    
+    assert all(isinstance(c, RateGate) for c in spider.seen_controllers)
+    assert spider.controller is None
+
+
+def test_existing_controller_is_kept(tmp_path):
+    spider, enricher = make_enricher(tmp_path)
+    controller = RateGate(rate=100, max_concurrency=2)
+    spider.controller = controller
+    enricher.lookup(["a", "b"])
+    
+    assert spider.seen_controllers == [controller, controller]
+    assert spider.controller is controller
+
+
+def test_enrich_appends_columns(tmp_path):
+    _, enricher = make_enricher(tmp_path, workers=1)
+    rows = enricher.enrich([{"username": "alice"}, {"username": "ghost"}, {"username": None}])
+    assert rows[0]["follower_count"] == 5
+    assert rows[1]["follower_count"] is None
+    assert "follower_count" in rows[2]
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""代理池：用本地 http.server 充当代理（直接应答转发过来的请求），不访问外网"""
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from proxy_pool import ProxyPool
+
+# 通过代理访问的目标地址，由本地假代理直接应答，不会真正解析
+TARGET = "http://instagram.test/api/v1/"
+
+
+class StandInProxy:
+    """本地假代理：对收到的所有请求返回 self.status，并记录请求路径"""
+    
+    def __init__(self, status=200):
+        self.status = status
+        self.paths = []
+        proxy = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def do_GET(self):
+                proxy.paths.append(self.path)
+                body = b'{"status": "ok"}'
+                self.send_response(proxy.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def proxies():
+    started = []
+    
+    def start(status=200):
+        proxy = StandInProxy(status)
+        started.append(proxy)
+        return proxy
+    
+    yield start
+    for proxy in started:
+        proxy.close()
+
+
+def dead_proxy_url():
+    """一个没有服务监听的本地端口"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.server_close()
+    return url
+
+
+def make_pool(urls, rest_seconds=60):
+    return ProxyPool(urls, requests.Session(), rest_seconds=rest_seconds)
+
+
+def send(pool, entry):
+    """模拟 ig_spider._send_request：通过代理请求并把结果报告给代理池"""
+    started = time.monotonic()
+    try:
+        resp = entry.session.get(TARGET, timeout=5)
+    except requests.RequestException:
+        pool.report(entry, None, error=True)
+        return None
+    pool.report(entry, time.monotonic() - started, resp.status_code)
+    return resp
+
+
+def test_requests_go_through_the_stand_in_proxy(proxies):
+    proxy = proxies()
+    pool = make_pool([proxy.url])
+    entry = pool.choose()
+    
+    resp = send(pool, entry)
+    
+    assert resp.json() == {"status": "ok"}
+    assert proxy.paths == [TARGET]
+    assert entry.requests == 1 and entry.latency is not None
+    assert entry.strikes == 0 and not entry.resting
+
+
+def test_choose_prefers_lower_score(proxies):
+    fast, slow = proxies(), proxies()
+    pool = make_pool([fast.url, slow.url])
+    pool.entries[0].latency = 0.1
+    pool.entries[1].latency = 0.1
+    pool.entries[1].throttle_rate = 0.5
+    
+    random.seed(0)
+    picks = [pool.choose().url for _ in range(600)]
+    
+    # 分数 0.1 对 0.6，权重比约 6:1
+    assert picks.count(fast.url) > 4 * picks.count(slow.url)
+
+
+def test_choose_skips_resting_and_falls_back_to_earliest(proxies):
+    a, b = proxies(), proxies()
+    pool = make_pool([a.url, b.url])
+    now = time.monotonic()
+    
+    pool.entries[0].rested_until = now + 100
+    assert {pool.choose().url for _ in range(20)} == {b.url}
+    
+    pool.entries[1].rested_until = now + 50
+    assert pool.available() == []
+    assert pool.choose().url == b.url
+
+
+def test_429_rests_the_proxy_and_strikes_double_the_rest(proxies):
+    proxy = proxies(status=429)
+    pool = make_pool([proxy.url], rest_seconds=60)
+    entry = pool.entries[0]
+    
+    send(pool, entry)
+    assert entry.resting and entry.throttled
+    assert entry.strikes == 1
+    assert entry.rested_until - time.monotonic() == pytest.approx(60, abs=2)
+    assert entry.throttle_rate > 0
+    
+    send(pool, entry)
+    assert entry.strikes == 2
+    assert entry.rested_until - time.monotonic() == pytest.approx(120, abs=2)
+    
+    # 恢复正常后 strikes 清零，下一次被限流重新从基础时长开始
+    proxy.status = 200
+    entry.rested_until = 0.0
+    send(pool, entry)
+    assert entry.strikes == 0 and not entry.resting
+
+
+def test_server_errors_and_connection_errors_count_as_failures(proxies):
+    broken = proxies(status=502)
+    pool = make_pool([broken.url, dead_proxy_url()])
+    
+    for entry in pool.entries:
+        send(pool, entry)
+        assert entry.resting and not entry.throttled
+        assert entry.strikes == 1
+        assert entry.error_rate > 0 and entry.throttle_rate == 0
+
+
+def test_health_check_recovers_error_rested_proxies(proxies):
+    proxy = proxies()
+    dead = dead_proxy_url()
+    pool = make_pool([proxy.url, dead])
+    for entry in pool.entries:
+        pool.report(entry, None, error=True)
+    assert pool.available() == []
+    
+    results = pool.health_check(TARGET, timeout=5)
+    
+    assert results == {proxy.url: True, dead: False}
+    healthy, broken = pool.entries
+    assert not healthy.resting and healthy.strikes == 0 and healthy.latency is not None
+    assert broken.resting and broken.strikes == 2
+    assert proxy.paths == [TARGET]
+
+
+def test_health_check_does_not_lift_a_429_rest(proxies):
+    proxy = proxies(status=429)
+    pool = make_pool([proxy.url])
+    entry = pool.entries[0]
+    send(pool, entry)
+    rested_until = entry.rested_until
+    
+    # 代理本身可用（首页正常），但 API 仍在限流：不探测，也不提前恢复
+    proxy.status = 200
+    results = pool.health_check(TARGET, timeout=5)
+    
+    assert results == {proxy.url: False}
+    assert entry.resting and entry.strikes == 1
+    assert entry.rested_until == rested_until
+    assert proxy.paths == [TARGET]
+    
+    # 暂停期结束后可以正常探测
+    entry.rested_until = 0.0
+    assert pool.health_check(TARGET, timeout=5) == {proxy.url: True}
+    assert entry.strikes == 0
+
+
+def test_next_available_in_reports_the_earliest_recovery(proxies):
+    a, b = proxies(), proxies()
+    pool = make_pool([a.url, b.url])
+    assert pool.next_available_in() == 0
+    
+    now = time.monotonic()
+    pool.entries[0].rested_until = now + 100
+    assert pool.next_available_in() == 0
+    
+    pool.entries[1].rested_until = now + 30
+    assert pool.next_available_in() == pytest.approx(30, abs=1)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""shortcode 与 media_id 互转：已知对照、11 位及更长的 shortcode、2^63 附近的边界"""
+import random
+
+import pytest
+
+from shortcode import (
+    decode_shortcodes,
+    media_id_to_shortcode,
+    parse_post_ref,
+    resolve_media_ids,
+    shortcode_to_media_id,
+)
+
+# (shortcode, media_id)，media_id 按 64 进制定义独立算出
+KNOWN = [
+    ("A", "0"),
+    ("B", "1"),
+    ("_", "63"),
+    ("BA", "64"),
+    ("__________", "1152921504606846975"),              # 10 位最大值 2^60 - 1
+    ("CrJ1kYbu0Hb", "3083231016513126875"),
+    ("C1a2B3c4D5e", "3268162102382050910"),
+    ("H__________", "9223372036854775807"),             # 2^63 - 1
+    ("IAAAAAAAAAA", "9223372036854775808"),             # 2^63
+    ("P__________", "18446744073709551615"),            # 2^64 - 1，uint64 最大值
+    ("QAAAAAAAAAA", "18446744073709551616"),            # 2^64，超出 uint64
+    ("___________", "73786976294838206463"),            # 11 位最大值 2^66 - 1
+]
+
+
+@pytest.mark.parametrize("shortcode, media_id", KNOWN)
+def test_known_pairs(shortcode, media_id):
+    assert shortcode_to_media_id(shortcode) == media_id
+    if shortcode != "A":
+        assert media_id_to_shortcode(media_id) == shortcode
+
+
+def test_vectorized_matches_known_pairs():
+    codes, media_ids = zip(*KNOWN)
+    assert decode_shortcodes(list(codes)) == list(media_ids)
+
+
+def test_long_shortcode_uses_first_11_chars():
+    # 私密帖子的长 shortcode 只有前 11 位是 media_id
+    assert shortcode_to_media_id("BAAAAAAAAAAxyz") == "1152921504606846976"
+    assert decode_shortcodes(["BAAAAAAAAAAxyz"]) == ["1152921504606846976"]
+    assert resolve_media_ids(["https://www.instagram.com/p/BAAAAAAAAAAxyz/"]) == ["1152921504606846976"]
+
+
+def test_round_trip_near_uint64_limits():
+    rng = random.Random(0)
+    values = [2 ** 63 + d for d in range(-3, 4)] + [2 ** 64 + d for d in range(-3, 4)]
+    values += [rng.randrange(1, 2 ** 66) for _ in range(2000)]
+    codes = [media_id_to_shortcode(v) for v in values]
+    assert decode_shortcodes(codes) == [str(v) for v in values]
+    assert [shortcode_to_media_id(c) for c in codes] == [str(v) for v in values]
+
+
+def test_invalid_shortcodes():
+    assert decode_shortcodes(["ab$", "", "A"]) == [None, None, "0"]
+    assert decode_shortcodes([]) == []
+    with pytest.raises(ValueError):
+        shortcode_to_media_id("ab$")
+
+
+def test_resolve_matches_parse_post_ref():
+    refs = [
+        "https://www.instagram.com/p/CrJ1kYbu0Hb/",
+        "https://instagram.com/p/CrJ1kYbu0Hb/?igsh=abc",
+        "instagram.com/someone/reel/C1a2B3c4D5e",
+        "https://www.instagram.com/reels/H__________/",
+        "https://www.instagram.com/tv/QAAAAAAAAAA",
+        "  CrJ1kYbu0Hb  ",
+        "3083231016513126875",
+        "3083231016513126875_123456",
+        "https://example.com/p/CrJ1kYbu0Hb/",
+        "not a post!",
+        "",
+        None,
+    ]
+    expected = [
+        "3083231016513126875",
+        "3083231016513126875",
+        "3268162102382050910",
+        "9223372036854775807",
+        "18446744073709551616",
+        "3083231016513126875",
+        "3083231016513126875",
+        "3083231016513126875",
+        None,
+        None,
+        None,
+        None,
+    ]
+    assert resolve_media_ids(refs) == expected
+    assert [parse_post_ref(r) for r in refs] == expected
+
+
+@pytest.mark.parametrize("ref", [
+    "python",               # 普通单词不是 shortcode
+    "CrJ1kYbu0",            # 9 位，太短
+    "BAAAAAAAAAAxyz",       # 长 shortcode 只能通过链接识别
+    "CrJ1kYbu0H$",
+])
+def test_bare_words_are_not_shortcodes(ref):
+    assert parse_post_ref(ref) is None
+    assert resolve_media_ids([ref]) == [None]
+
+
+def test_bare_shortcode_lengths():
+    assert parse_post_ref("__________") == "1152921504606846975"
+    assert parse_post_ref("CrJ1kYbu0Hb") == "3083231016513126875"
+    # 纯数字先按 media_id 识别
+    assert parse_post_ref("12345678901") == "12345678901"
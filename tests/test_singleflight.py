@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""请求合并：key 的规范化，等待的调用方共享结果、错误类型和异常"""
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, request_key
+
+
+def test_request_key_normalization():
+    base = request_key("https://www.instagram.com/api/v1/media/1/comments/", {"b": 2, "a": "x"})
+    assert base == request_key("https://WWW.instagram.com/api/v1/media/1/comments", {"a": "x", "b": "2"})
+    # 值为 None 的参数不会发送
+    assert base == request_key("https://www.instagram.com/api/v1/media/1/comments/", {"a": "x", "b": 2, "c": None})
+    # 空字符串会作为参数发送，不能与省略该参数的请求合并
+    assert base != request_key("https://www.instagram.com/api/v1/media/1/comments/", {"a": "x", "b": 2, "c": ""})
+
+
+def test_request_key_keeps_search_session_params():
+    url = "https://www.instagram.com/api/v1/fbsearch/web/top_serp/"
+    first = request_key(url, {"query": "#cats", "rank_token": "r1", "search_session_id": "s1"})
+    second = request_key(url, {"query": "#cats", "rank_token": "r2", "search_session_id": "s1"})
+    assert first != second
+    assert request_key(url, {"query": "#cats", "rank_token": "r1"}, ignore=("rank_token",)) == \
+        request_key(url, {"query": "#cats", "rank_token": "r2"}, ignore=("rank_token",))
+
+
+def run_concurrently(flight, key, func, callers=4):
+    """第一个调用进入 func 后再启动其余调用，保证它们被合并"""
+    started = threading.Event()
+    release = threading.Event()
+    results, errors = [], []
+    
+    def leader_func():
+        started.set()
+        release.wait(5)
+        return func()
+    
+    def call(f):
+        try:
+            results.append(flight.do(key, f))
+        except Exception as e:
+            errors.append(e)
+    
+    threads = [threading.Thread(target=call, args=(leader_func,))]
+    threads[0].start()
+    started.wait(5)
+    threads += [threading.Thread(target=call, args=(func,)) for _ in range(callers - 1)]
+    for t in threads[1:]:
+        t.start()
+    while flight.stats()["coalesced"] < callers - 1:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+    return results, errors
+
+
+def test_followers_share_result_and_error():
+    flight = SingleFlight()
+    calls = []
+    
+    def fetch():
+        calls.append(1)
+        return None, "HTTP 404"
+    
+    results, errors = run_concurrently(flight, "k", fetch)
+    assert len(calls) == 1
+    assert errors == []
+    assert results == [(None, "HTTP 404")] * 4
+    assert flight.stats() == {"executed": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_followers_receive_exception():
+    flight = SingleFlight()
+    
+    def fetch():
+        raise TimeoutError("slow")
+    
+    results, errors = run_concurrently(flight, "k", fetch, callers=3)
+    assert results == []
+    assert len(errors) == 3 and all(isinstance(e, TimeoutError) for e in errors)
+
+
+def test_sequential_calls_are_not_cached():
+    flight = SingleFlight()
+    values = iter([1, 2])
+    assert flight.do("k", lambda: next(values)) == 1
+    assert flight.do("k", lambda: next(values)) == 2
+    with pytest.raises(StopIteration):
+        flight.do("k", lambda: next(values))
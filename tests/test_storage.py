@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""SQLite 存储：分批保存（续抓的分页、只补抓的子评论）后读取仍是树形顺序"""
+import pytest
+
+from storage import SQLiteStorage
+
+CHILD = "  └─"
+
+
+def comment(pk, level=""):
+    return {"pk": pk, "media_id": "1", "level": level, "username": f"u{pk}", "text": str(pk)}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    s = SQLiteStorage(str(tmp_path / "ig_spider.db"))
+    yield s
+    s.close()
+
+
+def order(storage):
+    storage.flush()
+    return [(c["pk"], c["parent_pk"]) for c in storage.load_comments(media_id="1")]
+
+
+def test_child_only_batch_follows_its_parent(storage):
+    storage.add_comments([comment("a"), comment("a1", CHILD), comment("b"), comment("c")])
+    # 子评论重试 / worker 的 child 任务只保存子评论，由 parent_pk 指定父评论
+    storage.add_comments([comment("a2", CHILD), comment("a3", CHILD)], parent_pk="a")
+    storage.add_comments([comment("b1", CHILD)], parent_pk="b")
+    
+    assert order(storage) == [
+        ("a", None), ("a1", "a"), ("a2", "a"), ("a3", "a"),
+        ("b", None), ("b1", "b"),
+        ("c", None),
+    ]
+
+
+def test_next_page_continues_after_stored_comments(storage):
+    storage.add_comments([comment("a"), comment("a1", CHILD), comment("b")])
+    storage.flush()
+    
+    # 新的存储实例（如下一次运行）从数据库中已保存的最大位置继续
+    again = SQLiteStorage(storage.path)
+    again.add_comments([comment("c"), comment("c1", CHILD), comment("d")])
+    again.add_comments([comment("a2", CHILD)], parent_pk="a")
+    again.close()
+    
+    assert order(storage) == [
+        ("a", None), ("a1", "a"), ("a2", "a"),
+        ("b", None),
+        ("c", None), ("c1", "c"),
+        ("d", None),
+    ]
+
+
+def test_recrawl_keeps_existing_positions(storage):
+    storage.add_comments([comment("a"), comment("b")])
+    storage.add_comments([comment("b"), comment("a")])
+    
+    assert order(storage) == [("a", None), ("b", None)]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""评论时间窗口：缺少 created_at 的评论视为时间未知"""
+from ig_spider import IGSpider
+
+SINCE = 1_700_000_000
+UNTIL = 1_700_100_000
+
+
+def test_in_window():
+    assert IGSpider._in_window({"created_at": SINCE + 1}, SINCE, UNTIL)
+    assert not IGSpider._in_window({"created_at": SINCE - 1}, SINCE, UNTIL)
+    assert not IGSpider._in_window({"created_at": UNTIL + 1}, SINCE, UNTIL)
+    assert IGSpider._in_window({"created_at": 0}, None, None)
+
+
+def test_missing_created_at_is_kept():
+    assert IGSpider._in_window({}, SINCE, UNTIL)
+    assert IGSpider._in_window({"created_at": None}, SINCE, None)
+
+
+def test_page_cutoff_ignores_missing_timestamps():
+    old = {"created_at": SINCE - 10}
+    new = {"created_at": SINCE + 10}
+    assert IGSpider._page_before([old, old], SINCE)
+    assert IGSpider._page_before([old, {}], SINCE)
+    assert not IGSpider._page_before([old, new], SINCE)
+    # 整页都没有时间时不能判断，继续翻页
+    assert not IGSpider._page_before([{}, {"created_at": None}], SINCE)
+    assert not IGSpider._page_before([], SINCE)
+    assert not IGSpider._page_before([old], None)
+    
+    late = {"created_at": UNTIL + 10}
+    assert IGSpider._page_after([late, {}], UNTIL)
+    assert not IGSpider._page_after([{}], UNTIL)
+    assert not IGSpider._page_after([late, {"created_at": UNTIL - 10}], UNTIL)
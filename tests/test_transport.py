@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""传输层：声明的压缩格式都能解码、按接口统计字节数、连接复用（本地 http.server，不访问外网）"""
+import gzip
+import importlib.util
+import json
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+from urllib3.response import HTTPResponse
+
+import transport
+from transport import ACCEPT_ENCODING, SUPPORTED_ENCODINGS, can_decode, endpoint_of, mount_pool
+
+PAYLOAD = json.dumps({"items": [{"text": f"hello world {i}"} for i in range(300)]}).encode()
+
+
+def _brotli_compress(data):
+    try:
+        import brotli
+    except ImportError:
+        import brotlicffi as brotli
+    return brotli.compress(data)
+
+
+def _zstd_compress(data):
+    import zstandard
+    # 不在帧头写原始大小，与流式返回的响应相同
+    return zstandard.ZstdCompressor(write_content_size=False).compress(data)
+
+
+COMPRESSORS = {
+    "identity": lambda data: data,
+    "gzip": gzip.compress,
+    "deflate": zlib.compress,
+    "br": _brotli_compress,
+    "zstd": _zstd_compress,
+    # 只用于测试 PooledAdapter 自行解码的路径
+    "x-reverse": lambda data: data[::-1],
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    seen_accept = []
+    
+    def do_GET(self):
+        Handler.seen_accept.append(self.headers.get("Accept-Encoding"))
+        encoding = parse_qs(urlsplit(self.path).query).get("enc", ["identity"])[0]
+        body = COMPRESSORS[encoding](PAYLOAD)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if encoding != "identity":
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def session():
+    s = requests.Session()
+    s.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    stats = mount_pool(s, pool_size=2)
+    yield s, stats
+    s.close()
+
+
+def _installed(*modules):
+    return any(importlib.util.find_spec(m) is not None for m in modules)
+
+
+def test_advertised_encodings_match_installed_decoders():
+    expected = ["gzip", "deflate"]
+    if "br" in HTTPResponse.CONTENT_DECODERS or _installed("brotli", "brotlicffi"):
+        expected.append("br")
+    if "zstd" in HTTPResponse.CONTENT_DECODERS or _installed("zstandard"):
+        expected.append("zstd")
+    
+    assert SUPPORTED_ENCODINGS == expected
+    assert ACCEPT_ENCODING == ", ".join(expected)
+    for encoding in expected:
+        assert can_decode(encoding)
+        assert can_decode(encoding.upper())
+    assert can_decode(None) and can_decode("identity")
+    assert not can_decode("xz")
+    assert not can_decode("gzip, xz")
+
+
+@pytest.mark.parametrize("encoding", ["identity"] + SUPPORTED_ENCODINGS)
+def test_advertised_encoding_decodes(server, session, encoding):
+    http, stats = session
+    resp = http.get(f"{server}/api/v1/media/123/comments/", params={"enc": encoding}, timeout=5)
+    
+    assert resp.status_code == 200
+    assert resp.content == PAYLOAD
+    assert resp.json()["items"][0]["text"] == "hello world 0"
+    assert Handler.seen_accept[-1] == ACCEPT_ENCODING
+    
+    item = stats.endpoints()["/api/v1/media/{id}/comments/"]
+    assert item["encodings"] == {encoding: 1}
+    assert item["wire_bytes"] == len(COMPRESSORS[encoding](PAYLOAD))
+    assert item["body_bytes"] == len(PAYLOAD)
+
+
+def test_fallback_decoder(server, session, monkeypatch):
+    monkeypatch.setitem(transport.FALLBACK_DECODERS, "x-reverse", lambda data: data[::-1])
+    http, stats = session
+    resp = http.get(f"{server}/api/v1/tags/", params={"enc": "x-reverse"}, timeout=5)
+    
+    assert resp.content == PAYLOAD
+    assert stats.snapshot()["wire_bytes"] == len(PAYLOAD)
+    assert stats.endpoints()["/api/v1/tags/"]["encodings"] == {"x-reverse": 1}
+
+
+def test_connections_are_reused(server, session):
+    http, stats = session
+    for media_id in range(4):
+        assert http.get(f"{server}/api/v1/media/{media_id}/info/", params={"enc": "gzip"}, timeout=5).ok
+    
+    snapshot = stats.snapshot()
+    assert snapshot["requests"] == 4
+    assert snapshot["new_connections"] == 1
+    assert snapshot["reused"] == 3
+    assert snapshot["tls_handshakes"] == 0
+    
+    item = stats.endpoints()["/api/v1/media/{id}/info/"]
+    assert item["responses"] == 4
+    assert item["body_bytes"] == 4 * len(PAYLOAD)
+    assert item["wire_bytes"] == 4 * len(gzip.compress(PAYLOAD))
+
+
+def test_merge_endpoints_ratio():
+    a, b = transport.ConnectionStats(), transport.ConnectionStats()
+    a.record_transfer("/x", "gzip", 100, 400)
+    b.record_transfer("/x", "br", 50, 400)
+    b.record_transfer("/y", "identity", 10, 10)
+    merged = transport.merge_endpoints(a, b)
+    
+    assert list(merged) == ["/x", "/y"]
+    assert merged["/x"]["ratio"] == round(150 / 800, 3)
+    assert merged["/x"]["encodings"] == {"gzip": 1, "br": 1}
+
+
+def test_endpoint_of():
+    assert endpoint_of("https://i.instagram.com/api/v1/media/3123/comments/?min_id=1") == "/api/v1/media/{id}/comments/"
+    assert endpoint_of("https://www.instagram.com") == "/"
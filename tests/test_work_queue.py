@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""SQLite 任务队列：租约、续租、确认、租约超时后重新投递和 worker 主循环"""
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from work_queue import SQLiteWorkQueue, open_queue
+from worker import keep_lease, run_worker
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = SQLiteWorkQueue(str(tmp_path / "queue.db"), max_attempts=2)
+    yield q
+    q.close()
+
+
+def test_lease_and_ack(queue):
+    low = queue.put("hashtag", {"hashtag": "low"}, priority=0)
+    high = queue.put("hashtag", {"hashtag": "high"}, priority=5)
+    
+    task = queue.lease("w1", 60)
+    assert task["id"] == high
+    assert task["payload"] == {"hashtag": "high"}
+    assert task["attempts"] == 1
+    
+    # 租约期内其他 worker 领不到同一个任务
+    assert queue.lease("w2", 60)["id"] == low
+    assert queue.lease("w3", 60) is None
+    
+    queue.ack(high)
+    assert queue.stats() == {"done": 1, "leased": 1}
+
+
+def test_lease_expiry_redelivers(queue):
+    task_id = queue.put("media", {"media_id": "1"})
+    assert queue.lease("crashed", 0.05)["id"] == task_id
+    assert queue.lease("other", 60) is None
+    
+    time.sleep(0.1)
+    task = queue.lease("other", 60)
+    assert task["id"] == task_id
+    assert task["attempts"] == 2
+    
+    # 超过最大尝试次数后不再投递
+    queue.conn.execute("UPDATE tasks SET available_at = 0 WHERE id = ?", (task_id,))
+    assert queue.lease("third", 60) is None
+    assert queue.stats() == {"failed": 1}
+
+
+def test_nack_retries_after_delay(queue):
+    task_id = queue.put("media", {"media_id": "1"})
+    queue.lease("w1", 60)
+    queue.nack(task_id, "HTTP 500", retry_delay=60)
+    assert queue.lease("w1", 60) is None
+    
+    queue.conn.execute("UPDATE tasks SET available_at = 0 WHERE id = ?", (task_id,))
+    assert queue.lease("w1", 60)["attempts"] == 2
+
+
+def test_renew_extends_only_the_holders_lease(queue):
+    task_id = queue.put("media", {"media_id": "1"})
+    queue.lease("w1", 0.05)
+    
+    assert queue.renew(task_id, "w1", 60)
+    assert not queue.renew(task_id, "w2", 60)
+    time.sleep(0.1)
+    assert queue.lease("w2", 60) is None
+    
+    # 租约已过期的任务不能再续租
+    queue.conn.execute("UPDATE tasks SET available_at = 0 WHERE id = ?", (task_id,))
+    assert not queue.renew(task_id, "w1", 60)
+
+
+def test_keep_lease_outlives_a_short_lease(queue):
+    task_id = queue.put("media", {"media_id": "1"})
+    queue.lease("w1", 0.15)
+    
+    # 另一个 worker 使用自己的连接
+    other = SQLiteWorkQueue(queue.path)
+    with keep_lease(queue, task_id, "w1", 0.15):
+        time.sleep(0.5)
+        assert other.lease("w2", 60) is None
+    other.close()
+    queue.ack(task_id)
+    assert queue.stats() == {"done": 1}
+
+
+def test_open_queue(tmp_path):
+    assert isinstance(open_queue(f"sqlite:///{tmp_path / 'q.db'}"), SQLiteWorkQueue)
+    with pytest.raises(ValueError):
+        open_queue("redis://localhost/0")
+    with pytest.raises(ValueError):
+        SQLiteWorkQueue(str(tmp_path / "q2.db")).put("unknown", {})
+
+
+class FakeBudget:
+    exhausted = False
+
+
+class FakeSpider:
+    """和 IGSpider 一样：请求失败时不抛出异常，只返回已获取的部分并记录错误类型"""
+    
+    budget = FakeBudget()
+    storage = None
+    
+    def __init__(self, fail=(), partial=(), slow=0):
+        self.fail = set(fail)
+        self.partial = set(partial)
+        self.slow = slow
+        self.saved = []
+        self._errors = threading.local()
+    
+    @contextmanager
+    def collect_errors(self):
+        self._errors.list = []
+        yield self._errors.list
+    
+    def search_hashtag_medias(self, hashtag, max_posts):
+        if hashtag in self.fail:
+            self._errors.list.append("HTTP 500")
+            return []
+        return [{"pk": 100 + i} for i in range(max_posts)]
+    
+    def get_post_comment_users(self, media_id, max_comments):
+        time.sleep(self.slow)
+        if media_id in self.fail:
+            self._errors.list.append("ReadTimeout")
+            return []
+        if media_id in self.partial:
+            self._errors.list.append("BudgetExhausted")
+        return [{"pk": f"{media_id}-c", "media_id": media_id}]
+    
+    def save_results(self, results, filename, data_type="hashtag"):
+        self.saved.append(filename)
+    
+    def flush_exports(self):
+        # 只有 locked 帖子的结果文件写入失败
+        return ["json: PermissionError: locked"] if "post_locked_comment_users" in self.saved else []
+
+
+def test_worker_splits_and_acks(queue):
+    queue.put("hashtag", {"hashtag": "cats", "with_comments": True, "max_posts": 3})
+    spider = FakeSpider(fail={"101"})
+    
+    done = run_worker(spider, queue, "w1", exit_when_empty=True)
+    
+    # 话题任务拆成 3 个 media 任务，失败的任务延迟后重试，不阻塞其他任务
+    assert done == 3
+    assert sorted(spider.saved) == ["post_100_comment_users", "post_102_comment_users"]
+    assert queue.stats() == {"done": 3, "pending": 1}
+    row = queue.conn.execute("SELECT error FROM tasks WHERE status = 'pending'").fetchone()
+    assert "ReadTimeout" in row["error"]
+
+
+def test_worker_nacks_failed_and_partial_tasks(queue):
+    queue.put("hashtag", {"hashtag": "down", "with_comments": True})
+    queue.put("media", {"media_id": "7"})
+    spider = FakeSpider(fail={"down"}, partial={"7"})
+    
+    assert run_worker(spider, queue, "w1", exit_when_empty=True) == 0
+    
+    # 搜索失败时没有拆分出任何任务；只拿到部分评论的任务不确认，保存的部分结果由重试覆盖
+    assert queue.stats() == {"pending": 2}
+    errors = sorted(row["error"] for row in queue.conn.execute("SELECT error FROM tasks"))
+    assert "BudgetExhausted" in errors[0] and "HTTP 500" in errors[1]
+
+
+def test_worker_nacks_when_export_fails(queue):
+    queue.put("media", {"media_id": "locked"})
+    spider = FakeSpider()
+    
+    assert run_worker(spider, queue, "w1", exit_when_empty=True) == 0
+    assert queue.stats() == {"pending": 1}
+    assert "PermissionError" in queue.conn.execute("SELECT error FROM tasks").fetchone()["error"]
+
+
+def test_worker_renews_the_lease_during_long_tasks(queue):
+    task_id = queue.put("media", {"media_id": "1"})
+    spider = FakeSpider(slow=0.5)
+    thread = threading.Thread(target=run_worker, args=(spider, queue, "w1"),
+                              kwargs={"lease_seconds": 0.15, "exit_when_empty": True})
+    thread.start()
+    
+    time.sleep(0.3)
+    # 已超过最初的租约，但 worker 仍在续租，其他 worker 领不到
+    other = SQLiteWorkQueue(queue.path)
+    assert other.lease("w2", 60) is None
+    other.close()
+    thread.join(5)
+    assert queue.stats() == {"done": 1}
+    assert queue.conn.execute("SELECT attempts FROM tasks WHERE id = ?", (task_id,)).fetchone()[0] == 1
+
+
+def test_worker_nacks_when_the_real_spider_swallows_a_failure(queue, tmp_path, monkeypatch):
+    from config import CONFIG
+    from ig_spider import IGSpider
+    
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    for key in ("proxies", "adaptive_rate", "storage_path", "dead_letter_path", "cooccur_path", "enrich_profiles"):
+        monkeypatch.setitem(CONFIG, key, None)
+    monkeypatch.setitem(CONFIG, "output_dir", str(tmp_path))
+    spider = IGSpider()
+    
+    class ServerError:
+        status_code = 500
+        headers = {"Content-Type": "application/json"}
+        text = ""
+    
+    spider.session.get = lambda url, **kwargs: ServerError()
+    queue.put("media", {"media_id": "1"})
+    
+    # get_post_comment_users 只打印错误并返回 []，worker 仍能发现失败
+    assert spider.get_post_comment_users("1") == []
+    assert run_worker(spider, queue, "w1", exit_when_empty=True) == 0
+    assert queue.stats() == {"pending": 1}
+    assert "HTTP 500" in queue.conn.execute("SELECT error FROM tasks").fetchone()["error"]
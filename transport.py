@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP 传输层模块
+为 requests.Session 挂载大小合适的线程安全连接池（urllib3 连接池本身带锁），
+并统计新建连接 / TLS 握手次数，用于确认多线程和常驻服务模式下连接是否保持复用；
+Accept-Encoding 只声明实际能解码的压缩格式，按接口统计压缩前后的传输字节数
+
+brotli 需要安装 brotli 或 brotlicffi，zstd 需要 urllib3 支持的 zstd 模块或 zstandard，
+urllib3 不支持但本模块能解码的格式（如旧版 urllib3 + zstandard）由 PooledAdapter 自行解码
+"""
+import re
+import threading
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPSConnection
+from urllib3.response import HTTPResponse
+
+from config import CONFIG
+
+
+def _fallback_decoders() -> dict:
+    """urllib3 不能解码、但已安装解码库的压缩格式 {encoding: 解码函数}"""
+    native = set(HTTPResponse.CONTENT_DECODERS)
+    decoders = {}
+    
+    if "br" not in native:
+        try:
+            import brotli
+        except ImportError:
+            try:
+                import brotlicffi as brotli
+            except ImportError:
+                brotli = None
+        if brotli is not None:
+            decoders["br"] = brotli.decompress
+    
+    if "zstd" not in native:
+        try:
+            import zstandard
+        except ImportError:
+            zstandard = None
+        if zstandard is not None:
+            # 流式解压，兼容帧头中没有写入原始大小的响应
+            decoders["zstd"] = lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    
+    return decoders
+
+
+FALLBACK_DECODERS = _fallback_decoders()
+
+# 能解码的压缩格式（按偏好顺序），Accept-Encoding 只声明这些
+SUPPORTED_ENCODINGS = [
+    enc for enc in ("gzip", "deflate", "br", "zstd")
+    if enc in HTTPResponse.CONTENT_DECODERS or enc in FALLBACK_DECODERS
+]
+
+ACCEPT_ENCODING = ", ".join(SUPPORTED_ENCODINGS)
+
+
+def can_decode(content_encoding: Optional[str]) -> bool:
+    """响应的 Content-Encoding 是否都能解码"""
+    encodings = [e.strip().lower() for e in (content_encoding or "").split(",") if e.strip()]
+    return all(e == "identity" or e in SUPPORTED_ENCODINGS for e in encodings)
+
+
+def endpoint_of(url: str) -> str:
+    """按接口归类的 URL 路径（数字 ID 替换为 {id}），如 /api/v1/media/{id}/comments/"""
+    return re.sub(r"/\d+(?=/|$)", "/{id}", urlsplit(url).path) or "/"
+
+
+class ConnectionStats:
+    """连接复用和传输字节数统计（线程安全）"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+        self.wire_bytes = 0
+        self.body_bytes = 0
+        self._endpoints = {}
+    
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+    
+    def record_connect(self, tls: bool):
+        with self._lock:
+            self.connections += 1
+            if tls:
+                self.tls_handshakes += 1
+    
+    def record_transfer(self, endpoint: str, encoding: str, wire_bytes: int, body_bytes: int):
+        """
+        记录一次响应的传输字节数（不含响应头）
+        
+        Args:
+            endpoint: 接口（endpoint_of 的结果）
+            encoding: Content-Encoding，未压缩为 identity
+            wire_bytes: 实际传输的（压缩后）字节数
+            body_bytes: 解压后的字节数
+        """
+        with self._lock:
+            self.wire_bytes += wire_bytes
+            self.body_bytes += body_bytes
+            item = self._endpoints.get(endpoint)
+            if item is None:
+                item = self._endpoints[endpoint] = {"responses": 0, "wire_bytes": 0, "body_bytes": 0, "encodings": {}}
+            item["responses"] += 1
+            item["wire_bytes"] += wire_bytes
+            item["body_bytes"] += body_bytes
+            item["encodings"][encoding] = item["encodings"].get(encoding, 0) + 1
+    
+    def snapshot(self) -> dict:
+        """
+        当前统计
+        
+        Returns:
+            {"requests", "new_connections", "tls_handshakes", "reused", "reuse_rate", "wire_bytes", "body_bytes"}
+        """
+        with self._lock:
+            reused = max(self.requests - self.connections, 0)
+            return {
+                "requests": self.requests,
+                "new_connections": self.connections,
+                "tls_handshakes": self.tls_handshakes,
+                "reused": reused,
+                "reuse_rate": round(reused / self.requests, 3) if self.requests else 0.0,
+                "wire_bytes": self.wire_bytes,
+                "body_bytes": self.body_bytes,
+            }
+    
+    def endpoints(self) -> dict:
+        """
+        按接口的传输统计
+        
+        Returns:
+            {endpoint: {"responses", "wire_bytes", "body_bytes", "encodings": {encoding: 次数}}}
+        """
+        with self._lock:
+            return {k: {**v, "encodings": dict(v["encodings"])} for k, v in self._endpoints.items()}
+
+
+def _counting_pool_class(pool_cls, stats: ConnectionStats):
+    """生成一个连接池子类，其连接在真正建立 TCP 连接（和 TLS 握手）时计数"""
+    base = pool_cls.ConnectionCls
+    
+    class CountingConnection(base):
+        def connect(self):
+            stats.record_connect(isinstance(self, HTTPSConnection))
+            return super().connect()
+    
+    return type(pool_cls.__name__, (pool_cls,), {"ConnectionCls": CountingConnection})
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    带连接统计的 HTTPAdapter
+    pool_block=True：并发线程数超过连接池大小时等待空闲连接，而不是临时新建、用完即丢的连接
+    """
+    
+    def __init__(self, pool_size: int, stats: Optional[ConnectionStats] = None):
+        """
+        Args:
+            pool_size: 每个主机的连接池大小
+            stats: 连接统计，缺省新建
+        """
+        self.stats = stats or ConnectionStats()
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+    
+    def _wrap(self, manager):
+        manager.pool_classes_by_scheme = {
+            scheme: _counting_pool_class(cls, self.stats)
+            for scheme, cls in manager.pool_classes_by_scheme.items()
+        }
+        return manager
+    
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self._wrap(self.poolmanager)
+    
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        # SOCKS 代理使用自己的连接池类，不计数
+        known = proxy in self.proxy_manager
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        if not known and not proxy.lower().startswith("socks"):
+            self._wrap(manager)
+        return manager
+    
+    def send(self, request, stream=False, **kwargs):
+        self.stats.record_request()
+        resp = super().send(request, stream=stream, **kwargs)
+        if stream:
+            return resp
+        
+        # 非流式请求在这里读完响应体（Session 随后也会读取），顺便统计压缩前后的字节数
+        encoding = (resp.headers.get("Content-Encoding") or "identity").strip().lower()
+        decoder = FALLBACK_DECODERS.get(encoding)
+        if decoder:
+            raw = resp.raw.read(decode_content=False)
+            resp._content = decoder(raw) if raw else b""
+            resp._content_consumed = True
+        else:
+            resp.content
+        self.stats.record_transfer(endpoint_of(request.url), encoding, resp.raw.tell(), len(resp.content))
+        return resp
+
+
+def merge_endpoints(*stats: ConnectionStats) -> dict:
+    """
+    合并多个连接池（主 session 和各代理）的按接口传输统计，附带压缩率
+    
+    Returns:
+        {endpoint: {"responses", "wire_bytes", "body_bytes", "ratio", "encodings"}}，按传输字节数从多到少
+    """
+    merged = {}
+    for item in stats:
+        for endpoint, v in item.endpoints().items():
+            m = merged.setdefault(endpoint, {"responses": 0, "wire_bytes": 0, "body_bytes": 0, "encodings": {}})
+            m["responses"] += v["responses"]
+            m["wire_bytes"] += v["wire_bytes"]
+            m["body_bytes"] += v["body_bytes"]
+            for encoding, count in v["encodings"].items():
+                m["encodings"][encoding] = m["encodings"].get(encoding, 0) + count
+    for m in merged.values():
+        m["ratio"] = round(m["wire_bytes"] / m["body_bytes"], 3) if m["body_bytes"] else None
+    return dict(sorted(merged.items(), key=lambda kv: kv[1]["wire_bytes"], reverse=True))
+
+
+def default_pool_size() -> int:
+    """连接池大小：CONFIG["http_pool_size"]，缺省取批量线程数和自适应最大并发数中较大者"""
+    return CONFIG.get("http_pool_size") or max(
+        CONFIG.get("bulk_workers", 4), CONFIG.get("aimd_max_concurrency", 8), 1
+    )
+
+
+def mount_pool(session: requests.Session, pool_size: Optional[int] = None,
+               stats: Optional[ConnectionStats] = None) -> ConnectionStats:
+    """
+    给 session 挂载带统计的连接池
+    
+    Args:
+        session: requests.Session
+        pool_size: 连接池大小，缺省使用 default_pool_size()
+        stats: 连接统计，多个 session 可共用
+    
+    Returns:
+        连接统计
+    """
+    adapter = PooledAdapter(pool_size or default_pool_size(), stats)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return adapter.stats
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+任务队列模块
+支持多台机器共享同一个任务列表：租约（lease）、续租（renew）、确认（ack）、可见性超时和失败重试
+第一个实现基于 SQLite，可通过 WorkQueue 接口替换为其他后端
+"""
+import json
+import os
+import sqlite3
+import time
+import uuid
+from typing import Optional
+
+# 支持的任务类型
+TASK_TYPES = ("hashtag", "media", "child")
+
+
+class WorkQueue:
+    """任务队列接口"""
+    
+    def put(self, task_type: str, payload: dict, priority: int = 0) -> str:
+        """
+        加入任务
+        
+        Args:
+            task_type: 任务类型（hashtag / media / child）
+            payload: 任务参数
+            priority: 优先级，越大越先被领取
+        
+        Returns:
+            任务 ID
+        """
+        raise NotImplementedError
+    
+    def lease(self, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        """
+        领取一个任务，租约期内其他 worker 不可见
+        
+        Args:
+            worker_id: worker 标识
+            lease_seconds: 可见性超时（秒），超时未确认的任务会重新变为可领取
+        
+        Returns:
+            任务 {"id", "type", "payload", "priority", "attempts"}，没有可领取的任务时返回 None
+        """
+        raise NotImplementedError
+    
+    def renew(self, task_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """
+        续租：把仍由该 worker 持有的任务的租约延长到 lease_seconds 秒后
+        
+        Returns:
+            是否续租成功（False 表示租约已过期，任务可能已被其他 worker 领取）
+        """
+        raise NotImplementedError
+    
+    def ack(self, task_id: str):
+        """确认任务完成"""
+        raise NotImplementedError
+    
+    def nack(self, task_id: str, error: str = "", retry_delay: float = 0):
+        """任务失败，未超过最大重试次数则延迟后重新入队"""
+        raise NotImplementedError
+    
+    def stats(self) -> dict:
+        """各状态的任务数量"""
+        raise NotImplementedError
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """基于 SQLite 的任务队列（可放在共享磁盘上供多台机器使用）"""
+    
+    def __init__(self, path: str, max_attempts: int = 3):
+        """
+        Args:
+            path: SQLite 数据库文件路径
+            max_attempts: 单个任务最多尝试次数，超过后标记为 failed
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                worker TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tasks_ready ON tasks (status, available_at, priority)"
+        )
+    
+    def put(self, task_type: str, payload: dict, priority: int = 0) -> str:
+        if task_type not in TASK_TYPES:
+            raise ValueError(f"不支持的任务类型: {task_type}")
+        
+        task_id = uuid.uuid4().hex
+        now = time.time()
+        self.conn.execute(
+            "INSERT INTO tasks (id, type, payload, priority, available_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (task_id, task_type, json.dumps(payload, ensure_ascii=False), priority, now, now, now)
+        )
+        return task_id
+    
+    def lease(self, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        now = time.time()
+        
+        # BEGIN IMMEDIATE 保证多个 worker 不会领到同一个任务
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 租约过期仍未确认的任务视为 worker 已崩溃
+            self.conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = COALESCE(error, 'lease expired'), updated_at = ? "
+                "WHERE status = 'leased' AND available_at <= ?",
+                (self.max_attempts, now, now)
+            )
+            row = self.conn.execute(
+                "SELECT * FROM tasks WHERE status = 'pending' AND available_at <= ? "
+                "ORDER BY priority DESC, created_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            
+            self.conn.execute(
+                "UPDATE tasks SET status = 'leased', attempts = attempts + 1, worker = ?, "
+                "available_at = ?, updated_at = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row["id"])
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        
+        return {
+            "id": row["id"],
+            "type": row["type"],
+            "payload": json.loads(row["payload"]),
+            "priority": row["priority"],
+            "attempts": row["attempts"] + 1,
+        }
+    
+    def renew(self, task_id: str, worker_id: str, lease_seconds: float) -> bool:
+        now = time.time()
+        cur = self.conn.execute(
+            "UPDATE tasks SET available_at = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'leased' AND worker = ? AND available_at > ?",
+            (now + lease_seconds, now, task_id, worker_id, now)
+        )
+        return cur.rowcount > 0
+    
+    def ack(self, task_id: str):
+        self.conn.execute(
+            "UPDATE tasks SET status = 'done', error = NULL, updated_at = ? WHERE id = ?",
+            (time.time(), task_id)
+        )
+    
+    def nack(self, task_id: str, error: str = "", retry_delay: float = 0):
+        now = time.time()
+        self.conn.execute(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = ?, available_at = ?, updated_at = ? WHERE id = ?",
+            (self.max_attempts, error, now + retry_delay, now, task_id)
+        )
+    
+    def stats(self) -> dict:
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+    
+    def close(self):
+        self.conn.close()
+
+
+def open_queue(location: str, max_attempts: int = 3) -> WorkQueue:
+    """
+    根据地址打开任务队列
+    
+    Args:
+        location: 队列地址，如 "sqlite:///shared/queue.db" 或直接写文件路径
+        max_attempts: 单个任务最多尝试次数
+    
+    Returns:
+        任务队列实例
+    """
+    if location.startswith("sqlite:///"):
+        return SQLiteWorkQueue(location[len("sqlite:///"):], max_attempts)
+    if "://" in location:
+        raise ValueError(f"不支持的队列后端: {location}")
+    return SQLiteWorkQueue(location, max_attempts)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+分布式 worker
+从共享任务队列领取任务，用本机的 IGSpider（自己的 session）执行，结果写入共享输出目录
+"""
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+from config import CONFIG
+from work_queue import WorkQueue
+from writer import ExportError
+
+
+def run_task(spider, queue: WorkQueue, task: dict):
+    """
+    执行单个任务
+    
+    Args:
+        spider: IGSpider 实例
+        queue: 任务队列（hashtag 任务会把帖子拆分为 media 任务放回队列）
+        task: lease() 返回的任务
+    """
+    payload = task["payload"]
+    
+    if task["type"] == "hashtag":
+        hashtag = payload["hashtag"]
+        max_posts = payload.get("max_posts", CONFIG.get("max_posts_per_hashtag", 50))
+        
+        if payload.get("with_comments"):
+            # 帖子列表只请求一次，评论拆成 media 任务由各个节点并行获取
+            medias = spider.search_hashtag_medias(hashtag, max_posts)
+            for media in medias:
+                queue.put("media", {
+                    "media_id": str(media["pk"]),
+                    "max_comments": payload.get("max_comments", CONFIG.get("max_comments_per_post", 100)),
+                    "hashtag": hashtag,
+                }, priority=task.get("priority", 0))
+            print(f"  ✓ 话题 #{hashtag} 拆分出 {len(medias)} 个帖子任务")
+        else:
+            users = spider.get_hashtag_users(hashtag, max_posts)
+            if users:
+                spider.save_results(users, f"hashtag_{hashtag}_users")
+    
+    elif task["type"] == "media":
+        media_id = payload["media_id"]
+        max_comments = payload.get("max_comments", CONFIG.get("max_comments_per_post", 100))
+        comments = spider.get_post_comment_users(media_id, max_comments)
+        if comments:
+            spider.save_results(comments, f"post_{media_id}_comment_users", data_type="comment")
+    
+    elif task["type"] == "child":
+        media_id = payload["media_id"]
+        comment_pk = payload["comment_pk"]
+        max_count = payload.get("max_count", CONFIG.get("max_comments_per_post", 100))
+        children = spider._get_child_comments_list(media_id, comment_pk, max_count)
+        if children:
+            spider.save_results(children, f"post_{media_id}_comment_{comment_pk}_children", data_type="comment")
+            if spider.storage:
+                spider.storage.start_run("child_comments", media_id=media_id, comment_pk=comment_pk)
+                spider.storage.add_comments(children, parent_pk=comment_pk)
+                spider.storage.finish_run()
+    
+    else:
+        raise ValueError(f"不支持的任务类型: {task['type']}")
+
+
+class TaskIncomplete(Exception):
+    """任务执行中有请求失败，结果不完整（抓取方法本身只返回已获取的部分，不抛出异常）"""
+
+
+@contextmanager
+def keep_lease(queue: WorkQueue, task_id: str, worker_id: str, lease_seconds: float):
+    """
+    任务执行期间在后台每 1/3 租约时长续租一次，避免长任务超过租约被其他 worker 重复领取
+    
+    Args:
+        queue: 任务队列
+        task_id: 任务 ID
+        worker_id: 持有租约的 worker
+        lease_seconds: 每次续租的时长（秒）
+    """
+    stop = threading.Event()
+    
+    def renew():
+        while not stop.wait(lease_seconds / 3):
+            if not queue.renew(task_id, worker_id, lease_seconds):
+                print(f"⚠ 任务 {task_id[:8]} 续租失败，租约已过期，可能被其他 worker 重复领取")
+                return
+    
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_worker(spider, queue: WorkQueue, worker_id: Optional[str] = None,
+               lease_seconds: float = 600, poll_interval: float = 5, exit_when_empty: bool = False):
+    """
+    worker 主循环：领取任务 -> 执行（期间自动续租）-> 确认/失败重试
+    执行中有任何请求失败（HTTP 错误、超时、预算用尽等）或结果文件写入失败时，任务按失败处理
+    
+    Args:
+        spider: IGSpider 实例
+        queue: 任务队列
+        worker_id: worker 标识，默认 主机名-进程号
+        lease_seconds: 任务租约时长（秒），执行期间自动续租
+        poll_interval: 队列为空时的轮询间隔（秒）
+        exit_when_empty: 队列为空时是否退出
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    print(f"\n🛠 Worker {worker_id} 已启动")
+    
+    done = 0
+    while True:
+        if spider.budget.exhausted:
+            print(f"⚠ 请求预算已用尽，worker 退出（{spider.budget.summary()}）")
+            break
+        
+        task = queue.lease(worker_id, lease_seconds)
+        if task is None:
+            if exit_when_empty:
+                print("✓ 队列已空，worker 退出")
+                break
+            time.sleep(poll_interval)
+            continue
+        
+        print(f"\n📥 任务 {task['id'][:8]} ({task['type']}) 第 {task['attempts']} 次尝试: {task['payload']}")
+        try:
+            with spider.collect_errors() as errors, keep_lease(queue, task["id"], worker_id, lease_seconds):
+                run_task(spider, queue, task)
+                # 后台导出写完后才确认任务
+                export_errors = spider.flush_exports()
+            if errors:
+                raise TaskIncomplete(f"{len(errors)} 个请求失败: {', '.join(sorted(set(errors)))}")
+            if export_errors:
+                raise ExportError("; ".join(export_errors))
+            queue.ack(task["id"])
+            done += 1
+        except Exception as e:
+            traceback.print_exc()
+            # 按尝试次数指数退避
+            queue.nack(task["id"], f"{type(e).__name__}: {e}", retry_delay=30 * 2 ** (task["attempts"] - 1))
+            print(f"✗ 任务失败，稍后重试: {e}")
+    
+    print(f"   共完成 {done} 个任务，队列状态: {queue.stats()}")
+    return done
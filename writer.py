@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+后台导出模块
+Excel / JSON / 原始 JSON 的写入交给后台线程，每种格式一个线程和一个队列，
+爬虫主线程提交后立即继续，flush() / close() 保证退出前全部写完，flush() 返回期间的写入错误
+"""
+import atexit
+import queue
+import threading
+import traceback
+from typing import Callable
+
+# 队列结束标记
+_STOP = object()
+
+
+class ExportError(Exception):
+    """后台写入失败（任务的结果文件不完整）"""
+
+
+class ExportWriter:
+    """按格式分线程的后台写入器"""
+    
+    def __init__(self):
+        self._queues = {}
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.errors = []
+        atexit.register(self.close)
+    
+    def submit(self, fmt: str, func: Callable, *args, **kwargs):
+        """
+        提交一个写入任务
+        
+        Args:
+            fmt: 格式名（excel / json / raw_json 等），同一格式按提交顺序串行写入，不同格式并行
+            func: 写入函数
+            *args, **kwargs: 写入函数参数
+        """
+        if self._closed:
+            func(*args, **kwargs)
+            return
+        self._get_queue(fmt).put((func, args, kwargs))
+    
+    def _get_queue(self, fmt: str) -> queue.Queue:
+        with self._lock:
+            if fmt not in self._queues:
+                q = queue.Queue()
+                thread = threading.Thread(target=self._run, args=(fmt, q), name=f"export-{fmt}", daemon=True)
+                self._queues[fmt] = q
+                self._threads[fmt] = thread
+                thread.start()
+            return self._queues[fmt]
+    
+    def _run(self, fmt: str, q: queue.Queue):
+        while True:
+            job = q.get()
+            try:
+                if job is _STOP:
+                    return
+                func, args, kwargs = job
+                func(*args, **kwargs)
+            except Exception as e:
+                with self._lock:
+                    self.errors.append((fmt, e))
+                print(f"✗ 后台写入 {fmt} 失败: {e}")
+                traceback.print_exc()
+            finally:
+                q.task_done()
+    
+    def flush(self) -> list[tuple[str, Exception]]:
+        """
+        等待所有已提交的写入任务完成
+        
+        Returns:
+            上次 flush 以来写入失败的 [(格式, 异常), ...]，全部成功时为空
+        """
+        with self._lock:
+            queues = list(self._queues.values())
+        for q in queues:
+            q.join()
+        with self._lock:
+            errors, self.errors = self.errors, []
+        return errors
+    
+    def close(self):
+        """写完剩余任务并停止后台线程（程序退出时自动调用）"""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        with self._lock:
+            for q in self._queues.values():
+                q.put(_STOP)
+            threads = list(self._threads.values())
+        for thread in threads:
+            thread.join()